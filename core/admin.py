@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import ICSProfile, DataSource, CalculationLog, APICache
+from .models import ICSProfile, DataSource, CalculationLog, APICache, Municipality, Occupation, WeightSet
 
 
 @admin.register(ICSProfile)
@@ -11,7 +11,9 @@ class ICSProfileAdmin(admin.ModelAdmin):
     ]
     list_filter = ['created_at', 'inheritance_status']
     search_fields = ['birth_place', 'father_job', 'mother_job']
-    readonly_fields = ['created_at', 'updated_at', 'ics_score', 'ics_explanation', 'ics_confidence']
+    readonly_fields = [
+        'created_at', 'updated_at', 'ics_score', 'ics_explanation', 'ics_confidence', 'weights_version'
+    ]
     ordering = ['-created_at']
     
     fieldsets = (
@@ -39,7 +41,7 @@ class ICSProfileAdmin(admin.ModelAdmin):
             )
         }),
         ('Resultado ICS', {
-            'fields': ('ics_score', 'ics_confidence', 'ics_explanation')
+            'fields': ('ics_score', 'ics_confidence', 'ics_explanation', 'weights_version')
         }),
         ('Dados Brutos', {
             'fields': ('raw_data',),
@@ -88,6 +90,23 @@ class DataSourceAdmin(admin.ModelAdmin):
     readonly_fields = ['last_checked']
 
 
+@admin.register(Municipality)
+class MunicipalityAdmin(admin.ModelAdmin):
+    list_display = ['name', 'state', 'ibge_code', 'pib_per_capita']
+    list_filter = ['state']
+    search_fields = ['name', 'normalized_name', 'ibge_code']
+    ordering = ['name']
+    readonly_fields = ['normalized_name']
+
+
+@admin.register(Occupation)
+class OccupationAdmin(admin.ModelAdmin):
+    list_display = ['title', 'cbo_code', 'average_salary']
+    search_fields = ['title', 'normalized_title', 'cbo_code']
+    ordering = ['title']
+    readonly_fields = ['normalized_title']
+
+
 @admin.register(CalculationLog)
 class CalculationLogAdmin(admin.ModelAdmin):
     list_display = [
@@ -124,10 +143,17 @@ class CalculationLogAdmin(admin.ModelAdmin):
     result_display.short_description = 'Resultado'
 
 
+@admin.register(WeightSet)
+class WeightSetAdmin(admin.ModelAdmin):
+    list_display = ['version', 'weights', 'created_at']
+    readonly_fields = ['version', 'checksum', 'weights', 'created_at']
+    ordering = ['-version']
+
+
 @admin.register(APICache)
 class APICacheAdmin(admin.ModelAdmin):
-    list_display = ['cache_key', 'created_at', 'expires_at', 'is_expired']
-    list_filter = ['created_at', 'expires_at']
+    list_display = ['cache_key', 'created_at', 'stale_at', 'expires_at', 'is_negative', 'is_expired']
+    list_filter = ['created_at', 'expires_at', 'is_negative']
     search_fields = ['cache_key']
     readonly_fields = ['created_at']
     ordering = ['-created_at']
@@ -137,6 +163,8 @@ class APICacheAdmin(admin.ModelAdmin):
         expired = obj.expires_at < timezone.now()
         if expired:
             return format_html('<span style="color: red;">Expirado</span>')
+        elif obj.stale_at and obj.stale_at < timezone.now():
+            return format_html('<span style="color: orange;">Obsoleto</span>')
         else:
             return format_html('<span style="color: green;">Válido</span>')
     is_expired.short_description = 'Status'
@@ -0,0 +1,51 @@
+"""
+Validadores para GET condicional (ETag / Last-Modified)
+
+Usados com django.views.decorators.http.condition: quando o cliente envia o
+ETag ou a data que já tem, a view nem é executada e a resposta é 304. Os
+validadores leem só uma coluna (updated_at do perfil) ou as estatísticas do
+dashboard (uma consulta ao índice de scores, com a versão), e ficam guardados
+no request para que ETag e Last-Modified saiam da mesma consulta. Toda
+escrita nas estatísticas do dashboard (inclusive só no sketch de quantis)
+passa por core.rollups, que avança a versão do snapshot.
+"""
+import hashlib
+
+from . import snapshot
+from .models import ICSProfile
+
+
+def _profile_updated_at(request, profile_id):
+    if not hasattr(request, 'profile_updated_at'):
+        request.profile_updated_at = (
+            ICSProfile.objects.filter(id=profile_id).values_list('updated_at', flat=True).first()
+        )
+    return request.profile_updated_at
+
+
+def profile_etag(request, profile_id):
+    updated_at = _profile_updated_at(request, profile_id)
+    if updated_at is None:
+        return None
+    return f'"profile-{profile_id}-{updated_at.timestamp():.6f}"'
+
+
+def profile_last_modified(request, profile_id):
+    return _profile_updated_at(request, profile_id)
+
+
+def _dashboard_snapshot(request):
+    """Snapshot do dashboard, reaproveitado pela view se ela for executada"""
+    if not hasattr(request, 'dashboard_snapshot'):
+        request.dashboard_snapshot = snapshot.get_snapshot()
+    return request.dashboard_snapshot
+
+
+def dashboard_etag(request):
+    # A resposta também depende dos quantis pedidos na query string
+    query = hashlib.md5(request.GET.urlencode().encode(), usedforsecurity=False).hexdigest()[:8]
+    return f'"dashboard-{_dashboard_snapshot(request).version}-{query}"'
+
+
+def dashboard_last_modified(request):
+    return _dashboard_snapshot(request).updated_at
@@ -0,0 +1,72 @@
+"""
+Codificação de linhas .values_list() sem passar pelo ModelSerializer
+
+Para leituras em volume, as linhas são buscadas como tuplas e convertidas por
+um codificador montado uma única vez a partir dos campos do modelo. O resultado
+é idêntico ao de ICSProfileSerializer (mesmas chaves, na mesma ordem, e datas
+no fuso atual em ISO 8601 com 'Z' para UTC), sem a introspecção de campos a
+cada objeto.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+def _datetime_converter():
+    """Mesma representação de DateTimeField do DRF"""
+    current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if current_timezone is not None and value.tzinfo is not None:
+            value = value.astimezone(current_timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _converter_for(field):
+    if isinstance(field, models.DateTimeField):
+        return _datetime_converter()
+    if isinstance(field, models.DateField):
+        return datetime.date.isoformat
+    if isinstance(field, models.TimeField):
+        return datetime.time.isoformat
+    return None
+
+
+class RowEncoder:
+    """
+    Converte tuplas de values_list(*columns) em dicionários com os campos
+    pedidos; colunas extras (ex.: as do cursor) vêm depois e não são emitidas
+    """
+
+    def __init__(self, model, fields, extra=()):
+        self.fields = list(fields)
+        self.columns = self.fields + [name for name in extra if name not in self.fields]
+        self._width = len(self.fields)
+        self._converters = [
+            (index, converter)
+            for index, converter in (
+                (index, _converter_for(model._meta.get_field(name)))
+                for index, name in enumerate(self.fields)
+            )
+            if converter is not None
+        ]
+
+    def index(self, name):
+        """Posição de uma coluna nas tuplas"""
+        return self.columns.index(name)
+
+    def encode(self, row):
+        values = list(row[:self._width])
+        for index, convert in self._converters:
+            if values[index] is not None:
+                values[index] = convert(values[index])
+        return dict(zip(self.fields, values))
+
+    def encode_many(self, rows):
+        return [self.encode(row) for row in rows]
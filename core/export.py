@@ -0,0 +1,106 @@
+"""
+Exportação de perfis em streaming (NDJSON ou CSV)
+
+As linhas são lidas com QuerySet.iterator(chunk_size=...) e escritas uma a uma,
+de modo que a memória usada não depende do número de perfis exportados.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ICSProfile
+from .serializers import ICSProfileSerializer
+from .snapshot import HIGH_THRESHOLD, MEDIUM_THRESHOLD
+
+
+# As mesmas colunas da API (ICSProfileSerializer), na mesma ordem
+EXPORT_FIELDS = list(ICSProfileSerializer.Meta.fields)
+
+BANDS = {
+    'baixo': {'ics_score__lt': MEDIUM_THRESHOLD},
+    'medio': {'ics_score__gte': MEDIUM_THRESHOLD, 'ics_score__lt': HIGH_THRESHOLD},
+    'alto': {'ics_score__gte': HIGH_THRESHOLD},
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _parse_moment(value, end_of_day=False):
+    """Aceita data (AAAA-MM-DD) ou data e hora ISO 8601"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Data inválida: {value}')
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_profiles(params):
+    """
+    Perfis calculados filtrados por created_from, created_to, band
+    (baixo/medio/alto), min_score e max_score. Gera ValueError se algum
+    filtro for inválido.
+    """
+    profiles = ICSProfile.objects.filter(ics_score__isnull=False)
+
+    if params.get('created_from'):
+        profiles = profiles.filter(created_at__gte=_parse_moment(params['created_from']))
+    if params.get('created_to'):
+        profiles = profiles.filter(created_at__lte=_parse_moment(params['created_to'], end_of_day=True))
+    if params.get('band'):
+        if params['band'] not in BANDS:
+            raise ValueError(f'Faixa inválida: {params["band"]} (use {", ".join(BANDS)})')
+        profiles = profiles.filter(**BANDS[params['band']])
+    if params.get('min_score'):
+        profiles = profiles.filter(ics_score__gte=float(params['min_score']))
+    if params.get('max_score'):
+        profiles = profiles.filter(ics_score__lte=float(params['max_score']))
+
+    return profiles.order_by('created_at', 'id')
+
+
+def _iter_rows(profiles, chunk_size=None):
+    chunk_size = chunk_size or settings.ICS_CONFIG['EXPORT_CHUNK_SIZE']
+    for values in profiles.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row = dict(zip(EXPORT_FIELDS, values))
+        row['created_at'] = timezone.localtime(row['created_at']).isoformat()
+        row['updated_at'] = timezone.localtime(row['updated_at']).isoformat()
+        yield row
+
+
+def iter_ndjson(profiles, chunk_size=None):
+    """Uma linha JSON por perfil"""
+    for row in _iter_rows(profiles, chunk_size):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Pseudo-arquivo que devolve o que é escrito (csv.writer sem buffer)"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(profiles, chunk_size=None):
+    """Cabeçalho seguido de uma linha CSV por perfil (raw_data como JSON)"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _iter_rows(profiles, chunk_size):
+        row['raw_data'] = json.dumps(row['raw_data'], ensure_ascii=False)
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def iter_export(profiles, export_format, chunk_size=None):
+    if export_format == 'csv':
+        return iter_csv(profiles, chunk_size)
+    return iter_ndjson(profiles, chunk_size)
@@ -0,0 +1,78 @@
+"""
+Cliente HTTP compartilhado para as fontes de dados externas (IBGE, RAIS)
+
+Cada processo (worker) mantém uma única requests.Session com pool de conexões
+keep-alive, retentativas limitadas com backoff exponencial e jitter, e timeout
+por host, configurados em ICS_CONFIG['HTTP'].
+"""
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def _build_session(config):
+    retry = Retry(
+        total=config['MAX_RETRIES'],
+        backoff_factor=config['BACKOFF_FACTOR'],
+        backoff_jitter=config['BACKOFF_JITTER'],
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config['POOL_CONNECTIONS'],
+        pool_maxsize=config['POOL_MAXSIZE'],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def get_session():
+    """
+    Sessão HTTP do processo atual (recriada após fork, pois conexões
+    abertas não podem ser compartilhadas entre workers)
+    """
+    global _session, _session_pid
+
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session(settings.ICS_CONFIG['HTTP'])
+                _session_pid = os.getpid()
+    return _session
+
+
+def reset_session():
+    """Descarta a sessão atual (ex.: após mudar ICS_CONFIG['HTTP'])"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def timeout_for(url):
+    """Timeout (conexão, leitura) configurado para o host da URL"""
+    config = settings.ICS_CONFIG['HTTP']
+    return config['TIMEOUTS'].get(urlsplit(url).hostname, config['DEFAULT_TIMEOUT'])
+
+
+def get(url, **kwargs):
+    """GET usando a sessão compartilhada e o timeout do host"""
+    kwargs.setdefault('timeout', timeout_for(url))
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,214 @@
+"""
+Gravação em segundo plano (write-behind) dos logs de cálculo
+
+Com ICS_CONFIG['CALCULATION_LOG']['WRITE_BEHIND'] ativo, os CalculationLog
+criados no caminho da requisição entram em uma fila limitada do processo e uma
+thread os grava com bulk_create, quando o lote enche ou o intervalo vence. Os
+scores desses cálculos entram no sketch de quantis junto com o lote, que
+avança de novo a versão do snapshot (o ETag do dashboard muda quando os
+quantis mudam).
+
+Nenhum registro é descartado: com a fila cheia, quem enfileira espera até
+PUT_TIMEOUT segundos e, se ainda não houver espaço, grava o registro ele mesmo
+(contrapressão). Ao encerrar o worker, a fila é esvaziada antes da saída; só
+um worker morto à força perde o que estava na fila (logs e scores do sketch,
+que rebuild_statistics recupera a partir dos perfis).
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import rollups
+from .models import CalculationLog
+
+
+class _Flush:
+    """Marcador na fila: avisa quando tudo o que veio antes foi gravado"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class CalculationLogWriter:
+    """
+    Fila limitada de CalculationLog gravada por uma thread em lotes
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, put_timeout=0.5):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        # A thread não sobrevive a um fork: cada worker cria a sua
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_size)
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(
+                        target=self._run, name='ics-calculation-log', daemon=True
+                    )
+                    self._thread.start()
+
+    def submit(self, entry):
+        """Enfileira um CalculationLog ainda não salvo"""
+        self._ensure_started()
+        try:
+            self._queue.put(entry, timeout=self.put_timeout)
+        except queue.Full:
+            # Contrapressão: a fila não esvaziou a tempo, grava no próprio pedido
+            _persist([entry])
+            with self._lock:
+                self.sync_writes += 1
+                self.written += 1
+
+    def flush(self, timeout=None):
+        """
+        Espera a gravação de tudo o que foi enfileirado até agora; retorna
+        False se o prazo acabar antes
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def shutdown(self, timeout=None):
+        """Grava o que resta na fila e encerra a thread"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        with self._lock:
+            self._thread = None
+
+    def stats(self):
+        """Contadores da fila deste worker"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'max_size': self.max_size,
+                'written': self.written,
+                'batches': self.batches,
+                'sync_writes': self.sync_writes,
+                'errors': self.errors,
+            }
+
+    def _run(self):
+        batch = []
+        markers = []
+        deadline = None
+        stopping = False
+
+        try:
+            while True:
+                if len(batch) < self.batch_size:
+                    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        item = None
+
+                    if item is _STOP:
+                        stopping = True
+                    elif isinstance(item, _Flush):
+                        markers.append(item)
+                    elif item is not None:
+                        batch.append(item)
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                else:
+                    # Lote cheio que não foi gravado: espera sem puxar mais da fila
+                    time.sleep(self.flush_interval)
+
+                due = deadline is not None and time.monotonic() >= deadline
+                if batch and (len(batch) >= self.batch_size or due or markers or stopping):
+                    if self._write(batch):
+                        batch = []
+                    elif stopping:
+                        print(f'{len(batch)} logs de cálculo não gravados ao encerrar')
+                        batch = []
+                    deadline = time.monotonic() + self.flush_interval if batch else None
+
+                if not batch:
+                    for marker in markers:
+                        marker.done.set()
+                    markers = []
+                if stopping:
+                    return
+        finally:
+            connections.close_all()
+
+    def _write(self, batch):
+        try:
+            _persist(batch)
+        except Exception as e:
+            # O lote fica na memória e é tentado de novo no próximo intervalo
+            print(f'Erro ao gravar logs de cálculo ({len(batch)} registros): {e}')
+            with self._lock:
+                self.errors += 1
+            return False
+        with self._lock:
+            self.written += len(batch)
+            self.batches += 1
+        return True
+
+
+def _persist(batch):
+    with transaction.atomic():
+        CalculationLog.objects.bulk_create(batch)
+        rollups.record_sketch_scores([entry.result for entry in batch])
+
+
+def _build_writer():
+    config = settings.ICS_CONFIG['CALCULATION_LOG']
+    return CalculationLogWriter(
+        max_size=config['QUEUE_SIZE'],
+        batch_size=config['BATCH_SIZE'],
+        flush_interval=config['FLUSH_INTERVAL'],
+        put_timeout=config['PUT_TIMEOUT'],
+    )
+
+
+calculation_log_writer = _build_writer()
+
+# Esvazia a fila quando o worker encerra (gunicorn sai com sys.exit)
+atexit.register(
+    calculation_log_writer.shutdown,
+    timeout=settings.ICS_CONFIG['CALCULATION_LOG']['SHUTDOWN_TIMEOUT']
+)
+
+
+def write_behind():
+    return settings.ICS_CONFIG['CALCULATION_LOG']['WRITE_BEHIND']
+
+
+def record(entry):
+    """
+    Registra um CalculationLog: na fila de segundo plano se o write-behind
+    estiver ativo, senão com um INSERT imediato
+    """
+    if write_behind():
+        # A thread usa outra conexão: só enfileira depois que o perfil está
+        # visível (imediato em autocommit)
+        transaction.on_commit(lambda: calculation_log_writer.submit(entry))
+    else:
+        entry.save()
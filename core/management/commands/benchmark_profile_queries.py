@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from core import export, snapshot
+from core.models import ICSProfile
+from core.pagination import KeysetPagination, encode_cursor
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Mostra o plano e o tempo das consultas analíticas sobre ICSProfile sem e com os '
+        'índices de ICSProfile.Meta. Os perfis de teste são criados em uma transação '
+        'desfeita ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Perfis gerados')
+        parser.add_argument('--unscored', type=float, default=0.05, help='Fração de perfis sem score')
+        parser.add_argument('--repeat', type=int, default=3, help='Execuções por consulta (vale a melhor)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._create_profiles(options['rows'], options['unscored'])
+                queries = self._queries()
+
+                self._execute_indexes(create=False)
+                before = {name: self._measure(query, options['repeat']) for name, query in queries.items()}
+                self._execute_indexes(create=True)
+                after = {name: self._measure(query, options['repeat']) for name, query in queries.items()}
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f'{options["rows"]} perfis ({connection.vendor})')
+        for name in queries:
+            (time_before, plan_before), (time_after, plan_after) = before[name], after[name]
+            self.stdout.write(f'\n{name}')
+            self.stdout.write(f'  sem índices: {time_before * 1000:.1f} ms')
+            self.stdout.write(self._indent(plan_before))
+            self.stdout.write(self.style.SUCCESS(
+                f'  com índices: {time_after * 1000:.1f} ms ({time_before / time_after:.1f}x)'
+            ))
+            self.stdout.write(self._indent(plan_after))
+
+    def _create_profiles(self, rows, unscored):
+        """Perfis distribuídos ao longo de um ano, parte deles sem score"""
+        rng = random.Random(42)
+        start = timezone.now() - timedelta(days=365)
+        step = timedelta(days=365) / max(rows, 1)
+
+        # created_at informado em vez do auto_now_add, só durante a carga
+        created_at = ICSProfile._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            batch = []
+            for i in range(rows):
+                score = None if rng.random() < unscored else rng.random()
+                batch.append(ICSProfile(
+                    created_at=start + step * i,
+                    tax_paid=rng.uniform(0, 100000),
+                    ics_score=score,
+                    ics_explanation='Posição socioeconômica média' if score is not None else None,
+                    ics_confidence=rng.random() if score is not None else None,
+                    raw_data={},
+                ))
+                if len(batch) == 10000:
+                    ICSProfile.objects.bulk_create(batch)
+                    batch = []
+            ICSProfile.objects.bulk_create(batch)
+        finally:
+            created_at.auto_now_add = True
+
+    def _queries(self):
+        """As consultas feitas pelas views, pela exportação e pelas estatísticas"""
+        scored = ICSProfile.objects.filter(ics_score__isnull=False)
+        middle = scored.order_by('-created_at', '-id').values_list('created_at', 'id')[scored.count() // 2]
+        deep_page_request = RequestFactory().get('/api/profiles/', {'cursor': encode_cursor(*middle)})
+        last_month = (timezone.now() - timedelta(days=30)).date().isoformat()
+
+        return {
+            'dashboard: 5 cálculos recentes': lambda: list(
+                scored.order_by('-created_at').values_list('ics_score', 'ics_explanation', 'ics_confidence', 'id')[:5]
+            ),
+            'perfis: primeira página': lambda: KeysetPagination(
+                RequestFactory().get('/api/profiles/')
+            ).paginate(scored.values_list('id', 'ics_score', 'created_at'), position=lambda row: (row[2], row[0])),
+            'perfis: página do meio (cursor)': lambda: KeysetPagination(deep_page_request).paginate(
+                scored.values_list('id', 'ics_score', 'created_at'), position=lambda row: (row[2], row[0])
+            ),
+            'exportação: faixa alta do último mês': lambda: list(
+                export.filter_profiles({'band': 'alto', 'created_from': last_month}).values_list('id', 'ics_score')
+            ),
+            'contagem da faixa alta': lambda: scored.filter(ics_score__gte=snapshot.HIGH_THRESHOLD).count(),
+            'agregados do snapshot': lambda: snapshot.aggregate_profiles(ICSProfile.objects.all()),
+            'leitura dos scores (rebuild)': lambda: list(scored.order_by().values_list('ics_score', flat=True)),
+        }
+
+    def _execute_indexes(self, create):
+        """Cria ou remove os índices declarados em ICSProfile.Meta"""
+        editor = connection.schema_editor(collect_sql=True)
+        with connection.cursor() as cursor:
+            for index in ICSProfile._meta.indexes:
+                if create:
+                    cursor.execute(str(index.create_sql(ICSProfile, editor)))
+                else:
+                    cursor.execute(editor.sql_delete_index % {
+                        'name': editor.quote_name(index.name),
+                        'table': editor.quote_name(ICSProfile._meta.db_table),
+                    })
+            if connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute('ANALYZE')
+
+    def _measure(self, query, repeat):
+        """Melhor tempo de execução e plano da última consulta executada"""
+        executed = []
+
+        def record(execute, sql, params, many, context):
+            executed.append((sql, params))
+            return execute(sql, params, many, context)
+
+        best = float('inf')
+        with connection.execute_wrapper(record):
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                best = min(best, time.perf_counter() - started)
+        return best, self._explain(*executed[-1])
+
+    def _explain(self, sql, params):
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return '\n'.join(row[-1] for row in rows)
+        return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+    def _indent(self, plan):
+        return '\n'.join(f'      {line}' for line in plan.splitlines())
@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.encoders import RowEncoder
+from core.models import ICSProfile
+from core.renderers import FastJSONRenderer, orjson
+from core.serializers import ICSProfileSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a leitura de perfis pelo ICSProfileSerializer + JSONRenderer com o caminho '
+        'rápido (values_list + RowEncoder + FastJSONRenderer). Os perfis de teste são criados '
+        'em uma transação desfeita ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Perfis lidos em cada rodada')
+        parser.add_argument('--repeat', type=int, default=3, help='Rodadas (vale a melhor)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._create_profiles(options['rows'])
+                results = self._run(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        serializer_time, fast_time, identical = results
+        self.stdout.write(f'{options["rows"]} perfis (orjson: {"sim" if orjson else "não"})')
+        self.stdout.write(f'  ModelSerializer + JSONRenderer: {serializer_time:.3f}s')
+        self.stdout.write(f'  values_list + RowEncoder + FastJSONRenderer: {fast_time:.3f}s')
+        self.stdout.write(self.style.SUCCESS(
+            f'  {serializer_time / fast_time:.1f}x mais rápido, saída idêntica: {"sim" if identical else "NÃO"}'
+        ))
+
+    def _create_profiles(self, rows):
+        rng = random.Random(42)
+        profiles = (
+            ICSProfile(
+                birth_place=rng.choice(['São Paulo', 'Recife', 'Belém', 'Curitiba']),
+                father_job=rng.choice(['médico', 'vendedor', 'professor', '']),
+                father_salary=rng.uniform(1500, 20000),
+                family_property_value=rng.uniform(0, 2000000),
+                tax_paid=rng.uniform(0, 100000),
+                inheritance_status=rng.choice(['recebeu', 'sem', 'aguardando']),
+                ics_score=rng.uniform(0.05, 0.95),
+                ics_explanation='Posição socioeconômica média',
+                ics_confidence=rng.uniform(0.2, 1.0),
+                raw_data={'birth_place': 'São Paulo', 'tax_paid': rng.uniform(0, 100000)},
+            )
+            for _ in range(rows)
+        )
+        ICSProfile.objects.bulk_create(profiles, batch_size=5000)
+
+    def _run(self, repeat):
+        fields = ICSProfileSerializer.Meta.fields
+        queryset = ICSProfile.objects.order_by('-created_at', '-id')
+        serializer_time = fast_time = float('inf')
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            slow = JSONRenderer().render(ICSProfileSerializer(queryset, many=True).data)
+            serializer_time = min(serializer_time, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            encoder = RowEncoder(ICSProfile, fields)
+            fast = FastJSONRenderer().render(encoder.encode_many(queryset.values_list(*encoder.columns)))
+            fast_time = min(fast_time, time.perf_counter() - started)
+
+        return serializer_time, fast_time, slow == fast
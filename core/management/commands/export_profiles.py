@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+
+
+class Command(BaseCommand):
+    help = 'Exporta perfis calculados em NDJSON ou CSV, em streaming (memória constante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--output', '-o', help='Arquivo de saída (padrão: saída padrão)')
+        parser.add_argument('--created-from', help='Data/hora inicial (AAAA-MM-DD ou ISO 8601)')
+        parser.add_argument('--created-to', help='Data/hora final (AAAA-MM-DD ou ISO 8601)')
+        parser.add_argument('--band', choices=list(export.BANDS), help='Faixa do ICS')
+        parser.add_argument('--min-score', help='Score mínimo')
+        parser.add_argument('--max-score', help='Score máximo')
+        parser.add_argument('--chunk-size', type=int, help='Perfis lidos do banco por vez')
+
+    def handle(self, *args, **options):
+        try:
+            profiles = export.filter_profiles(options)
+        except ValueError as e:
+            raise CommandError(f'Filtro inválido: {e}')
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else None
+        try:
+            count = 0
+            for line in export.iter_export(profiles, options['format'], options['chunk_size']):
+                if output:
+                    output.write(line)
+                else:
+                    self.stdout.write(line, ending='')
+                count += 1
+        finally:
+            if output:
+                output.close()
+
+        if output:
+            if options['format'] == 'csv':
+                count -= 1  # cabeçalho
+            self.stderr.write(self.style.SUCCESS(f'{count} perfis exportados para {options["output"]}'))
@@ -0,0 +1,72 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Municipality
+from core.utils import normalize_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa o catálogo de municípios do IBGE (JSON de /localidades/municipios) '
+        'e, opcionalmente, o PIB per capita a partir de um CSV (ibge_code,pib_per_capita)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('municipalities_file', help='JSON com a lista de municípios do IBGE')
+        parser.add_argument('--pib', dest='pib_file', help='CSV com colunas ibge_code,pib_per_capita')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['municipalities_file'], encoding='utf-8') as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler o arquivo de municípios: {e}')
+
+        pib_by_code = self._load_pib(options['pib_file']) if options['pib_file'] else {}
+
+        municipalities = [
+            Municipality(
+                ibge_code=entry['id'],
+                name=entry['nome'],
+                normalized_name=normalize_text(entry['nome']),
+                state=self._state_of(entry),
+                pib_per_capita=pib_by_code.get(int(entry['id']), entry.get('pib_per_capita'))
+            )
+            for entry in entries
+        ]
+
+        with transaction.atomic():
+            Municipality.objects.bulk_create(
+                municipalities,
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['ibge_code'],
+                update_fields=['name', 'normalized_name', 'state', 'pib_per_capita']
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(municipalities)} municípios importados '
+            f'({len(pib_by_code)} com PIB per capita)'
+        ))
+
+    def _state_of(self, entry):
+        """Sigla da UF (a hierarquia de microrregião pode estar ausente em municípios novos)"""
+        microrregiao = entry.get('microrregiao')
+        if microrregiao:
+            return microrregiao['mesorregiao']['UF']['sigla']
+        return entry['regiao-imediata']['regiao-intermediaria']['UF']['sigla']
+
+    def _load_pib(self, path):
+        try:
+            with open(path, encoding='utf-8', newline='') as handle:
+                return {
+                    int(row['ibge_code']): float(row['pib_per_capita'])
+                    for row in csv.DictReader(handle)
+                    if row.get('pib_per_capita')
+                }
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler o arquivo de PIB: {e}')
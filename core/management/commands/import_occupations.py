@@ -0,0 +1,47 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import matching
+from core.models import Occupation
+from core.utils import normalize_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa a tabela de ocupações (CSV com colunas cbo_code,title,average_salary). '
+        'Sinônimos de uma mesma ocupação podem repetir o código CBO em várias linhas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('occupations_file', help='CSV com as ocupações')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['occupations_file'], encoding='utf-8', newline='') as handle:
+                occupations = {}
+                for row in csv.DictReader(handle):
+                    normalized_title = normalize_text(row['title'])
+                    if normalized_title and row.get('average_salary'):
+                        occupations.setdefault(normalized_title, Occupation(
+                            cbo_code=row.get('cbo_code') or None,
+                            title=row['title'].strip(),
+                            normalized_title=normalized_title,
+                            average_salary=float(row['average_salary'])
+                        ))
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler o arquivo de ocupações: {e}')
+
+        with transaction.atomic():
+            Occupation.objects.bulk_create(
+                list(occupations.values()),
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['normalized_title'],
+                update_fields=['cbo_code', 'title', 'average_salary']
+            )
+        matching.reset_matcher()
+
+        self.stdout.write(self.style.SUCCESS(f'{len(occupations)} ocupações importadas'))
@@ -0,0 +1,149 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import serializers
+
+from core.models import ImportCheckpoint
+from core.serializers import ICSFormDataSerializer
+from core.services import ICSCalculationService
+
+
+class RecordReader:
+    """
+    Lê registros de um arquivo CSV ou NDJSON em streaming, a partir de um
+    deslocamento em bytes, devolvendo (registro, deslocamento após o registro)
+    """
+
+    def __init__(self, path, file_format, offset=0):
+        self.path = path
+        self.file_format = file_format
+        self.offset = offset
+
+    def __iter__(self):
+        with open(self.path, 'rb') as handle:
+            if self.file_format == 'csv':
+                yield from self._read_csv(handle)
+            else:
+                yield from self._read_ndjson(handle)
+
+    def _lines(self, handle):
+        while True:
+            line = handle.readline()
+            if not line:
+                return
+            self.offset = handle.tell()
+            yield line.decode('utf-8-sig')
+
+    def _read_ndjson(self, handle):
+        handle.seek(self.offset)
+        for line in self._lines(handle):
+            if line.strip():
+                yield json.loads(line), self.offset
+
+    def _read_csv(self, handle):
+        header = next(csv.reader([handle.readline().decode('utf-8-sig')]), None)
+        if not header:
+            return
+        handle.seek(max(self.offset, handle.tell()))
+        for values in csv.reader(self._lines(handle)):
+            if values:
+                # Campos vazios no CSV equivalem a campos não informados
+                yield {key: value for key, value in zip(header, values) if value != ''}, self.offset
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa perfis históricos de um arquivo CSV ou NDJSON: valida cada linha como o '
+        'formulário da API, calcula o ICS em blocos vetorizados e grava ICSProfile e '
+        'CalculationLog com bulk_create, um bloco por transação. O progresso fica salvo e '
+        'a importação é retomada automaticamente ao rodar o comando de novo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo .csv, .ndjson ou .jsonl')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Formato (padrão: pela extensão)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Linhas por bloco/transação')
+        parser.add_argument('--rejects', help='Arquivo NDJSON onde gravar as linhas inválidas')
+        parser.add_argument('--restart', action='store_true', help='Ignora o progresso salvo e começa do início')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'Arquivo não encontrado: {path}')
+
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        chunk_size = options['chunk_size']
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=path)
+        if options['restart']:
+            checkpoint.offset = checkpoint.rows_read = checkpoint.rows_imported = checkpoint.rows_rejected = 0
+            checkpoint.completed = False
+            checkpoint.save()
+        elif checkpoint.completed:
+            self.stdout.write(self.style.WARNING(
+                f'Importação já concluída ({checkpoint.rows_imported} perfis). Use --restart para reimportar.'
+            ))
+            return
+        elif checkpoint.offset:
+            self.stdout.write(
+                f'Retomando após {checkpoint.rows_read} linhas ({checkpoint.rows_imported} importadas)'
+            )
+
+        rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        validator = ICSFormDataSerializer()
+        calc_service = ICSCalculationService()
+
+        try:
+            rows, rejected = [], []
+            offset = checkpoint.offset
+            for record, offset in RecordReader(path, file_format, checkpoint.offset):
+                line_number = checkpoint.rows_read + len(rows) + len(rejected) + 1
+                try:
+                    rows.append(dict(validator.run_validation(record)))
+                except serializers.ValidationError as e:
+                    rejected.append({'line': line_number, 'errors': e.detail, 'data': record})
+
+                if len(rows) + len(rejected) >= chunk_size:
+                    self._flush(checkpoint, calc_service, rows, rejected, offset, rejects)
+                    rows, rejected = [], []
+
+            self._flush(checkpoint, calc_service, rows, rejected, offset, rejects, completed=True)
+        except (ValueError, csv.Error) as e:
+            raise CommandError(
+                f'Erro ao ler o arquivo após a linha {checkpoint.rows_read}: {e}. '
+                'O progresso até o último bloco foi salvo.'
+            )
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Importação concluída: {checkpoint.rows_imported} perfis importados, '
+            f'{checkpoint.rows_rejected} linhas rejeitadas'
+        ))
+
+    def _flush(self, checkpoint, calc_service, rows, rejected, offset, rejects, completed=False):
+        """Calcula e grava um bloco junto com o checkpoint, na mesma transação"""
+        results = calc_service.calculate_many(rows)
+
+        with transaction.atomic():
+            calc_service.save_many(rows, results, chunk_size=max(len(rows), 1))
+            checkpoint.offset = offset
+            checkpoint.rows_read += len(rows) + len(rejected)
+            checkpoint.rows_imported += len(rows)
+            checkpoint.rows_rejected += len(rejected)
+            checkpoint.completed = completed
+            checkpoint.save()
+
+        if rejects:
+            for reject in rejected:
+                rejects.write(json.dumps(reject, ensure_ascii=False, default=str) + '\n')
+            rejects.flush()
+
+        self.stdout.write(
+            f'{checkpoint.rows_read} linhas lidas, {checkpoint.rows_imported} importadas, '
+            f'{checkpoint.rows_rejected} rejeitadas'
+        )
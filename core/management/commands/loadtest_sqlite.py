@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga de escrita: N processos enviam POST /api/calculate/ ao mesmo tempo, '
+        'como workers do gunicorn, enquanto outros leem o dashboard e a lista de perfis. '
+        'Roda sobre um banco SQLite temporário, com o perfil de concorrência de DATABASES '
+        '(WAL, PRAGMAs, busy timeout, conexões persistentes) e com o SQLite padrão do '
+        'Django, para comparação.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Processos escrevendo ao mesmo tempo')
+        parser.add_argument('--requests', type=int, default=200, help='Pedidos por processo')
+        parser.add_argument('--readers', type=int, default=2, help='Processos lendo durante o teste')
+        parser.add_argument(
+            '--profile', choices=['both', 'tuned', 'default'], default='both',
+            help='tuned: DATABASES do settings; default: SQLite sem opções'
+        )
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS].settings_dict
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('loadtest_sqlite só funciona com o backend sqlite3')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('loadtest_sqlite precisa de multiprocessing com fork')
+
+        profiles = ['tuned', 'default'] if options['profile'] == 'both' else [options['profile']]
+        original = dict(database)
+        try:
+            for profile in profiles:
+                with tempfile.TemporaryDirectory() as directory:
+                    self._configure(database, original, profile, os.path.join(directory, 'loadtest.sqlite3'))
+                    result = self._run(options['workers'], options['requests'], options['readers'])
+                self._report(profile, options['workers'], result)
+        finally:
+            connections.close_all()
+            database.clear()
+            database.update(original)
+
+    def _configure(self, database, original, profile, path):
+        """Aponta a conexão padrão para um banco novo e cria as tabelas"""
+        connections.close_all()
+        database.clear()
+        database.update(original, NAME=path)
+        if profile == 'default':
+            database.update(OPTIONS={}, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        call_command('migrate', verbosity=0, interactive=False)
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.journal_mode = cursor.fetchone()[0]
+        # Os processos filhos não podem herdar a conexão aberta
+        connections.close_all()
+
+    def _run(self, workers, requests, readers):
+        context = multiprocessing.get_context('fork')
+        start, stop = context.Event(), context.Event()
+        results, reads = context.Queue(), context.Queue()
+        writer_processes = [
+            context.Process(target=_worker, args=(seed, requests, start, results))
+            for seed in range(workers)
+        ]
+        reader_processes = [
+            context.Process(target=_reader, args=(start, stop, reads))
+            for _ in range(readers)
+        ]
+        for process in writer_processes + reader_processes:
+            process.start()
+
+        started = time.perf_counter()
+        start.set()
+        outcomes = [results.get() for _ in writer_processes]
+        elapsed = time.perf_counter() - started
+        stop.set()
+        read_outcomes = [reads.get() for _ in reader_processes]
+        for process in writer_processes + reader_processes:
+            process.join()
+
+        latencies = sorted(latency for outcome in outcomes for latency in outcome['latencies'])
+        errors = {}
+        for outcome in outcomes:
+            for message, count in outcome['errors'].items():
+                errors[message] = errors.get(message, 0) + count
+        return {
+            'ok': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'latencies': latencies,
+            'reads': sum(outcome['ok'] for outcome in read_outcomes),
+            'read_errors': sum(outcome['errors'] for outcome in read_outcomes),
+        }
+
+    def _report(self, profile, workers, result):
+        total = result['ok'] + sum(result['errors'].values())
+        self.stdout.write(f'\n{profile} (journal_mode={self.journal_mode}), {workers} processos, {total} pedidos')
+        self.stdout.write(f'  tempo total: {result["elapsed"]:.2f}s')
+        style = self.style.SUCCESS if not result['errors'] else self.style.WARNING
+        self.stdout.write(style(
+            f'  gravados: {result["ok"]} ({result["ok"] / result["elapsed"]:.0f}/s), '
+            f'falhas: {total - result["ok"]}'
+        ))
+        latencies = result['latencies']
+        if latencies:
+            p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+            self.stdout.write(
+                f'  latência: p50 {statistics.median(latencies) * 1000:.1f} ms, '
+                f'p95 {p95 * 1000:.1f} ms, máx {latencies[-1] * 1000:.1f} ms'
+            )
+        if result['reads'] or result['read_errors']:
+            self.stdout.write(
+                f'  leituras concorrentes: {result["reads"]} ({result["reads"] / result["elapsed"]:.0f}/s), '
+                f'falhas: {result["read_errors"]}'
+            )
+        for message, count in sorted(result['errors'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f'  {count}x {message}')
+
+
+def _worker(seed, requests, start, results):
+    """Processo filho: envia os pedidos pelo cliente de teste e devolve os tempos"""
+    rng = random.Random(seed)
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    latencies = []
+    errors = {}
+
+    start.wait()
+    for _ in range(requests):
+        payload = {
+            'father_salary': rng.uniform(1500, 20000),
+            'mother_salary': rng.uniform(1500, 20000),
+            'family_property_value': rng.uniform(0, 2000000),
+            'tax_paid': rng.uniform(0, 100000),
+            'inheritance_status': rng.choice(['recebeu', 'sem', 'aguardando']),
+        }
+        started = time.perf_counter()
+        response = client.post('/api/calculate/', payload, content_type='application/json')
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            message = response.json().get('error', f'HTTP {response.status_code}')
+            errors[message] = errors.get(message, 0) + 1
+
+    connections.close_all()
+    results.put({'latencies': latencies, 'errors': errors})
+
+
+def _reader(start, stop, results):
+    """Processo filho: lê dashboard e lista de perfis até os escritores terminarem"""
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    ok = errors = 0
+
+    start.wait()
+    while not stop.is_set():
+        for path in ('/api/dashboard/stats/', '/api/profiles/'):
+            try:
+                response = client.get(path)
+            except Exception:
+                # Erros de banco fora das views de API (ex.: no snapshot) sobem como exceção
+                errors += 1
+                continue
+            if response.status_code == 200:
+                ok += 1
+            else:
+                errors += 1
+
+    connections.close_all()
+    results.put({'ok': ok, 'errors': errors})
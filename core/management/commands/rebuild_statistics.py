@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói do zero as estatísticas mantidas incrementalmente a partir de ICSProfile'
+
+    def handle(self, *args, **options):
+        totals = rollups.rebuild()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice de scores reconstruído com {totals["score_index"]} perfis'
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Sketch de quantis reconstruído com {totals["sketch"]} perfis'
+        ))
@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import rollups, weight_sets
+from core.models import ICSProfile, RescoreCheckpoint
+from core.services import ICSCalculationService
+
+# Colunas que entram no score (a confiança não depende dos pesos)
+INPUT_FIELDS = [
+    'tax_paid', 'father_salary', 'mother_salary',
+    'family_property_value', 'family_financial_value',
+    'inheritance_status', 'benefits_value',
+]
+
+
+def rescore_chunk(weights, rows):
+    """
+    Recalcula um bloco de perfis (id, ics_score, *INPUT_FIELDS); roda nos
+    processos do pool, sem acesso ao banco
+    """
+    # Colunas nulas saem do dicionário, como os campos não enviados no
+    # formulário (inheritance_status ausente conta como 'sem')
+    data = [
+        {name: value for name, value in zip(INPUT_FIELDS, row[2:]) if value is not None}
+        for row in rows
+    ]
+    results = ICSCalculationService(weights).calculate_many(data)
+    return [
+        (result['ics_score'], result['explanation'], *(result['components'][name] for name in weight_sets.COMPONENTS))
+        for result in results
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula o ICS dos perfis calculados com outra versão de pesos que não a de '
+        'ICS_CONFIG["DEFAULT_WEIGHTS"]. Os perfis são lidos em blocos ordenados por id, '
+        'calculados em um pool de processos e gravados com um UPDATE em lote, junto com as '
+        'estatísticas e o checkpoint; rodar de novo retoma do último bloco gravado. No SQLite, '
+        'com --single-statement, os perfis com componentes gravados são atualizados antes com '
+        'um único UPDATE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Perfis por bloco/transação')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processos de cálculo (0: no próprio processo)'
+        )
+        parser.add_argument(
+            '--single-statement', action='store_true',
+            help=(
+                'SQLite: aplica os pesos com um único UPDATE sobre as colunas component_*. '
+                'Segura o lock de escrita do banco até o fim (sem checkpoint): só com o '
+                'serviço parado'
+            )
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignora o progresso salvo e começa do início')
+
+    def handle(self, *args, **options):
+        weight_set = weight_sets.get_weight_set()
+        checkpoint, _ = RescoreCheckpoint.objects.get_or_create(weights_version=weight_set.version)
+        if options['restart'] or checkpoint.completed:
+            # Uma nova passada só encontra o que ainda estiver desatualizado
+            checkpoint.last_id = checkpoint.rows_rescored = 0
+            checkpoint.completed = False
+            checkpoint.save()
+
+        started = time.perf_counter()
+        self.stdout.write(f'Pesos v{weight_set.version} {weight_set.weights}')
+        if connection.vendor == 'sqlite' and options['single_statement']:
+            with transaction.atomic():
+                updated = weight_sets.rescore_with_sql(weight_set)
+                if updated:
+                    # O sketch é reconstruído uma única vez, no fim
+                    rollups.rebuild_score_index()
+                checkpoint.rows_rescored += updated
+                checkpoint.save()
+            self.stdout.write(f'{updated} perfis recalculados com um UPDATE a partir dos componentes')
+
+        # Perfis desatualizados ou ainda sem os componentes gravados
+        stale = (
+            ICSProfile.objects
+            .filter(ics_score__isnull=False)
+            .filter(~Q(weights_version=weight_set.version) | Q(component_fiscal__isnull=True))
+            .order_by('id')
+            .values_list('id', 'ics_score', *INPUT_FIELDS)
+        )
+        pending = stale.filter(id__gt=checkpoint.last_id).count()
+        self.stdout.write(
+            f'{pending} perfis a recalcular em blocos'
+            + (f' (retomando após o id {checkpoint.last_id})' if checkpoint.last_id else '')
+        )
+
+        workers = options['workers']
+        pool = None
+        if workers > 0:
+            # fork: os processos herdam o Django já configurado (não usam o banco)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        try:
+            if pending:
+                self._run(stale, weight_set, checkpoint, options['chunk_size'], pool, max(workers, 1) * 2)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        # O sketch de quantis não aceita remoção: reconstruído com os novos
+        # scores, avançando de novo a versão do snapshot (ETag do dashboard)
+        with transaction.atomic():
+            rollups.rebuild_sketch()
+            checkpoint.completed = True
+            checkpoint.save()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Recálculo concluído: {checkpoint.rows_rescored} perfis com os pesos '
+            f'v{weight_set.version} em {elapsed:.1f}s'
+        ))
+
+    def _run(self, stale, weight_set, checkpoint, chunk_size, pool, max_in_flight):
+        """Lê os blocos à frente enquanto o pool calcula; grava na ordem de leitura"""
+        in_flight = deque()
+        last_id = checkpoint.last_id
+        exhausted = False
+
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                rows = list(stale.filter(id__gt=last_id)[:chunk_size])
+                if not rows:
+                    exhausted = True
+                    break
+                last_id = rows[-1][0]
+                if pool:
+                    results = pool.submit(rescore_chunk, weight_set.weights, rows)
+                else:
+                    results = rescore_chunk(weight_set.weights, rows)
+                in_flight.append((rows, results))
+                if not pool:
+                    break
+
+            if not in_flight:
+                return
+            rows, results = in_flight.popleft()
+            results = results.result() if pool else results
+            self._write(rows, results, weight_set.version, checkpoint)
+
+    def _write(self, rows, results, version, checkpoint):
+        """Grava um bloco, as estatísticas e o checkpoint na mesma transação"""
+        updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        params = [(*result, version, updated_at, row[0]) for row, result in zip(rows, results)]
+        quote = connection.ops.quote_name
+        components = ''.join(f', {quote(f"component_{name}")} = %s' for name in weight_sets.COMPONENTS)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # UPDATE preparado uma vez e executado por linha: bem mais barato
+                # que o CASE WHEN gigante de bulk_update
+                cursor.executemany(
+                    f'UPDATE {quote(ICSProfile._meta.db_table)} SET {quote("ics_score")} = %s, '
+                    f'{quote("ics_explanation")} = %s{components}, {quote("weights_version")} = %s, '
+                    f'{quote("updated_at")} = %s WHERE {quote("id")} = %s',
+                    params
+                )
+            rollups.replace_scores([row[1] for row in rows], [result[0] for result in results])
+            checkpoint.last_id = rows[-1][0]
+            checkpoint.rows_rescored += len(rows)
+            checkpoint.save()
+
+        self.stdout.write(f'{checkpoint.rows_rescored} perfis recalculados (até o id {checkpoint.last_id})')
@@ -0,0 +1,421 @@
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core import rollups, snapshot, weight_sets
+from core.models import ICSProfile, Municipality
+from core.services import ExternalAPIService, ICSCalculationService, component_fields, local_cache
+from core.utils import normalize_text
+
+GROUPS = ['scoring', 'external', 'requests', 'dashboard']
+
+# Municípios servidos pelo stub do IBGE (a lista real tem 5570)
+STUB_MUNICIPALITIES = 5570
+
+
+def summarize(samples, ops=1):
+    """Estatísticas por operação (em ms) de uma lista de tempos de amostra (em s)"""
+    per_op = sorted(sample / ops * 1000 for sample in samples)
+    median = statistics.median(per_op)
+    return {
+        'samples': len(per_op),
+        'ops_per_sample': ops,
+        'min_ms': round(per_op[0], 6),
+        'median_ms': round(median, 6),
+        'mean_ms': round(statistics.fmean(per_op), 6),
+        'p95_ms': round(per_op[min(int(len(per_op) * 0.95), len(per_op) - 1)], 6),
+        'max_ms': round(per_op[-1], 6),
+        'ops_per_s': round(1000 / median, 1) if median else None,
+    }
+
+
+def measure(func, repeat, ops=1, warmup=1):
+    """Executa func warmup + repeat vezes; cada chamada faz ops operações"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, ops)
+
+
+def compare_results(previous, current, tolerance):
+    """
+    (nome, mediana anterior, mediana atual, razão, regressão?) dos benchmarks
+    presentes nos dois resultados
+    """
+    rows = []
+    for name, result in current['benchmarks'].items():
+        before = previous.get('benchmarks', {}).get(name)
+        if not before or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        rows.append((name, before['median_ms'], result['median_ms'], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def profile_rows(rng, count):
+    """Dados de formulário sintéticos, reprodutíveis pela semente do rng"""
+    return [
+        {
+            'father_salary': rng.uniform(1500, 20000),
+            'mother_salary': rng.uniform(0, 15000),
+            'family_property_value': rng.uniform(0, 2000000),
+            'family_financial_value': rng.uniform(0, 500000),
+            'inheritance_status': rng.choice(['recebeu', 'sem', 'aguardando']),
+            'benefits_value': rng.choice([0, 0, 0, 600, 1200]),
+            'tax_paid': rng.uniform(0, 60000),
+        }
+        for _ in range(count)
+    ]
+
+
+class StubIBGE:
+    """Servidor HTTP local com a rota de municípios do IBGE"""
+
+    def __init__(self, delay=0):
+        body = json.dumps([
+            {
+                'id': 1000000 + index,
+                'nome': f'Município {index:04d}',
+                'microrregiao': {'mesorregiao': {'UF': {'sigla': 'SP'}}},
+            }
+            for index in range(STUB_MUNICIPALITIES)
+        ]).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Suíte de benchmarks reprodutível: vazão de calculate_ics/calculate_many, latência '
+        'dos endpoints pelo cliente de teste do Django, estatísticas do dashboard com 10 mil, '
+        '100 mil e 1 milhão de perfis e ExternalAPIService.get_municipality_data contra um stub '
+        'local do IBGE e com o catálogo de municípios. Roda sobre um banco SQLite temporário '
+        'com dados gerados por semente fixa e grava o resultado em JSON (--output), que pode ser comparado com o de outro commit (--compare).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Arquivo JSON com os resultados')
+        parser.add_argument('--json', action='store_true', help='Escreve só o JSON na saída padrão')
+        parser.add_argument('--compare', help='JSON de uma execução anterior para comparar as medianas')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Aumento da mediana (fração) a partir do qual --compare aponta regressão'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Termina com erro se --compare encontrar regressões'
+        )
+        parser.add_argument(
+            '--only', default=','.join(GROUPS),
+            help=f'Grupos a executar, separados por vírgula ({", ".join(GROUPS)})'
+        )
+        parser.add_argument(
+            '--sizes', default='10000,100000,1000000',
+            help='Quantidades de perfis para o grupo dashboard'
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Amostras por benchmark')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos dados gerados')
+        parser.add_argument(
+            '--stub-delay', type=float, default=0,
+            help='Atraso (segundos) de cada resposta do stub do IBGE'
+        )
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS].settings_dict
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('run_benchmarks só funciona com o backend sqlite3')
+        groups = [group.strip() for group in options['only'].split(',') if group.strip()]
+        unknown = set(groups) - set(GROUPS)
+        if unknown:
+            raise CommandError(f'Grupos desconhecidos: {", ".join(sorted(unknown))} (use {", ".join(GROUPS)})')
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(',') if size.strip())
+        except ValueError:
+            raise CommandError('--sizes deve ser uma lista de inteiros')
+
+        self.verbose = not options['json']
+        self.repeat = max(options['repeat'], 1)
+        self.benchmarks = {}
+
+        original = dict(database)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                self._configure(database, original, os.path.join(directory, 'benchmark.sqlite3'))
+                local_cache.clear()
+                for group in GROUPS:
+                    if group in groups:
+                        self._log(f'\n{group}')
+                        # Dados de cada grupo independem dos grupos escolhidos
+                        self.rng = random.Random(f'{options["seed"]}:{group}')
+                        getattr(self, f'_bench_{group}')(options, sizes)
+                connections.close_all()
+        finally:
+            connections.close_all()
+            database.clear()
+            database.update(original)
+
+        result = {'meta': self._meta(options, groups, sizes), 'benchmarks': self.benchmarks}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2, ensure_ascii=False)
+                output.write('\n')
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+        if options['compare']:
+            self._compare(options, result)
+
+    def _configure(self, database, original, path):
+        """Aponta a conexão padrão para um banco novo (perfil do settings) e cria as tabelas"""
+        connections.close_all()
+        database.clear()
+        database.update(original, NAME=path)
+        call_command('migrate', verbosity=0, interactive=False)
+
+    def _log(self, message):
+        if self.verbose:
+            self.stdout.write(message)
+
+    def _record(self, name, result):
+        self.benchmarks[name] = result
+        self._log(
+            f'  {name:<44} mediana {result["median_ms"]:>10.4f} ms   p95 {result["p95_ms"]:>10.4f} ms'
+            f'   {result["ops_per_s"] or 0:>12,.0f} ops/s'
+        )
+
+    def _bench_scoring(self, options, sizes):
+        """Cálculo puro, sem banco"""
+        service = ICSCalculationService()
+        rows = profile_rows(self.rng, 10000)
+
+        def calculate_each():
+            for data in rows[:1000]:
+                service.calculate_ics(data)
+
+        self._record('scoring.calculate_ics', measure(calculate_each, self.repeat, ops=1000))
+        self._record(
+            'scoring.calculate_many',
+            measure(lambda: service.calculate_many(rows), max(self.repeat // 4, 3), ops=len(rows))
+        )
+
+    def _bench_external(self, options, sizes):
+        """
+        ExternalAPIService.get_municipality_data, o método usado no
+        enriquecimento: sem catálogo local (API do IBGE no stub, cache no
+        banco e em memória) e com o catálogo importado. A busca interna na
+        API sai à parte, em external.raw_fetch.*
+        """
+        # Metade dos municípios do stub para cada medida de busca sem cache
+        public_names = iter(range(STUB_MUNICIPALITIES // 2))
+        raw_names = iter(range(STUB_MUNICIPALITIES // 2, STUB_MUNICIPALITIES))
+        misses = min(self.repeat, STUB_MUNICIPALITIES // 2 - 1)
+
+        with StubIBGE(options['stub_delay']) as stub:
+            with override_settings(ICS_CONFIG={**settings.ICS_CONFIG, 'IBGE_API_BASE': stub.url}):
+                service = ExternalAPIService()
+
+                def miss():
+                    # Um município diferente por amostra: sempre baixa a lista
+                    service.get_municipality_data(f'Município {next(public_names):04d}', 'SP')
+
+                self._record('external.municipality_miss', measure(miss, misses))
+
+                def db_hit():
+                    local_cache.clear()
+                    service.get_municipality_data('Município 0000', 'SP')
+
+                self._record('external.municipality_db_hit', measure(db_hit, self.repeat))
+
+                def memory_hit():
+                    for _ in range(1000):
+                        service.get_municipality_data('Município 0000', 'SP')
+
+                self._record('external.municipality_memory_hit', measure(memory_hit, self.repeat, ops=1000))
+
+                # Só a busca na API, sem o catálogo e o cache por nome normalizado
+                def raw_miss():
+                    service._fetch_municipality_data(f'Município {next(raw_names):04d}', 'SP')
+
+                self._record('external.raw_fetch.municipality_miss', measure(raw_miss, misses))
+
+                def raw_memory_hit():
+                    for _ in range(1000):
+                        service._fetch_municipality_data('Município 0000', 'SP')
+
+                self._record(
+                    'external.raw_fetch.municipality_memory_hit', measure(raw_memory_hit, self.repeat, ops=1000)
+                )
+
+        # Catálogo importado (import_municipalities): a API não é mais chamada
+        Municipality.objects.bulk_create([
+            Municipality(
+                ibge_code=1000000 + index, name=f'Município {index:04d}',
+                normalized_name=normalize_text(f'Município {index:04d}'),
+                state='SP', pib_per_capita=30000
+            )
+            for index in range(STUB_MUNICIPALITIES)
+        ], batch_size=1000)
+        names = [f'Município {index:04d}' for index in range(STUB_MUNICIPALITIES)]
+
+        def catalogue_hit():
+            local_cache.clear()
+            service.get_municipality_data(self.rng.choice(names), 'SP')
+
+        self._record('external.municipality_catalogue_hit', measure(catalogue_hit, self.repeat))
+        Municipality.objects.all().delete()
+        local_cache.clear()
+
+    def _bench_requests(self, options, sizes):
+        """Latência de ponta a ponta (middleware, view, banco, renderização) pelo cliente de teste"""
+        self._grow(min(sizes) if sizes else 10000)
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        payloads = iter(profile_rows(self.rng, self.repeat + 1))
+        profile_id = ICSProfile.objects.filter(ics_score__isnull=False).values_list('id', flat=True).first()
+
+        def request(method, path, **kwargs):
+            def run():
+                response = getattr(client, method)(path, **kwargs)
+                if response.status_code != 200:
+                    raise CommandError(f'{method.upper()} {path}: HTTP {response.status_code}')
+            return run
+
+        def calculate():
+            request('post', '/api/calculate/', data=next(payloads), content_type='application/json')()
+
+        self._record('request.calculate', measure(calculate, self.repeat))
+        self._record('request.dashboard_stats', measure(request('get', '/api/dashboard/stats/'), self.repeat))
+        self._record('request.profile_list', measure(request('get', '/api/profiles/'), self.repeat))
+        self._record(
+            'request.profile_detail', measure(request('get', f'/api/profiles/{profile_id}/'), self.repeat)
+        )
+        self._record('request.weight_simulation', measure(request(
+            'post', '/api/weights/simulate/',
+            data={'candidates': [{'fiscal': 0.35}]}, content_type='application/json'
+        ), self.repeat))
+
+    def _bench_dashboard(self, options, sizes):
+        """Estatísticas do dashboard pelo snapshot e a agregação completa que ele substitui"""
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        for size in sizes:
+            self._grow(size)
+
+            def stats():
+                response = client.get('/api/dashboard/stats/')
+                if response.status_code != 200:
+                    raise CommandError(f'GET /api/dashboard/stats/: HTTP {response.status_code}')
+
+            self._record(f'dashboard.stats_api.{size}', measure(stats, self.repeat))
+            self._record(
+                f'dashboard.full_aggregate.{size}',
+                measure(lambda: snapshot.aggregate_profiles(ICSProfile.objects.all()), max(self.repeat // 4, 3))
+            )
+
+    def _grow(self, size):
+        """Completa a tabela até size perfis calculados e reconstrói as estatísticas"""
+        missing = size - ICSProfile.objects.filter(ics_score__isnull=False).count()
+        if missing <= 0:
+            return
+        self._log(f'  (gerando {missing} perfis)')
+        service = ICSCalculationService()
+        version = weight_sets.current_version()
+        for start in range(0, missing, 50000):
+            rows = profile_rows(self.rng, min(50000, missing - start))
+            results = service.calculate_many(rows)
+            ICSProfile.objects.bulk_create([
+                ICSProfile(
+                    **data,
+                    ics_score=result['ics_score'],
+                    ics_explanation=result['explanation'],
+                    ics_confidence=result['confidence'],
+                    weights_version=version,
+                    raw_data=data,
+                    **component_fields(result['components'])
+                )
+                for data, result in zip(rows, results)
+            ], batch_size=5000)
+        rollups.rebuild()
+
+    def _meta(self, options, groups, sizes):
+        """Ambiente da execução, para saber se dois resultados são comparáveis"""
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'created_at': timezone.now().isoformat(),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': 'sqlite3',
+            'groups': groups,
+            'sizes': sizes,
+            'repeat': self.repeat,
+            'seed': options['seed'],
+            'stub_delay': options['stub_delay'],
+        }
+
+    def _compare(self, options, result):
+        with open(options['compare']) as previous_file:
+            previous = json.load(previous_file)
+        rows = compare_results(previous, result, options['tolerance'])
+        commit = (previous.get('meta', {}).get('git_commit') or '?')[:10]
+        self.stdout.write(f'\nComparação com {options["compare"]} (commit {commit})')
+        for name, before, after, ratio, regression in rows:
+            line = f'  {name:<36} {before:>10.4f} -> {after:>10.4f} ms ({ratio:.2f}x)'
+            if regression:
+                line = self.style.ERROR(line + '  regressão')
+            elif ratio < 1:
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressões acima de {options["tolerance"]:.0%}: {", ".join(regressions)}')
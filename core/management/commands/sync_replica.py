@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia o banco SQLite principal para o arquivo da réplica de leitura (DATABASES '
+        '["replica"], configurado por ICS_REPLICA_DB) com a API de backup do SQLite, sem '
+        'parar as escritas. Com --interval, repete a cópia, simulando uma réplica com atraso.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Segundos entre cópias (0: copia uma vez e sai)'
+        )
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('Réplica não configurada (defina ICS_REPLICA_DB)')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('sync_replica só copia bancos SQLite; use a replicação do próprio banco')
+
+        target = str(settings.DATABASES[alias]['NAME'])
+        while True:
+            started = time.perf_counter()
+            primary.ensure_connection()
+            with sqlite3.connect(target) as replica:
+                # Cópia consistente mesmo com escritas no principal durante o backup
+                primary.connection.backup(replica, pages=1024)
+            replica.close()
+            self.stdout.write(f'Réplica atualizada em {time.perf_counter() - started:.2f}s: {target}')
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
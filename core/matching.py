@@ -0,0 +1,169 @@
+"""
+Reconhecimento de profissões em texto livre
+
+Os nomes de ocupação (tabela Occupation, estilo CBO) são compilados em um
+autômato de Aho-Corasick sobre palavras sem acento. A busca percorre o texto
+uma única vez, em tempo proporcional ao tamanho da entrada, qualquer que seja o
+número de ocupações carregadas, e escolhe a ocupação com mais palavras
+reconhecidas (ex.: 'técnico em enfermagem' vence 'técnico').
+
+Cada palavra é reduzida a uma forma canônica de número e gênero
+('professoras' -> 'professor', 'engenheira' -> 'engenheiro'), para que os
+plurais e femininos reconhecidos pela antiga busca por substring, e os que
+ela perdia, continuem casando com os nomes da tabela.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .models import Occupation
+from .utils import normalize_text
+
+
+# Palavras ignoradas nos nomes e na entrada ('técnico de/em enfermagem')
+STOPWORDS = frozenset(['a', 'as', 'o', 'os', 'de', 'da', 'das', 'do', 'dos', 'e', 'em', 'na', 'no'])
+
+# Tabela usada enquanto nenhuma ocupação foi importada (import_occupations)
+DEFAULT_OCCUPATIONS = [
+    # (código CBO, nome, salário médio)
+    # (femininos e plurais casam pela forma canônica das palavras)
+    (None, 'médico', 15000),
+    (None, 'enfermeiro', 4500),
+    (None, 'técnico em enfermagem', 3000),
+    (None, 'professor', 3500),
+    (None, 'engenheiro', 8000),
+    (None, 'advogado', 7000),
+    (None, 'técnico', 3000),
+    (None, 'vendedor', 2500),
+    (None, 'auxiliar', 1800),
+    (None, 'gerente', 6000),
+    (None, 'analista', 5000),
+]
+
+
+def canonical(token):
+    """
+    Forma canônica (masculino singular aproximado) de uma palavra sem acento:
+    professores/professoras/professora -> professor, engenheiras -> engenheiro,
+    auxiliares -> auxiliar, gerentes -> gerente, civis -> civil, policiais -> policial
+    """
+    if len(token) <= 3:
+        return token
+    if token.endswith('oes'):
+        token = token[:-3] + 'ao'
+    elif token.endswith(('ais', 'eis')):
+        token = token[:-2] + 'l'
+    elif token.endswith('is') and token[-3] not in 'aeiou':
+        token = token[:-1] + 'l'
+    elif token.endswith(('res', 'zes', 'ses')):
+        token = token[:-2]
+    elif token.endswith('s'):
+        token = token[:-1]
+    if token.endswith('ora'):
+        return token[:-1]
+    if token.endswith('a'):
+        return token[:-1] + 'o'
+    return token
+
+
+def tokenize(text):
+    """Palavras normalizadas (sem acento, minúsculas, forma canônica), sem stopwords"""
+    return [
+        canonical(token) for token in re.findall(r'[a-z0-9]+', normalize_text(text))
+        if token not in STOPWORDS
+    ]
+
+
+class JobTitleMatcher:
+    """
+    Autômato de Aho-Corasick por palavras sobre os nomes das ocupações
+    """
+
+    def __init__(self, occupations):
+        # Nó: transições por palavra, link de falha e melhor ocupação terminando nele
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+
+        for code, title, salary in occupations:
+            tokens = tokenize(title)
+            if tokens:
+                self._add(tokens, {'cbo_code': code, 'occupation': title, 'average_salary': salary})
+        self._build_links()
+
+    def _add(self, tokens, occupation):
+        node = 0
+        for token in tokens:
+            if token not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._goto[node][token] = len(self._goto) - 1
+            node = self._goto[node][token]
+        # Primeira ocupação com o mesmo nome normalizado prevalece
+        if self._output[node] is None:
+            self._output[node] = (len(tokens), occupation)
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                # Herda a saída mais longa do link de falha quando não há saída própria
+                if self._output[child] is None:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def match(self, text):
+        """
+        Ocupação com mais palavras reconhecidas no texto (a primeira em caso
+        de empate) ou None
+        """
+        best = None
+        node = 0
+        for token in tokenize(text):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+
+            output = self._output[node]
+            if output and (best is None or output[0] > best[0]):
+                best = output
+        return best[1] if best else None
+
+
+_matcher = None
+_matcher_built_at = 0
+_lock = threading.Lock()
+
+
+def get_matcher():
+    """
+    Matcher compilado do processo, reconstruído periodicamente para refletir
+    novas importações de ocupações
+    """
+    global _matcher, _matcher_built_at
+
+    max_age = settings.ICS_CONFIG['LOCAL_CACHE_TIMEOUT']
+    if _matcher is None or time.monotonic() - _matcher_built_at > max_age:
+        with _lock:
+            if _matcher is None or time.monotonic() - _matcher_built_at > max_age:
+                occupations = list(
+                    Occupation.objects.order_by('id').values_list('cbo_code', 'title', 'average_salary')
+                )
+                _matcher = JobTitleMatcher(occupations or DEFAULT_OCCUPATIONS)
+                _matcher_built_at = time.monotonic()
+    return _matcher
+
+
+def reset_matcher():
+    """Força a recompilação na próxima busca"""
+    global _matcher
+    _matcher = None
@@ -0,0 +1,32 @@
+from django.conf import settings
+
+from .routers import READ_PRIMARY_COOKIE, request_routing
+
+
+class ReadYourWritesMiddleware:
+    """
+    Abre o escopo de roteamento de cada pedido, libera a réplica para as
+    views @replica_reads e, se o pedido escreveu no banco principal, marca o
+    cliente para ler dele por alguns segundos
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_routing(pinned=READ_PRIMARY_COOKIE in request.COOKIES) as state:
+            request.routing_state = state
+            response = self.get_response(request)
+
+        if state.wrote:
+            response.set_cookie(
+                READ_PRIMARY_COOKIE, '1',
+                max_age=settings.ICS_CONFIG['READ_REPLICA']['STICKY_SECONDS'],
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_reads', False):
+            request.routing_state.replica = True
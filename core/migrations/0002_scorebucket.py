@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+# Cópia congelada de core.score_index (RESOLUTION, bucket_for e build_tree):
+# a migração não pode mudar se o módulo mudar
+RESOLUTION = 1000
+
+
+def bucket_for(score):
+    return min(max(int(score * RESOLUTION), 0), RESOLUTION - 1) + 1
+
+
+def build_tree(scores):
+    counts = [0] * (RESOLUTION + 1)
+    sums = [0.0] * (RESOLUTION + 1)
+
+    for score in scores:
+        index = bucket_for(score)
+        counts[index] += 1
+        sums[index] += score
+
+    for index in range(1, RESOLUTION + 1):
+        parent = index + (index & -index)
+        if parent <= RESOLUTION:
+            counts[parent] += counts[index]
+            sums[parent] += sums[index]
+
+    return counts, sums
+
+
+def populate_score_index(apps, schema_editor):
+    ICSProfile = apps.get_model('core', 'ICSProfile')
+    ScoreBucket = apps.get_model('core', 'ScoreBucket')
+    scores = ICSProfile.objects.filter(
+        ics_score__isnull=False
+    ).values_list('ics_score', flat=True).iterator(chunk_size=10000)
+    counts, sums = build_tree(scores)
+    ScoreBucket.objects.bulk_create([
+        ScoreBucket(index=index, count=counts[index], score_sum=sums[index])
+        for index in range(1, RESOLUTION + 1)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('index', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['index'],
+            },
+        ),
+        migrations.RunPython(populate_score_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_scoresketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_profiles', models.BigIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('low_count', models.BigIntegerField(default=0)),
+                ('medium_count', models.BigIntegerField(default=0)),
+                ('high_count', models.BigIntegerField(default=0)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
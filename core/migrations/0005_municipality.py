@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Municipality',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ibge_code', models.PositiveIntegerField(unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('normalized_name', models.CharField(max_length=200)),
+                ('state', models.CharField(max_length=2)),
+                ('pib_per_capita', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Município',
+                'verbose_name_plural': 'Municípios',
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['normalized_name', 'state'], name='core_munici_normali_66a54b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_municipality'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occupation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cbo_code', models.CharField(blank=True, db_index=True, max_length=10, null=True)),
+                ('title', models.CharField(max_length=200)),
+                ('normalized_title', models.CharField(max_length=200, unique=True)),
+                ('average_salary', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Ocupação',
+                'verbose_name_plural': 'Ocupações',
+                'ordering': ['title'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cachelock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apicache',
+            name='is_negative',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='apicache',
+            name='stale_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='icsprofile',
+            index=models.Index(condition=models.Q(('ics_score__isnull', False)), fields=['-created_at', '-id'], name='core_profile_scored_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='icsprofile',
+            index=models.Index(condition=models.Q(('ics_score__isnull', False)), fields=['ics_score'], name='core_profile_scored_score'),
+        ),
+    ]
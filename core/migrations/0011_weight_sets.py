@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_icsprofile_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RescoreCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weights_version', models.PositiveIntegerField(unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('rows_rescored', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WeightSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('checksum', models.CharField(max_length=40, unique=True)),
+                ('weights', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Versão de pesos',
+                'verbose_name_plural': 'Versões de pesos',
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddField(
+            model_name='icsprofile',
+            name='weights_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_weight_sets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='icsprofile',
+            name='component_benefits',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='icsprofile',
+            name='component_fiscal',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='icsprofile',
+            name='component_job',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='icsprofile',
+            name='component_patrimony',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='icsprofile',
+            name='component_transfers',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+    ]
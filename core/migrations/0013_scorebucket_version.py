@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+def copy_snapshot_version(apps, schema_editor):
+    """
+    Leva a versão do snapshot para a linha de versão do índice (index=0), para
+    que ETags já entregues não voltem a valer com outros dados
+    """
+    DashboardSnapshot = apps.get_model('core', 'DashboardSnapshot')
+    ScoreBucket = apps.get_model('core', 'ScoreBucket')
+
+    snapshot = DashboardSnapshot.objects.filter(pk=1).first()
+    if snapshot is not None:
+        ScoreBucket.objects.update_or_create(
+            index=0, defaults={'version': snapshot.version + 1, 'updated_at': snapshot.updated_at}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_icsprofile_components'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scorebucket',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scorebucket',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_snapshot_version, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='DashboardSnapshot',
+        ),
+    ]
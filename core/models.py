@@ -1,6 +1,8 @@
 from django.db import models
 import json
 
+from .utils import normalize_text
+
 
 class ICSProfile(models.Model):
     """
@@ -40,6 +42,14 @@ class ICSProfile(models.Model):
     ics_score = models.FloatField(blank=True, null=True)
     ics_explanation = models.TextField(blank=True, null=True)
     ics_confidence = models.FloatField(blank=True, null=True)
+    weights_version = models.PositiveIntegerField(blank=True, null=True)  # WeightSet.version usada no score
+    
+    # Componentes normalizados (0..1) do score: ics_score = soma de peso * componente
+    component_fiscal = models.FloatField(blank=True, null=True, db_index=True)
+    component_job = models.FloatField(blank=True, null=True, db_index=True)
+    component_patrimony = models.FloatField(blank=True, null=True, db_index=True)
+    component_transfers = models.FloatField(blank=True, null=True, db_index=True)
+    component_benefits = models.FloatField(blank=True, null=True, db_index=True)
     
     # Dados brutos para auditoria
     raw_data = models.JSONField(default=dict)
@@ -48,11 +58,75 @@ class ICSProfile(models.Model):
         verbose_name = "Perfil ICS"
         verbose_name_plural = "Perfis ICS"
         ordering = ['-created_at']
+        indexes = [
+            # Todas as leituras analíticas filtram perfis calculados: índices
+            # parciais ignoram os perfis sem score.
+            # Recentes do dashboard, paginação por cursor e exportação por data
+            models.Index(
+                fields=['-created_at', '-id'], name='core_profile_scored_recent',
+                condition=models.Q(ics_score__isnull=False)
+            ),
+            # Faixas e limites de score; cobre os agregados do snapshot e as
+            # reconstruções das estatísticas (só lê ics_score e id)
+            models.Index(
+                fields=['ics_score'], name='core_profile_scored_score',
+                condition=models.Q(ics_score__isnull=False)
+            ),
+        ]
     
     def __str__(self):
         return f"ICS Profile {self.id} - Score: {self.ics_score}"
 
 
+class Municipality(models.Model):
+    """
+    Catálogo local de municípios do IBGE com PIB per capita
+    """
+    ibge_code = models.PositiveIntegerField(unique=True)
+    name = models.CharField(max_length=200)
+    normalized_name = models.CharField(max_length=200)
+    state = models.CharField(max_length=2)
+    pib_per_capita = models.FloatField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = "Município"
+        verbose_name_plural = "Municípios"
+        ordering = ['name']
+        indexes = [
+            models.Index(fields=['normalized_name', 'state']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_text(self.name)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.name}/{self.state}"
+
+
+class Occupation(models.Model):
+    """
+    Tabela de ocupações (estilo CBO) com salário médio, usada no
+    reconhecimento de profissões informadas em texto livre
+    """
+    cbo_code = models.CharField(max_length=10, blank=True, null=True, db_index=True)
+    title = models.CharField(max_length=200)
+    normalized_title = models.CharField(max_length=200, unique=True)
+    average_salary = models.FloatField()
+    
+    class Meta:
+        verbose_name = "Ocupação"
+        verbose_name_plural = "Ocupações"
+        ordering = ['title']
+    
+    def save(self, *args, **kwargs):
+        self.normalized_title = normalize_text(self.title)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.cbo_code or '-'} {self.title}"
+
+
 class DataSource(models.Model):
     """
     Registra as fontes de dados utilizadas
@@ -89,8 +163,10 @@ class APICache(models.Model):
     """
     cache_key = models.CharField(max_length=255, unique=True)
     data = models.JSONField()
+    is_negative = models.BooleanField(default=False)  # resultado "não encontrado"
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    stale_at = models.DateTimeField(blank=True, null=True)  # soft TTL
+    expires_at = models.DateTimeField()  # hard TTL
     
     class Meta:
         indexes = [
@@ -100,3 +176,100 @@ class APICache(models.Model):
     
     def __str__(self):
         return f"Cache: {self.cache_key}"
+
+
+class ScoreBucket(models.Model):
+    """
+    Nó da árvore de Fenwick sobre o histograma de scores ICS.
+    Mantido a cada perfil salvo, permite obter média, percentil e as
+    estatísticas do dashboard sem varrer ICSProfile. A linha index=0 fica fora
+    da árvore e guarda só a versão das estatísticas (ETag do dashboard).
+    """
+    index = models.PositiveIntegerField(primary_key=True)
+    count = models.BigIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['index']
+    
+    def __str__(self):
+        return f"Bucket {self.index} - {self.count} perfis"
+
+
+class ScoreSketch(models.Model):
+    """
+    Sketch de quantis (KLL) persistido, atualizado a cada perfil salvo
+    """
+    name = models.CharField(max_length=50, unique=True)
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Sketch: {self.name}"
+
+
+class CacheLock(models.Model):
+    """
+    Trava consultiva entre processos: apenas o dono da trava busca os dados
+    de uma chave de cache; os demais aguardam o resultado no APICache
+    """
+    cache_key = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Lock: {self.cache_key} ({self.owner})"
+
+
+class WeightSet(models.Model):
+    """
+    Versão dos pesos do ICS: um registro para cada conjunto de pesos já
+    usado no cálculo, identificado pelo checksum dos pesos
+    """
+    version = models.PositiveIntegerField(unique=True)
+    checksum = models.CharField(max_length=40, unique=True)
+    weights = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Versão de pesos"
+        verbose_name_plural = "Versões de pesos"
+        ordering = ['-version']
+    
+    def __str__(self):
+        return f"Pesos v{self.version}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progresso de uma importação em lote de perfis, gravado na mesma
+    transação de cada bloco para permitir retomar após falhas
+    """
+    source = models.CharField(max_length=500, unique=True)
+    offset = models.BigIntegerField(default=0)  # bytes já processados do arquivo
+    rows_read = models.BigIntegerField(default=0)
+    rows_imported = models.BigIntegerField(default=0)
+    rows_rejected = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Importação {self.source} ({self.rows_imported} perfis)"
+
+
+class RescoreCheckpoint(models.Model):
+    """
+    Progresso do recálculo dos perfis para uma versão de pesos, gravado na
+    mesma transação de cada bloco para permitir retomar após falhas
+    """
+    weights_version = models.PositiveIntegerField(unique=True)
+    last_id = models.BigIntegerField(default=0)  # maior id de perfil já processado
+    rows_rescored = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recálculo v{self.weights_version} ({self.rows_rescored} perfis)"
@@ -0,0 +1,87 @@
+"""
+Paginação por chave (keyset) para listas ordenadas por (created_at, id)
+
+Em vez de OFFSET, o cursor guarda o (created_at, id) do último item da página
+e a próxima página começa logo depois dele. Com o índice em (created_at, id),
+qualquer página custa o mesmo que a primeira.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(created_at, pk):
+    """Cursor opaco para a posição (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Posição (created_at, id) de um cursor; gera ValueError se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Cursor inválido') from e
+    if created_at is None or not isinstance(pk, int):
+        raise ValueError('Cursor inválido')
+    return created_at, pk
+
+
+class KeysetPagination:
+    """
+    Páginas em ordem decrescente de (created_at, id) a partir de um cursor
+    """
+
+    def __init__(self, request):
+        config = settings.ICS_CONFIG
+        self.request = request
+        self.cursor = request.GET.get('cursor')
+        try:
+            page_size = int(request.GET.get('page_size', config['PAGE_SIZE']))
+        except ValueError:
+            raise ValueError('page_size deve ser um número inteiro')
+        if page_size < 1:
+            raise ValueError('page_size deve ser positivo')
+        self.page_size = min(page_size, config['MAX_PAGE_SIZE'])
+        self.next_cursor = None
+
+    def paginate(self, queryset, position=None):
+        """
+        Itens da página atual (busca um a mais para saber se há próxima);
+        position(item) devolve o (created_at, id) de um item, para listas de
+        tuplas de values_list()
+        """
+        position = position or (lambda item: (item.created_at, item.pk))
+        if self.cursor:
+            created_at, pk = decode_cursor(self.cursor)
+            # O created_at__lte redundante dá ao banco um intervalo para buscar
+            # direto no índice; só o OR faria percorrer o índice desde o início
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                created_at__lte=created_at
+            )
+
+        items = list(queryset.order_by('-created_at', '-id')[:self.page_size + 1])
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            self.next_cursor = encode_cursor(*position(items[-1]))
+        return items
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params['cursor'] = self.next_cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def get_response_data(self, results):
+        return {
+            'next': self.get_next_link(),
+            'page_size': self.page_size,
+            'results': results,
+        }
@@ -0,0 +1,73 @@
+"""
+Renderizador JSON rápido para a API
+
+Usa orjson quando instalado e, sem ele, o JSONRenderer padrão do DRF. A saída
+segue as mesmas regras do JSONRenderer (compacta, UTF-8 sem escapes, U+2028 e
+U+2029 escapados, tipos extras convertidos pelo encoder do DRF), de modo que
+trocar de renderizador não muda as respostas. A única diferença é que NaN e
+infinito viram null em vez de erro.
+"""
+import math
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+
+# Floats muito pequenos ou grandes saem diferentes: orjson escreve 0.00007 e
+# 1e16, a stdlib 7e-05 e 1e+16 (repr usa expoente fora de [1e-4, 1e16)).
+# Respostas com algum float nessas faixas são refeitas pelo JSONRenderer; só
+# os valores float são verificados, nunca o texto já serializado.
+SMALLEST_PLAIN = 1e-4
+LARGEST_PLAIN = 1e16
+
+
+def _has_float_mismatch(data):
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, float):
+            magnitude = abs(value)
+            # NaN e infinito viram null nos dois casos
+            if 0 < magnitude < SMALLEST_PLAIN or LARGEST_PLAIN <= magnitude < math.inf:
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer com serialização em orjson quando disponível
+    """
+    # Datas, Decimal, UUID etc. passam pelo mesmo encoder do JSONRenderer
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if _has_float_mismatch(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self._default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            # Ex.: chaves não-str ou inteiros acima de 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
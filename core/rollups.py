@@ -0,0 +1,103 @@
+"""
+Manutenção conjunta das estatísticas derivadas de ICSProfile
+
+Índice de scores e sketch de quantis são atualizados juntos, na transação
+que grava ou remove os perfis; as estatísticas do dashboard (core.snapshot)
+são lidas do índice. Toda escrita nessas estatísticas passa por aqui e
+avança a versão do snapshot, que é o único validador (ETag / Last-Modified)
+do dashboard.
+"""
+from django.db import transaction
+
+from . import score_index, sketch, snapshot
+
+
+def record_scores(scores):
+    """Registra scores de perfis recém-criados em todas as estatísticas"""
+    scores = [score for score in scores if score is not None]
+    if not scores:
+        return
+
+    score_index.record_scores(scores)
+    sketch.record_scores(scores)
+    snapshot.touch()
+
+
+def record_score(score, include_sketch=True):
+    """
+    Registra o score de um perfil criado pela API e devolve o summary do
+    índice (total, soma e perfis abaixo) já com ele; a versão do snapshot
+    avança no mesmo comando. Com include_sketch=False o sketch fica a cargo
+    de quem grava os logs de cálculo em lote.
+    """
+    stats = score_index.record_score(score)
+    if include_sketch:
+        sketch.record_scores([score])
+    return stats
+
+
+def record_sketch_scores(scores):
+    """
+    Adiciona ao sketch scores de perfis já registrados no índice (ex.: logs gravados em lote pelo write-behind), avançando a
+    versão do snapshot na mesma transação
+    """
+    scores = [score for score in scores if score is not None]
+    if not scores:
+        return
+
+    with transaction.atomic():
+        sketch.record_scores(scores)
+        snapshot.touch()
+
+
+def rebuild_sketch():
+    """Reconstrói só o sketch (ex.: após um recálculo) e avança a versão do snapshot"""
+    with transaction.atomic():
+        total = sketch.rebuild()
+        snapshot.touch()
+    return total
+
+
+def rebuild_score_index():
+    """
+    Reconstrói só o índice de scores (ex.: após um UPDATE em massa dos
+    scores) e avança a versão do snapshot
+    """
+    with transaction.atomic():
+        total = score_index.rebuild()
+        snapshot.touch()
+    return total
+
+
+def forget_scores(scores):
+    """
+    Remove scores de perfis apagados. O sketch de quantis não suporta remoção
+    e só volta a ser exato com rebuild_statistics.
+    """
+    scores = [score for score in scores if score is not None]
+    if not scores:
+        return
+
+    score_index.record_scores(scores, sign=-1)
+    snapshot.touch()
+
+
+def replace_scores(old_scores, new_scores):
+    """
+    Troca os scores de perfis recalculados no índice. Como na remoção, o sketch de quantis precisa de rebuild_sketch() depois.
+    """
+    old_scores = [score for score in old_scores if score is not None]
+    new_scores = [score for score in new_scores if score is not None]
+    score_index.replace_scores(old_scores, new_scores)
+    snapshot.touch()
+
+
+def rebuild():
+    """Reconstrói todas as estatísticas a partir da tabela ICSProfile"""
+    with transaction.atomic():
+        totals = {
+            'score_index': score_index.rebuild(),
+            'sketch': sketch.rebuild(),
+        }
+        snapshot.touch()
+    return totals
@@ -0,0 +1,88 @@
+"""
+Roteamento de leituras para a réplica
+
+As views de leitura pesada (dashboard, lista e exportação de perfis) são
+marcadas com @replica_reads e, nesses pedidos, as consultas vão para o alias
+ICS_CONFIG['READ_REPLICA']['ALIAS'], se ele existir em DATABASES. Todo o resto,
+inclusive o cálculo, lê e escreve no banco principal.
+
+Leia o que escreveu: um pedido que grava no principal passa a ler dele até o
+fim e a resposta leva o cookie READ_PRIMARY_COOKIE por STICKY_SECONDS; enquanto
+o cookie existir, os pedidos desse cliente também ignoram a réplica, que pode
+estar atrasada.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+READ_PRIMARY_COOKIE = 'ics_read_primary'
+
+
+class RoutingState:
+    """Estado de roteamento de um pedido"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # cliente com escrita recente: só o principal
+        self.replica = False  # pedido para uma view @replica_reads
+        self.wrote = False  # o pedido já escreveu no principal
+
+
+_state = ContextVar('ics_routing_state', default=None)
+
+
+def replica_alias():
+    """Alias da réplica, ou None se não estiver configurada"""
+    alias = settings.ICS_CONFIG['READ_REPLICA']['ALIAS']
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def request_routing(pinned=False):
+    """Escopo de um pedido para o roteador (aberto pelo middleware)"""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def replica_reads(view):
+    """
+    Marca uma view cujas leituras podem ir para a réplica (ativado pelo
+    ReadYourWritesMiddleware, inclusive na renderização do template)
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        return view(*args, **kwargs)
+    wrapped.replica_reads = True
+    return wrapped
+
+
+class ReadReplicaRouter:
+    """
+    Leituras das views @replica_reads na réplica; escritas e demais leituras
+    no principal
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica or state.pinned or state.wrote:
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Principal e réplica têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema junto com os dados
+        return db != replica_alias()
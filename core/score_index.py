@@ -0,0 +1,283 @@
+"""
+Índice de scores mantido incrementalmente (árvore de Fenwick sobre um histograma)
+
+Cada perfil salvo incrementa os nós do seu bucket, de modo que a média e o
+percentil de um score são obtidos lendo O(log n) linhas de ScoreBucket em vez
+de agregar a tabela ICSProfile inteira.
+
+A linha VERSION_ROW fica fora da árvore (que começa em 1) e guarda a versão
+das estatísticas, avançada a cada escrita: é o ETag do dashboard.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ICSProfile, ScoreBucket
+
+
+# Número de buckets do histograma (resolução de 0.001 no score)
+RESOLUTION = 1000
+
+# Linha com a versão das estatísticas (não faz parte da árvore)
+VERSION_ROW = 0
+
+
+def bucket_for(score):
+    """Bucket (1..RESOLUTION) em que um score cai"""
+    return min(max(int(score * RESOLUTION), 0), RESOLUTION - 1) + 1
+
+
+def _update_path(index):
+    """Nós da árvore afetados por uma alteração no bucket"""
+    path = []
+    while index <= RESOLUTION:
+        path.append(index)
+        index += index & -index
+    return path
+
+
+def _query_path(index):
+    """Nós cuja soma resulta no prefixo [1..index]"""
+    path = []
+    while index > 0:
+        path.append(index)
+        index -= index & -index
+    return path
+
+
+def record_scores(scores, sign=1):
+    """
+    Adiciona (ou remove, com sign=-1) scores do índice.
+    Deve ser chamado na mesma transação que grava os perfis. Se faltarem
+    linhas de ScoreBucket (tabela esvaziada), o índice é reconstruído a partir
+    dos perfis, como no snapshot, em vez de perder o score.
+    """
+    scores = [score for score in scores if score is not None]
+
+    if len(scores) == 1:
+        path = _update_path(bucket_for(scores[0]))
+        updated = ScoreBucket.objects.filter(index__in=path).update(
+            count=F('count') + sign,
+            score_sum=F('score_sum') + sign * scores[0]
+        )
+        if updated < len(path):
+            rebuild()
+        return
+
+    _apply_deltas(_deltas(scores, sign))
+
+
+def replace_scores(old_scores, new_scores):
+    """
+    Troca scores de perfis recalculados (remove os antigos e adiciona os
+    novos) numa única passada pelos nós
+    """
+    deltas = _deltas([score for score in old_scores if score is not None], -1)
+    _deltas([score for score in new_scores if score is not None], 1, deltas)
+    _apply_deltas(deltas)
+
+
+def _deltas(scores, sign, deltas=None):
+    """Variação (perfis, soma) de cada nó para os scores informados"""
+    deltas = {} if deltas is None else deltas
+    for score in scores:
+        for index in _update_path(bucket_for(score)):
+            count, total = deltas.get(index, (0, 0.0))
+            deltas[index] = (count + sign, total + sign * score)
+    return deltas
+
+
+def _apply_deltas(deltas):
+    if not deltas:
+        return
+
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Incrementos atômicos, um UPDATE preparado por nó, em ordem de
+            # índice (mesma ordem de travas em todos os escritores)
+            cursor.executemany(
+                f'UPDATE {quote(ScoreBucket._meta.db_table)} '
+                f'SET {quote("count")} = {quote("count")} + %s, '
+                f'{quote("score_sum")} = {quote("score_sum")} + %s '
+                f'WHERE {quote("index")} = %s',
+                [(count, total, index) for index, (count, total) in sorted(deltas.items())]
+            )
+            missing = 0 <= cursor.rowcount < len(deltas)
+        if missing:
+            rebuild()
+
+
+def _supports_update_returning():
+    """UPDATE ... RETURNING existe no PostgreSQL e no SQLite 3.35+"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def record_score(score):
+    """
+    Adiciona um score ao índice, avança a versão das estatísticas e devolve o
+    summary(score) já com ele, em um único UPDATE ... RETURNING: os nós lidos
+    pela consulta entram no mesmo comando com incremento zero, e a linha de
+    versão também. Deve ser chamado na mesma transação que grava o perfil.
+    """
+    if not _supports_update_returning():
+        record_scores([score])
+        touch()
+        return summary(score)
+
+    update_path = _update_path(bucket_for(score))
+    total_path = _query_path(RESOLUTION)
+    below_path = _query_path(bucket_for(score) - 1)
+    nodes = sorted({VERSION_ROW, *update_path, *total_path, *below_path})
+
+    quote = connection.ops.quote_name
+    table = quote(ScoreBucket._meta.db_table)
+    index, count, score_sum, version, updated_at = (
+        quote(name) for name in ('index', 'count', 'score_sum', 'version', 'updated_at')
+    )
+    updated = ', '.join(['%s'] * len(update_path))
+    selected = ', '.join(['%s'] * len(nodes))
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET '
+            f'{count} = {count} + (CASE WHEN {index} IN ({updated}) THEN 1 ELSE 0 END), '
+            f'{score_sum} = {score_sum} + (CASE WHEN {index} IN ({updated}) THEN %s ELSE 0 END), '
+            f'{version} = {version} + (CASE WHEN {index} = %s THEN 1 ELSE 0 END), '
+            f'{updated_at} = (CASE WHEN {index} = %s THEN %s ELSE {updated_at} END) '
+            f'WHERE {index} IN ({selected}) '
+            f'RETURNING {index}, {count}, {score_sum}',
+            [*update_path, *update_path, score, VERSION_ROW, VERSION_ROW, now, *nodes]
+        )
+        values = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    if len(values) < len(nodes):
+        # Nós ou linha de versão faltando: o perfil já gravado entra na reconstrução
+        rebuild()
+        touch()
+        return summary(score)
+
+    return {
+        'total': sum(values[node][0] for node in total_path),
+        'score_sum': sum(values[node][1] for node in total_path),
+        'below': sum(values[node][0] for node in below_path),
+    }
+
+
+def summary(score=None):
+    """
+    Retorna total de perfis, soma dos scores e quantos estão em buckets abaixo
+    do score informado, com uma única consulta
+    """
+    total_path = _query_path(RESOLUTION)
+    below_path = _query_path(bucket_for(score) - 1) if score is not None else []
+
+    nodes = dict(
+        (index, (count, score_sum))
+        for index, count, score_sum in ScoreBucket.objects.filter(
+            index__in=set(total_path) | set(below_path)
+        ).values_list('index', 'count', 'score_sum')
+    )
+
+    total = sum(nodes.get(index, (0, 0))[0] for index in total_path)
+    score_sum = sum(nodes.get(index, (0, 0))[1] for index in total_path)
+    below = sum(nodes.get(index, (0, 0))[0] for index in below_path)
+
+    return {'total': total, 'score_sum': score_sum, 'below': below}
+
+
+def snapshot(boundaries=()):
+    """
+    Total de perfis, soma dos scores, perfis nos buckets 1..b de cada
+    fronteira b, versão e hora da última escrita, com uma única consulta.
+    Retorna None se faltarem linhas (índice ainda não construído).
+    """
+    total_path = _query_path(RESOLUTION)
+    prefix_paths = [_query_path(boundary) for boundary in boundaries]
+    nodes = {VERSION_ROW, *total_path}.union(*prefix_paths)
+
+    rows = {
+        index: row
+        for index, *row in ScoreBucket.objects.filter(index__in=nodes).values_list(
+            'index', 'count', 'score_sum', 'version', 'updated_at'
+        )
+    }
+    if len(rows) < len(nodes):
+        return None
+
+    version, updated_at = rows[VERSION_ROW][2:]
+    return {
+        'total': sum(rows[index][0] for index in total_path),
+        'score_sum': sum(rows[index][1] for index in total_path),
+        'prefixes': [sum(rows[index][0] for index in path) for path in prefix_paths],
+        'version': version,
+        'updated_at': updated_at,
+    }
+
+
+def touch():
+    """Avança a versão das estatísticas (criando a linha, se faltar)"""
+    now = timezone.now()
+    updated = ScoreBucket.objects.filter(index=VERSION_ROW).update(
+        version=F('version') + 1, updated_at=now
+    )
+    if not updated:
+        ScoreBucket.objects.get_or_create(index=VERSION_ROW, defaults={'version': 1, 'updated_at': now})
+
+
+def average_score(stats=None):
+    """Score médio de todos os perfis calculados"""
+    stats = stats or summary()
+    return stats['score_sum'] / stats['total'] if stats['total'] else 0
+
+
+def percentile(score, stats=None):
+    """Percentil do score (fração de perfis em buckets inferiores)"""
+    stats = stats or summary(score)
+    if stats['total'] == 0:
+        return 50  # Percentil neutro se não há dados
+    return (stats['below'] / stats['total']) * 100
+
+
+def build_tree(scores):
+    """Monta os nós da árvore (contagem e soma) a partir de um iterável de scores"""
+    counts = [0] * (RESOLUTION + 1)
+    sums = [0.0] * (RESOLUTION + 1)
+
+    for score in scores:
+        index = bucket_for(score)
+        counts[index] += 1
+        sums[index] += score
+
+    for index in range(1, RESOLUTION + 1):
+        parent = index + (index & -index)
+        if parent <= RESOLUTION:
+            counts[parent] += counts[index]
+            sums[parent] += sums[index]
+
+    return counts, sums
+
+
+def rebuild():
+    """
+    Reconstrói a árvore do zero a partir da tabela ICSProfile (a linha de
+    versão é mantida; quem reconstrói avança a versão com touch())
+    """
+    with transaction.atomic():
+        scores = ICSProfile.objects.filter(
+            ics_score__isnull=False
+        ).order_by().values_list('ics_score', flat=True).iterator(chunk_size=10000)
+        counts, sums = build_tree(scores)
+
+        ScoreBucket.objects.exclude(index=VERSION_ROW).delete()
+        ScoreBucket.objects.bulk_create([
+            ScoreBucket(index=index, count=counts[index], score_sum=sums[index])
+            for index in range(1, RESOLUTION + 1)
+        ])
+
+    return sum(counts[index] for index in _query_path(RESOLUTION))
@@ -0,0 +1,255 @@
+"""
+Simulação de pesos ("e se?") sobre a matriz de componentes
+
+Os componentes normalizados de todos os perfis calculados (colunas
+component_*) são carregados uma vez em uma matriz NumPy n x 5 por processo.
+Os scores de todos os candidatos saem de operações vetorizadas sobre essa
+matriz (uma coluna de resultado por candidato), sem gravar nada.
+
+A matriz é recarregada quando a versão do snapshot muda (algum perfil foi
+gravado), mas no máximo a cada ICS_CONFIG['WHAT_IF']['MAX_STALENESS']
+segundos: as simulações toleram alguns segundos de atraso e a carga de 1M
+perfis custa cerca de um segundo.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from . import snapshot, weight_sets
+from .models import ICSProfile
+from .sketch import DASHBOARD_QUANTILES
+
+# Rótulos das faixas, os mesmos de score_distribution no dashboard
+BANDS = ['baixo (0-0.4)', 'médio (0.4-0.7)', 'alto (0.7-1.0)']
+
+HISTOGRAM_BINS = 10
+
+
+class ComponentMatrix:
+    """Ids e componentes (na ordem de weight_sets.COMPONENTS) dos perfis calculados"""
+
+    def __init__(self, ids, components, version):
+        self.ids = ids
+        self.components = components
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.baseline = None  # (pesos, Scoring) dos pesos atuais
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, using, version):
+        """
+        Lê a matriz do banco (perfis sem componentes ficam de fora); version é
+        a versão do snapshot lida antes, de modo que uma escrita no meio só
+        antecipa a próxima recarga
+        """
+        queryset = ICSProfile.objects.using(using).filter(
+            ics_score__isnull=False, component_fiscal__isnull=False
+        ).order_by('id').values_list(
+            'id', *(f'component_{name}' for name in weight_sets.COMPONENTS)
+        )
+
+        # Cursor direto: para 1M linhas, o values_list do ORM dobraria o tempo
+        sql, params = queryset.query.sql_with_params()
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = np.array(cursor.fetchall(), dtype=float).reshape(-1, len(weight_sets.COMPONENTS) + 1)
+        return cls(rows[:, 0].astype(np.int64), np.ascontiguousarray(rows[:, 1:]), version)
+
+
+_matrices = {}
+_lock = threading.Lock()
+
+
+def get_matrix():
+    """Matriz do processo para o banco de leitura atual, recarregada se estiver desatualizada"""
+    alias = ICSProfile.objects.all().db
+    matrix = _matrices.get(alias)
+    if matrix is not None and time.monotonic() - matrix.loaded_at < settings.ICS_CONFIG['WHAT_IF']['MAX_STALENESS']:
+        return matrix
+
+    version = snapshot.get_snapshot().version
+    if matrix is not None and matrix.version == version:
+        matrix.loaded_at = time.monotonic()
+        return matrix
+
+    with _lock:
+        if _matrices.get(alias) is matrix:
+            _matrices[alias] = ComponentMatrix.load(alias, version)
+        return _matrices[alias]
+
+
+def reset_matrices():
+    """Força a recarga na próxima simulação"""
+    _matrices.clear()
+
+
+def score_matrix(components, candidates):
+    """
+    Scores (n x k) de k conjuntos de pesos. Soma ponderada das colunas na
+    mesma ordem de calculate_ics, em vez de components @ W: o resultado não
+    depende do caminho escolhido pelo BLAS e os pesos atuais reproduzem os
+    scores gravados bit a bit, sem falsas mudanças de posição em empates.
+    """
+    weights = np.array(
+        [[float(candidate[name]) for candidate in candidates] for name in weight_sets.COMPONENTS]
+    )
+    total = components[:, [0]] * weights[0]
+    for column in range(1, len(weight_sets.COMPONENTS)):
+        total += components[:, [column]] * weights[column]
+    return np.clip(total, 0, 1)
+
+
+class Scoring:
+    """Scores de um conjunto de pesos sobre a matriz, com faixas e posições"""
+
+    def __init__(self, scores):
+        self.scores = scores
+        self.bands = np.searchsorted(
+            [snapshot.MEDIUM_THRESHOLD, snapshot.HIGH_THRESHOLD], scores, side='right'
+        )
+        self.ranks, self.ordered = ranks(scores)
+
+    def distribution(self):
+        """Média, quantis, histograma e contagem por faixa"""
+        if not len(self.scores):
+            return {'mean': 0, 'quantiles': {}, 'histogram': [], 'bands': dict.fromkeys(BANDS, 0)}
+
+        counts, edges = np.histogram(self.scores, bins=HISTOGRAM_BINS, range=(0, 1))
+        return {
+            'mean': round(float(self.scores.mean()), 4),
+            'quantiles': {
+                name: round(sorted_quantile(self.ordered[::-1], fraction), 4)
+                for name, fraction in DASHBOARD_QUANTILES.items()
+            },
+            'histogram': [
+                {'from': round(float(low), 2), 'to': round(float(high), 2), 'count': int(count)}
+                for low, high, count in zip(edges[:-1], edges[1:], counts)
+            ],
+            'bands': dict(zip(BANDS, np.bincount(self.bands, minlength=len(BANDS)).tolist())),
+        }
+
+
+def ranks(scores):
+    """
+    Posição de cada perfil do maior para o menor score (1 = maior; empates
+    recebem a posição do primeiro do grupo) e os scores em ordem decrescente
+    """
+    # Ordenação não estável: os empates são resolvidos pelos grupos abaixo
+    order = np.argsort(-scores)
+    ordered = scores[order]
+    starts = np.empty(len(scores), dtype=bool)
+    starts[:1] = True
+    np.not_equal(ordered[1:], ordered[:-1], out=starts[1:])
+    positions = np.where(starts, np.arange(1, len(scores) + 1), 0)
+
+    result = np.empty(len(scores), dtype=np.int64)
+    result[order] = np.maximum.accumulate(positions)
+    return result, ordered
+
+
+def sorted_quantile(ordered, fraction):
+    """Quantil (interpolação linear, como np.quantile) de um vetor já ordenado"""
+    position = fraction * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return float(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+
+
+def top_indexes(values, count):
+    """Índices dos count maiores valores positivos, do maior para o menor"""
+    if count < len(values):
+        indexes = np.argpartition(-values, count)[:count]
+    else:
+        indexes = np.arange(len(values))
+    indexes = indexes[np.argsort(-values[indexes], kind='stable')]
+    return indexes[values[indexes] > 0]
+
+
+def baseline_scoring(matrix, weights):
+    """Scoring dos pesos atuais, guardado na matriz enquanto os pesos não mudarem"""
+    key = tuple(float(weights[name]) for name in weight_sets.COMPONENTS)
+    cached = matrix.baseline
+    if cached is None or cached[0] != key:
+        cached = matrix.baseline = (key, Scoring(score_matrix(matrix.components, [weights])[:, 0]))
+    return cached[1]
+
+
+def simulate(candidates, profile_ids=(), top=10, matrix=None):
+    """
+    Avalia pesos candidatos (dicionários completos, na ordem pedida) contra os
+    pesos atuais sobre os perfis da matriz: distribuição, mudanças de faixa e
+    deslocamentos de posição de cada candidato
+    """
+    if matrix is None:
+        matrix = get_matrix()
+    baseline_weights = settings.ICS_CONFIG['DEFAULT_WEIGHTS']
+    baseline = baseline_scoring(matrix, baseline_weights)
+
+    # Uma coluna por candidato
+    scores = score_matrix(matrix.components, candidates)
+
+    # Perfis pedidos que estão na matriz (ids em ordem crescente)
+    requested = np.array(sorted(set(profile_ids)), dtype=np.int64)
+    positions = np.searchsorted(matrix.ids, requested)
+    found = positions < len(matrix)
+    found[found] = matrix.ids[positions[found]] == requested[found]
+    positions = positions[found]
+
+    results = []
+    for column, candidate in enumerate(candidates):
+        scoring = Scoring(np.ascontiguousarray(scores[:, column]))
+        # Positivo: o perfil subiu no ranking
+        shifts = baseline.ranks - scoring.ranks
+        absolute = np.abs(shifts)
+
+        # Perfis que trocam de faixa (atual -> candidato)
+        transitions = np.bincount(
+            baseline.bands * len(BANDS) + scoring.bands, minlength=len(BANDS) ** 2
+        ).reshape(len(BANDS), len(BANDS))
+
+        def shift(index):
+            return {
+                'profile_id': int(matrix.ids[index]),
+                'baseline_score': round(float(baseline.scores[index]), 4),
+                'score': round(float(scoring.scores[index]), 4),
+                'baseline_rank': int(baseline.ranks[index]),
+                'rank': int(scoring.ranks[index]),
+                'rank_shift': int(shifts[index]),
+            }
+
+        results.append({
+            'weights': {name: float(candidate[name]) for name in weight_sets.COMPONENTS},
+            'distribution': scoring.distribution(),
+            'band_changes': {
+                source: {
+                    target: int(transitions[i, j])
+                    for j, target in enumerate(BANDS) if i != j and transitions[i, j]
+                }
+                for i, source in enumerate(BANDS)
+            },
+            'rank_shift': {
+                'changed': int(np.count_nonzero(shifts)),
+                'mean_abs': round(float(absolute.mean()), 2) if len(matrix) else 0,
+                'p90_abs': int(np.percentile(absolute, 90, method='lower')) if len(matrix) else 0,
+                'max_abs': int(absolute.max()) if len(matrix) else 0,
+            },
+            'top_movers': [shift(index) for index in top_indexes(absolute, top)],
+            'profiles': [shift(index) for index in positions],
+        })
+
+    return {
+        'profiles': len(matrix),
+        'snapshot_version': matrix.version,
+        'baseline': {
+            'weights': {name: float(baseline_weights[name]) for name in weight_sets.COMPONENTS},
+            'distribution': baseline.distribution(),
+        },
+        'candidates': results,
+        'missing_profile_ids': requested[~found].tolist(),
+    }
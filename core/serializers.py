@@ -1,5 +1,9 @@
+import math
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import ICSProfile, CalculationLog
+from .weight_sets import COMPONENTS
 
 
 class ICSProfileSerializer(serializers.ModelSerializer):
@@ -15,7 +19,9 @@ class ICSProfileSerializer(serializers.ModelSerializer):
             'father_job', 'father_salary', 'mother_job', 'mother_salary',
             'family_property_value', 'family_financial_value',
             'inheritance_status', 'benefits_value', 'tax_paid',
-            'ics_score', 'ics_explanation', 'ics_confidence',
+            'ics_score', 'ics_explanation', 'ics_confidence', 'weights_version',
+            'component_fiscal', 'component_job', 'component_patrimony',
+            'component_transfers', 'component_benefits',
             'raw_data'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'ics_score', 'ics_explanation', 'ics_confidence']
@@ -69,6 +75,39 @@ class ICSResultSerializer(serializers.Serializer):
     percentile = serializers.FloatField(required=False)
 
 
+class WeightSimulationSerializer(serializers.Serializer):
+    """
+    Serializador para a simulação de pesos: cada candidato informa só os
+    pesos que mudam, os demais vêm de ICS_CONFIG['DEFAULT_WEIGHTS']
+    """
+    candidates = serializers.ListField(
+        child=serializers.DictField(child=serializers.FloatField()),
+        allow_empty=False
+    )
+    profile_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    top = serializers.IntegerField(min_value=0, max_value=100, default=10)
+
+    def validate_candidates(self, candidates):
+        limit = settings.ICS_CONFIG['WHAT_IF']['MAX_CANDIDATES']
+        if len(candidates) > limit:
+            raise serializers.ValidationError(f'No máximo {limit} candidatos por simulação')
+        for weights in candidates:
+            unknown = set(weights) - set(COMPONENTS)
+            if unknown:
+                raise serializers.ValidationError(
+                    f'Componentes desconhecidos: {", ".join(sorted(unknown))} (use {", ".join(COMPONENTS)})'
+                )
+            if not all(math.isfinite(value) for value in weights.values()):
+                raise serializers.ValidationError('Os pesos devem ser números finitos')
+        return [{**settings.ICS_CONFIG['DEFAULT_WEIGHTS'], **weights} for weights in candidates]
+
+    def validate_profile_ids(self, profile_ids):
+        limit = settings.ICS_CONFIG['WHAT_IF']['MAX_PROFILE_IDS']
+        if len(profile_ids) > limit:
+            raise serializers.ValidationError(f'No máximo {limit} perfis por simulação')
+        return profile_ids
+
+
 class DashboardStatsSerializer(serializers.Serializer):
     """
     Serializador para estatísticas do dashboard
@@ -76,6 +115,7 @@ class DashboardStatsSerializer(serializers.Serializer):
     total_profiles = serializers.IntegerField()
     avg_ics_score = serializers.FloatField()
     median_ics_score = serializers.FloatField()
+    quantiles = serializers.DictField(child=serializers.FloatField())
     score_distribution = serializers.DictField()
     recent_calculations = ICSResultSerializer(many=True)
 
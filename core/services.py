@@ -1,9 +1,30 @@
-import requests
 import json
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import connections, transaction
 from django.utils import timezone
-from .models import APICache, CalculationLog, ICSProfile
+from .models import APICache, CalculationLog, ICSProfile, Municipality
+from .cache import LRUCache
+from .singleflight import SingleFlight, db_lock, wait_for_release
+from .utils import normalize_text
+from . import http_client, matching, rollups, weight_sets
+
+
+# Campos considerados no cálculo de confiança
+CONFIDENCE_FIELDS = [
+    'tax_paid', 'father_salary', 'mother_salary',
+    'family_property_value', 'family_financial_value',
+    'inheritance_status', 'benefits_value', 'birth_pib_per_capita'
+]
+
+
+def component_fields(components):
+    """Campos component_* de ICSProfile a partir dos componentes de um resultado"""
+    components = components or {}
+    return {f'component_{name}': components.get(name) for name in weight_sets.COMPONENTS}
 
 
 class ICSCalculationService:
@@ -11,8 +32,8 @@ class ICSCalculationService:
     Serviço responsável pelo cálculo do ICS baseado nos dados do perfil
     """
     
-    def __init__(self):
-        self.weights = settings.ICS_CONFIG['DEFAULT_WEIGHTS']
+    def __init__(self, weights=None):
+        self.weights = weights or settings.ICS_CONFIG['DEFAULT_WEIGHTS']
     
     def calculate_ics(self, profile_data):
         """
@@ -75,6 +96,139 @@ class ICSCalculationService:
                 'confidence': 0
             }
     
+    def calculate_many(self, rows):
+        """
+        Calcula o ICS de vários perfis de uma vez, com os dados em colunas NumPy.
+        Segue exatamente a mesma normalização e os mesmos pesos de calculate_ics.
+        """
+        if not rows:
+            return []
+        
+        components = self._normalize_columns(rows)
+        
+        # Mesma ordem de soma de calculate_ics para obter resultados idênticos
+        ics = (
+            self.weights['fiscal'] * components['fiscal'] +
+            self.weights['job'] * components['job'] +
+            self.weights['patrimony'] * components['patrimony'] +
+            self.weights['transfers'] * components['transfers'] +
+            self.weights['benefits'] * components['benefits']
+        )
+        ics = np.clip(ics, 0, 1)
+        
+        filled = np.zeros(len(rows))
+        for key in CONFIDENCE_FIELDS:
+            filled += self._column(rows, key, is_filled=True)
+        confidence = filled / len(CONFIDENCE_FIELDS)
+        
+        results = []
+        for i in range(len(rows)):
+            fiscal = float(components['fiscal'][i])
+            job = float(components['job'][i])
+            patrimony = float(components['patrimony'][i])
+            transfers = float(components['transfers'][i])
+            benefits = float(components['benefits'][i])
+            score = float(ics[i])
+            
+            results.append({
+                'ics_score': score,
+                'explanation': self._generate_explanation(
+                    fiscal, job, patrimony, transfers, benefits, score
+                ),
+                'confidence': float(confidence[i]),
+                'components': {
+                    'fiscal': fiscal,
+                    'job': job,
+                    'patrimony': patrimony,
+                    'transfers': transfers,
+                    'benefits': benefits
+                }
+            })
+        
+        return results
+    
+    def _normalize_columns(self, rows):
+        """Normaliza todos os componentes como vetores (equivalente aos _normalize_*)"""
+        tax_paid = self._column(rows, 'tax_paid')
+        income = self._column(rows, 'father_salary') + self._column(rows, 'mother_salary')
+        patrimony = (
+            self._column(rows, 'family_property_value') +
+            self._column(rows, 'family_financial_value')
+        )
+        # Ausência do campo equivale a 'sem', como em calculate_ics
+        transfers = np.fromiter(
+            (row.get('inheritance_status', 'sem') == 'sem' for row in rows),
+            dtype=float, count=len(rows)
+        )
+        benefits = self._column(rows, 'benefits_value')
+        
+        return {
+            'fiscal': np.minimum(tax_paid / 10000, 1.0),
+            'job': np.minimum(income / 20000, 1.0),
+            'patrimony': np.minimum(patrimony / 500000, 1.0),
+            'transfers': transfers,
+            'benefits': np.minimum(benefits / 10000, 1.0),
+        }
+    
+    def _column(self, rows, key, is_filled=False):
+        """Extrai uma coluna dos dados (valores nulos viram 0)"""
+        if is_filled:
+            values = (row.get(key) is not None for row in rows)
+        else:
+            values = (row.get(key) or 0 for row in rows)
+        return np.fromiter(values, dtype=float, count=len(rows))
+    
+    def save_many(self, rows, results, chunk_size=None):
+        """
+        Persiste perfis e logs calculados em lote, com um bulk insert por bloco
+        """
+        chunk_size = chunk_size or settings.ICS_CONFIG['BATCH_CHUNK_SIZE']
+        weights_version = weight_sets.current_version(self.weights)
+        profiles = []
+        
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start:start + chunk_size]
+            chunk_results = results[start:start + chunk_size]
+            
+            with transaction.atomic():
+                chunk_profiles = ICSProfile.objects.bulk_create([
+                    ICSProfile(
+                        birth_place=data.get('birth_place'),
+                        birth_pib_per_capita=data.get('birth_pib_per_capita'),
+                        father_job=data.get('father_job'),
+                        father_salary=data.get('father_salary'),
+                        mother_job=data.get('mother_job'),
+                        mother_salary=data.get('mother_salary'),
+                        family_property_value=data.get('family_property_value'),
+                        family_financial_value=data.get('family_financial_value'),
+                        inheritance_status=data.get('inheritance_status'),
+                        benefits_value=data.get('benefits_value'),
+                        tax_paid=data.get('tax_paid'),
+                        ics_score=result.get('ics_score'),
+                        ics_explanation=result.get('explanation'),
+                        ics_confidence=result.get('confidence'),
+                        weights_version=weights_version,
+                        raw_data=data,
+                        **component_fields(result.get('components'))
+                    )
+                    for data, result in zip(chunk_rows, chunk_results)
+                ])
+                CalculationLog.objects.bulk_create([
+                    CalculationLog(
+                        profile=profile,
+                        calculation_data=data,
+                        weights_used=self.weights,
+                        result=result.get('ics_score', 0)
+                    )
+                    for profile, data, result in zip(chunk_profiles, chunk_rows, chunk_results)
+                ])
+                # bulk_create não dispara post_save: estatísticas atualizadas aqui
+                rollups.record_scores(profile.ics_score for profile in chunk_profiles)
+            
+            profiles.extend(chunk_profiles)
+        
+        return profiles
+    
     def _normalize_fiscal(self, tax_paid):
         """Normaliza valores de impostos pagos"""
         return min(tax_paid / 10000, 1.0) if tax_paid else 0
@@ -97,7 +251,8 @@ class ICSCalculationService:
         """Normaliza benefícios sociais"""
         return min((benefits_value or 0) / 10000, 1.0)
     
-    def _generate_explanation(self, fiscal, job, patrimony, transfers, benefits, ics):
+    @staticmethod
+    def _generate_explanation(fiscal, job, patrimony, transfers, benefits, ics):
         """Gera explicação do cálculo em linguagem natural"""
         components = []
         
@@ -136,16 +291,67 @@ class ICSCalculationService:
     
     def _calculate_confidence(self, profile_data):
         """Calcula nível de confiança baseado na completude dos dados"""
-        total_fields = 8  # número de campos principais
-        filled_fields = sum(1 for key in [
-            'tax_paid', 'father_salary', 'mother_salary',
-            'family_property_value', 'family_financial_value',
-            'inheritance_status', 'benefits_value', 'birth_pib_per_capita'
-        ] if profile_data.get(key) is not None)
+        total_fields = len(CONFIDENCE_FIELDS)  # número de campos principais
+        filled_fields = sum(1 for key in CONFIDENCE_FIELDS if profile_data.get(key) is not None)
         
         return filled_fields / total_fields
 
 
+# Cache em memória compartilhado pelas instâncias de ExternalAPIService do worker
+local_cache = LRUCache(
+    maxsize=settings.ICS_CONFIG['LOCAL_CACHE_SIZE'],
+    ttl=settings.ICS_CONFIG['LOCAL_CACHE_TIMEOUT']
+)
+
+
+# Buscas externas em andamento neste worker, por chave de cache
+single_flight = SingleFlight()
+
+# Entrada de cache servível: dados, se é um "não encontrado" e se já passou do soft TTL
+CacheEntry = namedtuple('CacheEntry', ['data', 'negative', 'stale'])
+
+# Pool para atualizações de cache em segundo plano (stale-while-revalidate)
+refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ics-cache-refresh')
+
+# Pool limitado para consultas externas concorrentes (enriquecimento de dados)
+enrichment_pool = ThreadPoolExecutor(
+    max_workers=settings.ICS_CONFIG['ENRICHMENT_WORKERS'],
+    thread_name_prefix='ics-enrichment'
+)
+
+
+def run_concurrently(calls, timeout=None):
+    """
+    Executa chamadas independentes em paralelo com prazo total.
+    Recebe {nome: (função, *args)} e retorna {nome: resultado} apenas das
+    chamadas concluídas dentro do prazo; exceções são propagadas. Mesmo uma
+    chamada única vai para o pool, para respeitar o prazo.
+    """
+    if not calls:
+        return {}
+    
+    def run_in_thread(func, *args):
+        try:
+            return func(*args)
+        finally:
+            # Conexões de banco são por thread: não deixá-las abertas no pool
+            connections.close_all()
+    
+    futures = {
+        name: enrichment_pool.submit(run_in_thread, func, *args)
+        for name, (func, *args) in calls.items()
+    }
+    done, not_done = wait(futures.values(), timeout=timeout)
+    for future in not_done:
+        future.cancel()
+    
+    return {
+        name: future.result()
+        for name, future in futures.items()
+        if future in done
+    }
+
+
 class ExternalAPIService:
     """
     Serviço para integração com APIs externas (IBGE, RAIS, etc.)
@@ -157,45 +363,147 @@ class ExternalAPIService:
     
     def get_municipality_data(self, municipality_name, state_code=None):
         """
-        Busca dados do município via API do IBGE
+        Busca dados do município no catálogo local (import_municipalities).
+        Sem catálogo importado, recorre à API do IBGE.
+        """
+        state_code = state_code.upper() if state_code else state_code
+        local_key = f"municipality_{normalize_text(municipality_name)}_{state_code}"
+        found, result = local_cache.get(local_key)
+        if found:
+            return result
+        
+        result = self._find_local_municipality(municipality_name, state_code)
+        if result or Municipality.objects.exists():
+            local_cache.set(local_key, result)
+            return result
+        
+        return self._fetch_municipality_data(municipality_name, state_code)
+    
+    def _find_local_municipality(self, municipality_name, state_code=None):
+        """
+        Busca no índice de nome normalizado (sem acento/caixa) + UF
+        """
+        normalized_name = normalize_text(municipality_name)
+        if not normalized_name:
+            return None
+        
+        municipalities = Municipality.objects.all()
+        if state_code:
+            municipalities = municipalities.filter(state=state_code.upper())
+        
+        muni = (
+            municipalities.filter(normalized_name=normalized_name).first() or
+            municipalities.filter(normalized_name__startswith=normalized_name).order_by('ibge_code').first()
+        )
+        if not muni:
+            return None
+        
+        pib_per_capita = muni.pib_per_capita
+        if pib_per_capita is None:
+            pib_per_capita = self._get_municipality_pib(muni.ibge_code).get('pib_per_capita', 0)
+        
+        return {
+            'municipality_id': muni.ibge_code,
+            'name': muni.name,
+            'state': muni.state,
+            'pib_per_capita': pib_per_capita
+        }
+    
+    def _fetch_municipality_data(self, municipality_name, state_code=None):
+        """
+        Busca dados do município via API do IBGE (com cache e coalescência)
         """
         cache_key = f"ibge_municipality_{municipality_name}_{state_code}"
         
-        # Verificar cache
-        cached_data = self._get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
+        return self._get_or_fetch(
+            cache_key,
+            lambda: self._download_municipality_data(municipality_name, state_code)
+        )
+    
+    def _download_municipality_data(self, municipality_name, state_code=None):
+        """
+        Baixa a lista de municípios do IBGE e procura o município.
+        Retorna None se não existir; falhas de rede/HTTP geram exceção
+        (e não são cacheadas como "não encontrado").
+        """
+        # Buscar município
+        url = f"{self.ibge_base}/localidades/municipios"
+        response = http_client.get(url)
+        response.raise_for_status()
+        
+        municipalities = response.json()
+        for muni in municipalities:
+            if municipality_name.lower() in muni['nome'].lower():
+                if not state_code or muni['microrregiao']['mesorregiao']['UF']['sigla'] == state_code:
+                    # Buscar PIB do município
+                    pib_data = self._get_municipality_pib(muni['id'])
+                    
+                    return {
+                        'municipality_id': muni['id'],
+                        'name': muni['nome'],
+                        'state': muni['microrregiao']['mesorregiao']['UF']['sigla'],
+                        'pib_per_capita': pib_data.get('pib_per_capita', 0)
+                    }
+        
+        return None
+    
+    def _get_or_fetch(self, cache_key, fetch):
+        """
+        Retorna o dado em cache ou executa a busca uma única vez por chave:
+        threads do mesmo worker compartilham a busca em andamento e, entre
+        workers, só quem obtém a trava em CacheLock busca; os demais aguardam
+        o resultado no APICache.
+        Entradas obsoletas (soft TTL vencido) são servidas imediatamente
+        enquanto uma atualização roda em segundo plano; "não encontrado"
+        também fica em cache, com TTL próprio.
+        """
+        entry = self._get_cache_entry(cache_key)
+        if entry:
+            if entry.stale:
+                self._refresh_in_background(cache_key, fetch)
+            return None if entry.negative else entry.data
         
         try:
-            # Buscar município
-            url = f"{self.ibge_base}/localidades/municipios"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                municipalities = response.json()
-                for muni in municipalities:
-                    if municipality_name.lower() in muni['nome'].lower():
-                        if not state_code or muni['microrregiao']['mesorregiao']['UF']['sigla'] == state_code:
-                            # Buscar PIB do município
-                            pib_data = self._get_municipality_pib(muni['id'])
-                            
-                            result = {
-                                'municipality_id': muni['id'],
-                                'name': muni['nome'],
-                                'state': muni['microrregiao']['mesorregiao']['UF']['sigla'],
-                                'pib_per_capita': pib_data.get('pib_per_capita', 0)
-                            }
-                            
-                            # Cachear resultado
-                            self._cache_data(cache_key, result)
-                            return result
-            
-            return None
-            
+            return single_flight.do(cache_key, lambda: self._fetch_once(cache_key, fetch))
         except Exception as e:
-            print(f"Erro ao buscar dados do município: {e}")
+            print(f"Erro ao buscar dados externos ({cache_key}): {e}")
             return None
     
+    def _fetch_once(self, cache_key, fetch, wait=True):
+        lock_timeout = settings.ICS_CONFIG['LOCK_TIMEOUT']
+        
+        with db_lock(cache_key, lock_timeout) as acquired:
+            if not acquired:
+                if not wait:
+                    return None
+                wait_for_release(
+                    cache_key, lock_timeout, settings.ICS_CONFIG['LOCK_POLL_INTERVAL']
+                )
+            
+            # Outro worker pode ter preenchido o cache enquanto aguardávamos
+            entry = self._get_cache_entry(cache_key)
+            if entry and not entry.stale:
+                return None if entry.negative else entry.data
+            
+            result = fetch()
+            self._cache_data(cache_key, result, negative=result is None)
+            return result
+    
+    def _refresh_in_background(self, cache_key, fetch):
+        """
+        Atualiza uma entrada obsoleta sem bloquear o pedido. Se outro worker
+        já está atualizando a chave, não faz nada.
+        """
+        def refresh():
+            try:
+                single_flight.do(cache_key, lambda: self._fetch_once(cache_key, fetch, wait=False))
+            except Exception as e:
+                print(f"Erro ao atualizar cache ({cache_key}): {e}")
+            finally:
+                connections.close_all()
+        
+        refresh_pool.submit(refresh)
+    
     def _get_municipality_pib(self, municipality_id):
         """
         Busca dados de PIB do município
@@ -209,63 +517,80 @@ class ExternalAPIService:
     
     def get_job_salary_data(self, job_title):
         """
-        Busca dados salariais de uma profissão (mock para o MVP)
+        Busca dados salariais de uma profissão na tabela de ocupações
+        (matcher compilado em memória, sem consulta ao banco por chamada)
         """
-        cache_key = f"job_salary_{job_title}"
-        
-        cached_data = self._get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
-        
-        # Mock de dados salariais por profissão
-        job_salaries = {
-            'médico': 15000,
-            'enfermeiro': 4500,
-            'professor': 3500,
-            'engenheiro': 8000,
-            'advogado': 7000,
-            'técnico': 3000,
-            'vendedor': 2500,
-            'auxiliar': 1800,
-            'gerente': 6000,
-            'analista': 5000
-        }
-        
-        # Busca aproximada
-        for job, salary in job_salaries.items():
-            if job.lower() in job_title.lower():
-                result = {'average_salary': salary}
-                self._cache_data(cache_key, result)
-                return result
+        occupation = matching.get_matcher().match(job_title)
+        if occupation:
+            return dict(occupation)
         
         # Salário padrão se não encontrar
-        result = {'average_salary': 2500}
-        self._cache_data(cache_key, result)
-        return result
+        return {'average_salary': 2500}
     
-    def _get_cached_data(self, cache_key):
+    @staticmethod
+    def cache_stats():
+        """
+        Contadores do cache em memória deste worker
         """
-        Recupera dados do cache se ainda válidos
+        return local_cache.stats()
+    
+    def _get_cache_entry(self, cache_key):
+        """
+        Recupera a entrada de cache ainda servível (antes do hard TTL):
+        primeiro da memória do worker, depois da tabela APICache.
+        A memória guarda apenas entradas frescas.
         """
+        found, entry = local_cache.get(cache_key)
+        if found:
+            return entry
+        
+        now = timezone.now()
         try:
             cache_entry = APICache.objects.get(
                 cache_key=cache_key,
-                expires_at__gt=timezone.now()
+                expires_at__gt=now
             )
-            return cache_entry.data
         except APICache.DoesNotExist:
             return None
+        
+        fresh_until = cache_entry.stale_at or cache_entry.expires_at
+        entry = CacheEntry(cache_entry.data, cache_entry.is_negative, stale=fresh_until <= now)
+        if not entry.stale:
+            local_cache.set(cache_key, entry, ttl=(fresh_until - now).total_seconds())
+        return entry
+    
+    def _get_cached_data(self, cache_key):
+        """
+        Recupera dados do cache se ainda servíveis (None para ausência ou
+        resultado "não encontrado")
+        """
+        entry = self._get_cache_entry(cache_key)
+        if entry and not entry.negative:
+            return entry.data
+        return None
     
-    def _cache_data(self, cache_key, data):
+    def _cache_data(self, cache_key, data, negative=False):
         """
-        Armazena dados no cache
+        Armazena dados no cache (memória e APICache). Resultados positivos
+        ficam frescos por CACHE_TIMEOUT e ainda servíveis por mais
+        CACHE_STALE_TIMEOUT; "não encontrado" vale por NEGATIVE_CACHE_TIMEOUT.
         """
-        expires_at = timezone.now() + timedelta(seconds=self.cache_timeout)
+        now = timezone.now()
+        if negative:
+            fresh_for = settings.ICS_CONFIG['NEGATIVE_CACHE_TIMEOUT']
+            stale_for = 0
+        else:
+            fresh_for = self.cache_timeout
+            stale_for = settings.ICS_CONFIG['CACHE_STALE_TIMEOUT']
+        stale_at = now + timedelta(seconds=fresh_for)
         
         APICache.objects.update_or_create(
             cache_key=cache_key,
             defaults={
-                'data': data,
-                'expires_at': expires_at
+                'data': {} if negative else data,
+                'is_negative': negative,
+                'stale_at': stale_at,
+                'expires_at': stale_at + timedelta(seconds=stale_for)
             }
-        ) 
\ No newline at end of file
+        )
+        local_cache.set(cache_key, CacheEntry(data, negative, stale=False), ttl=fresh_for)
@@ -0,0 +1,39 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import rollups, snapshot
+from .models import ICSProfile
+from .services import ICSCalculationService
+
+
+@receiver(post_save, sender=ICSProfile)
+def profile_created(sender, instance, created, raw=False, **kwargs):
+    """
+    Atualiza as estatísticas quando um perfil é criado; edições só avançam
+    a versão do snapshot (a lista de recentes pode ter mudado)
+    """
+    if raw:
+        return
+    if created:
+        rollups.record_scores([instance.ics_score])
+    else:
+        snapshot.touch()
+
+
+@receiver(post_delete, sender=ICSProfile)
+def profile_deleted(sender, instance, **kwargs):
+    """Atualiza as estatísticas quando um perfil é removido"""
+    rollups.forget_scores([instance.ics_score])
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    """
+    Disponibiliza a explicação do score em SQL no SQLite, para que o
+    recálculo com novos pesos seja um único UPDATE (weight_sets.rescore_with_sql)
+    """
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'ics_explanation', 6, ICSCalculationService._generate_explanation, deterministic=True
+        )
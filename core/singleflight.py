@@ -0,0 +1,131 @@
+"""
+Coalescência de buscas concorrentes pela mesma chave de cache (single-flight)
+
+Dentro de um processo, só a primeira thread que pede uma chave executa a
+busca; as demais esperam e recebem o mesmo resultado. Entre processos
+(workers do gunicorn), uma linha em CacheLock funciona como trava consultiva:
+quem não obtém a trava aguarda até que o dono a libere.
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import CacheLock
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Garante uma única execução em andamento por chave dentro do processo
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Executa func() para a chave ou aguarda a execução já em andamento"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+_owner = None
+_owner_pid = None
+_owner_lock = threading.Lock()
+
+
+def owner():
+    """
+    Identificador deste processo como dono de travas; recalculado após um
+    fork, para que os workers não compartilhem o do processo pai
+    """
+    global _owner, _owner_pid
+
+    if _owner is None or _owner_pid != os.getpid():
+        with _owner_lock:
+            if _owner is None or _owner_pid != os.getpid():
+                _owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                _owner_pid = os.getpid()
+    return _owner
+
+
+def acquire_lock(cache_key, timeout):
+    """Tenta obter a trava da chave; travas expiradas são substituídas"""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            CacheLock.objects.filter(cache_key=cache_key, expires_at__lte=now).delete()
+            CacheLock.objects.create(
+                cache_key=cache_key,
+                owner=owner(),
+                expires_at=now + timedelta(seconds=timeout)
+            )
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lock(cache_key):
+    CacheLock.objects.filter(cache_key=cache_key, owner=owner()).delete()
+
+
+def wait_for_release(cache_key, timeout, poll_interval):
+    """Aguarda outro processo liberar a trava (ou o prazo acabar)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not CacheLock.objects.filter(
+            cache_key=cache_key, expires_at__gt=timezone.now()
+        ).exists():
+            return True
+        time.sleep(poll_interval)
+    return False
+
+
+@contextmanager
+def db_lock(cache_key, timeout):
+    """
+    Contexto que informa se a trava entre processos foi obtida e a libera
+    ao final
+    """
+    acquired = acquire_lock(cache_key, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_lock(cache_key)
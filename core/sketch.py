@@ -0,0 +1,180 @@
+"""
+Sketch de quantis KLL (Karnin, Lang e Liberty) para a distribuição de scores
+
+O sketch ocupa memória O(k) independentemente do número de perfis, pode ser
+combinado com outros sketches (merge) e é persistido em ScoreSketch a cada
+perfil salvo, de forma que o dashboard obtém mediana e percentis sem ler a
+coluna ics_score.
+"""
+import math
+import random
+
+from django.db import transaction
+
+from .models import ICSProfile, ScoreSketch
+
+
+DEFAULT_K = 200
+
+# Quantis publicados nas estatísticas do dashboard
+DASHBOARD_QUANTILES = {
+    'p10': 0.10,
+    'p25': 0.25,
+    'p50': 0.50,
+    'p75': 0.75,
+    'p90': 0.90,
+}
+
+
+class KLLSketch:
+    """
+    Sketch de quantis com erro de rank aproximado de 1.65 / k
+    """
+
+    def __init__(self, k=DEFAULT_K, compactors=None, n=0, rng=None):
+        self.k = k
+        self.n = n
+        self.compactors = compactors or [[]]
+        self._rng = rng or random.Random()
+        # Totais de update() recalculados só depois de uma compressão
+        self._cached_size = None
+        self._cached_max_size = None
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil((2 / 3) ** depth * self.k)) + 1
+
+    def _size(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, value):
+        """Adiciona um valor ao sketch"""
+        self.compactors[0].append(float(value))
+        self.n += 1
+        if self._cached_size is None:
+            self._cached_size = self._size()
+            self._cached_max_size = self._max_size()
+        else:
+            self._cached_size += 1
+        if self._cached_size >= self._cached_max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Combina outro sketch neste (o resultado resume as duas sequências)"""
+        self._cached_size = None
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.n += other.n
+        while self._size() >= self._max_size():
+            self._compress()
+        return self
+
+    def _compress(self):
+        self._cached_size = None
+        for level, compactor in enumerate(self.compactors):
+            if len(compactor) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                compactor.sort()
+                # Um item sobra quando o tamanho é ímpar e permanece no nível
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                offset = self._rng.randint(0, 1)
+                self.compactors[level + 1].extend(compactor[offset::2])
+                self.compactors[level] = leftover
+                return
+
+    def _weighted_items(self):
+        items = []
+        for level, compactor in enumerate(self.compactors):
+            weight = 2 ** level
+            items.extend((value, weight) for value in compactor)
+        items.sort()
+        return items
+
+    def quantiles(self, fractions):
+        """Retorna os valores aproximados para uma lista de frações (0..1)"""
+        items = self._weighted_items()
+        if not items:
+            return [None for _ in fractions]
+
+        total = sum(weight for _, weight in items)
+        results = []
+        for fraction in fractions:
+            target = min(max(fraction, 0.0), 1.0) * total
+            cumulative = 0
+            value = items[-1][0]
+            for item, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    value = item
+                    break
+            results.append(value)
+        return results
+
+    def quantile(self, fraction):
+        """Valor aproximado do quantil informado (0..1)"""
+        return self.quantiles([fraction])[0]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(
+            k=data.get('k', DEFAULT_K),
+            compactors=[list(compactor) for compactor in data.get('compactors', [[]])],
+            n=data.get('n', 0)
+        )
+
+
+def load_sketch(name='ics_score'):
+    """Carrega o sketch persistido"""
+    entry = ScoreSketch.objects.filter(name=name).first()
+    return KLLSketch.from_dict(entry.data if entry else None)
+
+
+def record_scores(scores, name='ics_score'):
+    """
+    Adiciona scores ao sketch persistido.
+    Deve ser chamado na mesma transação que grava os perfis. Sem o sketch
+    gravado (banco recém-migrado), ele é construído a partir dos perfis, que
+    já incluem os scores informados.
+    """
+    scores = [score for score in scores if score is not None]
+    if not scores:
+        return
+
+    with transaction.atomic():
+        entry = ScoreSketch.objects.select_for_update().filter(name=name).first()
+        if entry is None:
+            rebuild(name)
+            return
+        sketch = KLLSketch.from_dict(entry.data)
+        for score in scores:
+            sketch.update(score)
+        entry.data = sketch.to_dict()
+        entry.save(update_fields=['data', 'updated_at'])
+
+
+def rebuild(name='ics_score'):
+    """Reconstrói o sketch do zero a partir da tabela ICSProfile"""
+    with transaction.atomic():
+        sketch = KLLSketch()
+        scores = ICSProfile.objects.filter(
+            ics_score__isnull=False
+        ).order_by().values_list('ics_score', flat=True).iterator(chunk_size=10000)
+        for score in scores:
+            sketch.update(score)
+
+        ScoreSketch.objects.update_or_create(
+            name=name, defaults={'data': sketch.to_dict()}
+        )
+
+    return sketch.n
@@ -0,0 +1,91 @@
+"""
+Estatísticas do dashboard lidas do índice de scores
+
+Contagem, soma e distribuição por faixa saem das somas de prefixo da árvore
+de Fenwick (core.score_index): os limites das faixas caem nas fronteiras dos
+buckets 400 e 700, então não há uma segunda cópia desses números para manter
+em dia. A versão das estatísticas (ETag do dashboard) fica na linha de versão
+do índice. Tudo vem de uma única consulta por chave primária.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from . import score_index
+from .models import ICSProfile
+
+
+# Limites das faixas de classificação do ICS
+MEDIUM_THRESHOLD = 0.4
+HIGH_THRESHOLD = 0.7
+
+# Últimos buckets de cada faixa abaixo do limite (scores < 0.4 e < 0.7)
+BAND_BOUNDARIES = (
+    score_index.bucket_for(MEDIUM_THRESHOLD) - 1,
+    score_index.bucket_for(HIGH_THRESHOLD) - 1,
+)
+
+
+class Snapshot:
+    """Estatísticas do dashboard em um instante, com a versão que as identifica"""
+
+    def __init__(self, total_profiles, score_sum, low_count, medium_count, high_count, version, updated_at):
+        self.total_profiles = total_profiles
+        self.score_sum = score_sum
+        self.low_count = low_count
+        self.medium_count = medium_count
+        self.high_count = high_count
+        self.version = version
+        self.updated_at = updated_at
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.total_profiles if self.total_profiles else 0
+
+    def __str__(self):
+        return f"Snapshot v{self.version} - {self.total_profiles} perfis"
+
+
+def get_snapshot():
+    """
+    Retorna as estatísticas atuais; se o índice ainda não existir (banco
+    recém-migrado), ele é construído a partir dos perfis
+    """
+    stats = score_index.snapshot(BAND_BOUNDARIES)
+    if stats is None:
+        with transaction.atomic():
+            score_index.rebuild()
+            touch()
+        stats = score_index.snapshot(BAND_BOUNDARIES)
+
+    below_medium, below_high = stats['prefixes']
+    return Snapshot(
+        total_profiles=stats['total'],
+        score_sum=stats['score_sum'],
+        low_count=below_medium,
+        medium_count=below_high - below_medium,
+        high_count=stats['total'] - below_high,
+        version=stats['version'],
+        updated_at=stats['updated_at'],
+    )
+
+
+def touch():
+    """
+    Avança a versão das estatísticas, invalidando os ETags do dashboard.
+    Chamado por toda escrita nas estatísticas (via core.rollups) e quando um
+    perfil é editado (a lista de recentes pode ter mudado).
+    """
+    score_index.touch()
+
+
+def aggregate_profiles(queryset):
+    """Calcula as estatísticas diretamente sobre a tabela (uma consulta)"""
+    return queryset.filter(ics_score__isnull=False).aggregate(
+        total_profiles=Count('id'),
+        score_sum=Sum('ics_score', default=0),
+        low_count=Count('id', filter=Q(ics_score__lt=MEDIUM_THRESHOLD)),
+        medium_count=Count('id', filter=Q(
+            ics_score__gte=MEDIUM_THRESHOLD, ics_score__lt=HIGH_THRESHOLD
+        )),
+        high_count=Count('id', filter=Q(ics_score__gte=HIGH_THRESHOLD)),
+    )
@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from .management.commands.run_benchmarks import compare_results, summarize
+from .matching import JobTitleMatcher
+from .renderers import FastJSONRenderer
+from .routers import READ_PRIMARY_COOKIE, ReadReplicaRouter, request_routing
+from .serializers import ICSProfileSerializer
+from .models import APICache, CacheLock, CalculationLog, ICSProfile, Municipality, RescoreCheckpoint, ScoreBucket, ScoreSketch
+from . import http_client, logwriter, matching, singleflight
+from .cache import LRUCache
+from .logwriter import CalculationLogWriter
+from .services import ICSCalculationService, ExternalAPIService, local_cache
+from . import rollups, score_index, sensitivity, sketch, snapshot, weight_sets
+from .sketch import KLLSketch
+from .views import ICSCalculationAPIView
+
+
+IBGE_MUNICIPALITIES = [
+    {'id': 3550308, 'nome': 'São Paulo',
+     'microrregiao': {'mesorregiao': {'UF': {'sigla': 'SP'}}}},
+]
+
+
+class StubServer:
+    """
+    Servidor HTTP local que simula as APIs externas, com atraso configurável
+    """
+
+    def __init__(self, routes, delay=0):
+        stub = self
+        self.routes = routes
+        self.delay = delay
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests.append((self.path, self.client_address))
+                time.sleep(stub.delay)
+                status, payload = stub.routes.get(self.path.split('?')[0], (404, {}))
+                if callable(payload):
+                    status, payload = payload()
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def ics_config(**overrides):
+    return {**settings.ICS_CONFIG, **overrides}
+
+
+SAMPLE_PROFILES = [
+    {
+        'father_salary': 15000, 'mother_salary': 4500,
+        'family_property_value': 800000, 'family_financial_value': 200000,
+        'inheritance_status': 'sem', 'benefits_value': 0, 'tax_paid': 25000,
+    },
+    {
+        'father_salary': 3500, 'mother_salary': None,
+        'family_property_value': 200000,
+        'inheritance_status': 'recebeu', 'benefits_value': 500, 'tax_paid': 3000,
+    },
+    {
+        'benefits_value': 12000,
+    },
+    {},
+]
+
+
+class ICSCalculationServiceTests(TestCase):
+
+    def test_calculate_many_matches_calculate_ics(self):
+        service = ICSCalculationService()
+        batch = service.calculate_many(SAMPLE_PROFILES)
+
+        for data, result in zip(SAMPLE_PROFILES, batch):
+            expected = service.calculate_ics(data)
+            self.assertEqual(result['ics_score'], expected['ics_score'])
+            self.assertEqual(result['confidence'], expected['confidence'])
+            self.assertEqual(result['explanation'], expected['explanation'])
+            self.assertEqual(result['components'], expected['components'])
+
+
+class ICSBatchCalculationAPITests(TestCase):
+
+    def test_batch_endpoint_persists_profiles_and_logs(self):
+        response = self.client.post(
+            reverse('core:calculate_ics_batch'),
+            {'profiles': SAMPLE_PROFILES},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], len(SAMPLE_PROFILES))
+        self.assertEqual(ICSProfile.objects.count(), len(SAMPLE_PROFILES))
+        self.assertEqual(CalculationLog.objects.count(), len(SAMPLE_PROFILES))
+
+    def test_batch_endpoint_rejects_invalid_rows(self):
+        response = self.client.post(
+            reverse('core:calculate_ics_batch'),
+            [{'tax_paid': 'abc'}],
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ICSProfile.objects.count(), 0)
+
+    def test_failed_batch_persists_nothing(self):
+        record_scores = rollups.record_scores
+        calls = []
+
+        def fail_on_second_chunk(scores):
+            calls.append(scores)
+            if len(calls) == 2:
+                raise RuntimeError('falha simulada')
+            record_scores(scores)
+
+        with override_settings(ICS_CONFIG=ics_config(BATCH_CHUNK_SIZE=2)), \
+                mock.patch.object(rollups, 'record_scores', side_effect=fail_on_second_chunk):
+            response = self.client.post(
+                reverse('core:calculate_ics_batch'), SAMPLE_PROFILES, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(ICSProfile.objects.count(), 0)
+        self.assertEqual(CalculationLog.objects.count(), 0)
+
+    def test_batch_endpoint_caps_profiles_per_request(self):
+        with override_settings(ICS_CONFIG=ics_config(BATCH_MAX_PROFILES=2)):
+            response = self.client.post(
+                reverse('core:calculate_ics_batch'), SAMPLE_PROFILES, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ICSProfile.objects.count(), 0)
+
+
+class ScoreIndexTests(TestCase):
+
+    def test_incremental_index_matches_table(self):
+        scores = [0.0, 0.12, 0.4, 0.55, 0.7, 0.91, 1.0]
+        for score in scores:
+            ICSProfile.objects.create(ics_score=score)
+
+        stats = score_index.summary(0.55)
+        self.assertEqual(stats['total'], len(scores))
+        self.assertAlmostEqual(stats['score_sum'], sum(scores))
+        self.assertEqual(stats['below'], 3)
+        self.assertAlmostEqual(score_index.percentile(0.55), 3 / len(scores) * 100)
+
+        score_index.rebuild()
+        self.assertEqual(score_index.summary(0.55), stats)
+
+    def test_missing_buckets_are_rebuilt_instead_of_skipped(self):
+        ICSProfile.objects.create(ics_score=0.3)
+        ScoreBucket.objects.all().delete()
+
+        ICSProfile.objects.create(ics_score=0.8)
+        self.assertEqual(score_index.summary()['total'], 2)
+
+        ScoreBucket.objects.all().delete()
+        ICSCalculationService().save_many(SAMPLE_PROFILES, ICSCalculationService().calculate_many(SAMPLE_PROFILES))
+        self.assertEqual(score_index.summary()['total'], 2 + len(SAMPLE_PROFILES))
+
+        ScoreBucket.objects.all().delete()
+        stats = score_index.record_score(0.5)
+        self.assertEqual(stats['total'], score_index.summary()['total'])
+
+
+class KLLSketchTests(TestCase):
+
+    def test_quantiles_within_rank_error(self):
+        values = [i / 20000 for i in range(20000)]
+        score_sketch = KLLSketch(rng=random.Random(7))
+        for value in random.Random(3).sample(values, len(values)):
+            score_sketch.update(value)
+
+        for fraction in (0.1, 0.5, 0.9):
+            self.assertAlmostEqual(score_sketch.quantile(fraction), fraction, delta=0.02)
+
+    def test_merge_and_round_trip(self):
+        left, right = KLLSketch(rng=random.Random(1)), KLLSketch(rng=random.Random(2))
+        for i in range(5000):
+            left.update(i / 10000)
+            right.update(0.5 + i / 10000)
+
+        merged = KLLSketch.from_dict(left.merge(right).to_dict())
+        self.assertEqual(merged.n, 10000)
+        self.assertAlmostEqual(merged.quantile(0.5), 0.5, delta=0.02)
+
+    def test_dashboard_exposes_sketch_quantiles(self):
+        self.client.post(
+            reverse('core:calculate_ics_batch'),
+            {'profiles': SAMPLE_PROFILES},
+            content_type='application/json'
+        )
+
+        response = self.client.get(reverse('core:dashboard_stats'), {'quantiles': '0.95'})
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(data['quantiles']), {'p10', 'p25', 'p50', 'p75', 'p90', 'q0.95'})
+        self.assertEqual(data['median_ics_score'], data['quantiles']['p50'])
+
+    def test_missing_sketch_is_built_from_existing_profiles(self):
+        ICSProfile.objects.create(ics_score=0.2)
+        ScoreSketch.objects.all().delete()
+
+        ICSProfile.objects.create(ics_score=0.6)
+        self.assertEqual(sketch.load_sketch().n, 2)
+
+
+class DashboardSnapshotTests(TestCase):
+
+    def test_snapshot_follows_creates_and_deletes(self):
+        for score in [0.1, 0.39, 0.4, 0.69, 0.7, 0.95]:
+            ICSProfile.objects.create(ics_score=score)
+        ICSProfile.objects.filter(ics_score=0.95).delete()
+
+        stats = snapshot.get_snapshot()
+        self.assertEqual(
+            (stats.total_profiles, stats.low_count, stats.medium_count, stats.high_count),
+            (5, 2, 2, 1)
+        )
+        self.assertAlmostEqual(stats.avg_score, (0.1 + 0.39 + 0.4 + 0.69 + 0.7) / 5)
+
+        # Mesmos números da agregação sobre a tabela, sem uma segunda cópia
+        aggregated = snapshot.aggregate_profiles(ICSProfile.objects.all())
+        self.assertEqual(
+            (stats.total_profiles, stats.low_count, stats.medium_count, stats.high_count),
+            tuple(aggregated[field] for field in ('total_profiles', 'low_count', 'medium_count', 'high_count'))
+        )
+
+        version = stats.version
+        rollups.rebuild()
+        rebuilt = snapshot.get_snapshot()
+        self.assertEqual(rebuilt.total_profiles, stats.total_profiles)
+        self.assertEqual(rebuilt.high_count, stats.high_count)
+        self.assertGreater(rebuilt.version, version)
+
+    def test_missing_snapshot_is_built_from_existing_profiles(self):
+        for score in [0.2, 0.5, 0.9]:
+            ICSProfile.objects.create(ics_score=score)
+        ScoreBucket.objects.all().delete()
+
+        stats = snapshot.get_snapshot()
+        self.assertEqual((stats.total_profiles, stats.low_count, stats.high_count), (3, 1, 1))
+
+    def test_dashboard_reads_snapshot(self):
+        ICSProfile.objects.create(ics_score=0.8)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('core:dashboard'))
+
+        self.assertEqual(response.context['total_profiles'], 1)
+        self.assertEqual(response.context['score_distribution']['alto'], 1)
+
+
+class MunicipalityCatalogueTests(TestCase):
+
+    def setUp(self):
+        local_cache.clear()
+        entries = [
+            {'id': 3550308, 'nome': 'São Paulo',
+             'microrregiao': {'mesorregiao': {'UF': {'sigla': 'SP'}}}},
+            {'id': 2927408, 'nome': 'Salvador',
+             'microrregiao': {'mesorregiao': {'UF': {'sigla': 'BA'}}}},
+            {'id': 5101837, 'nome': 'Boa Esperança do Norte', 'microrregiao': None,
+             'regiao-imediata': {'regiao-intermediaria': {'UF': {'sigla': 'MT'}}}},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            municipalities_file = os.path.join(directory, 'municipios.json')
+            pib_file = os.path.join(directory, 'pib.csv')
+            with open(municipalities_file, 'w', encoding='utf-8') as handle:
+                json.dump(entries, handle)
+            with open(pib_file, 'w', encoding='utf-8') as handle:
+                handle.write('ibge_code,pib_per_capita\n3550308,66872.84\n')
+
+            call_command('import_municipalities', municipalities_file, pib=pib_file, stdout=io.StringIO())
+
+    @mock.patch('core.http_client.get')
+    def test_lookup_is_accent_and_case_insensitive(self, http_get):
+        service = ExternalAPIService()
+
+        result = service.get_municipality_data('  SAO paulo ', 'sp')
+        self.assertEqual(result['municipality_id'], 3550308)
+        self.assertEqual(result['pib_per_capita'], 66872.84)
+        self.assertEqual(service.get_municipality_data('boa esperanca do norte')['state'], 'MT')
+        self.assertIsNone(service.get_municipality_data('São Paulo', 'RJ'))
+        http_get.assert_not_called()
+
+    def test_state_case_shares_one_cache_entry(self):
+        service = ExternalAPIService()
+        service.get_municipality_data('Salvador', 'ba')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(service.get_municipality_data('Salvador', 'BA')['municipality_id'], 2927408)
+
+
+class LocalCacheTests(TestCase):
+
+    def setUp(self):
+        local_cache.clear()
+
+    def test_lru_eviction_and_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.set('d', 4, ttl=0)
+        self.assertEqual(cache.get('d'), (False, None))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_repeated_lookups_skip_database(self):
+        Municipality.objects.create(ibge_code=2927408, name='Salvador', state='BA')
+        service = ExternalAPIService()
+        service.get_municipality_data('Salvador', 'BA')
+
+        with self.assertNumQueries(0):
+            result = service.get_municipality_data('Salvador', 'BA')
+
+        self.assertEqual(result['municipality_id'], 2927408)
+        self.assertEqual(ExternalAPIService.cache_stats()['hits'], 1)
+
+
+class JobTitleMatcherTests(TestCase):
+
+    def setUp(self):
+        matching.reset_matcher()
+
+    def tearDown(self):
+        matching.reset_matcher()
+
+    def test_longest_occupation_wins_regardless_of_order(self):
+        matcher = JobTitleMatcher([
+            ('3222-05', 'Técnico em enfermagem', 3200),
+            ('2235-05', 'Enfermeiro', 4500),
+            ('3131-05', 'Técnico', 3000),
+        ])
+
+        self.assertEqual(matcher.match('TECNICO DE ENFERMAGEM')['cbo_code'], '3222-05')
+        self.assertEqual(matcher.match('técnico eletricista')['cbo_code'], '3131-05')
+        self.assertEqual(matcher.match('enfermeiro chefe')['average_salary'], 4500)
+        self.assertIsNone(matcher.match('astronauta'))
+
+    def test_plural_and_feminine_forms_match(self):
+        matcher = JobTitleMatcher([
+            ('2142-05', 'Engenheiro civil', 9000),
+            ('2312-10', 'Professor', 3500),
+            ('4110-05', 'Auxiliar', 1800),
+            ('1414-10', 'Gerente', 6000),
+        ])
+
+        self.assertEqual(matcher.match('Engenheira Civil')['cbo_code'], '2142-05')
+        self.assertEqual(matcher.match('engenheiros civis')['cbo_code'], '2142-05')
+        for title in ('professores', 'professora', 'PROFESSORAS de história'):
+            self.assertEqual(matcher.match(title)['cbo_code'], '2312-10')
+        self.assertEqual(matcher.match('auxiliares administrativos')['cbo_code'], '4110-05')
+        self.assertEqual(matcher.match('gerentes')['cbo_code'], '1414-10')
+        self.assertEqual(matching.get_matcher().match('médica')['average_salary'], 15000)
+
+    def test_imported_occupations_replace_defaults(self):
+        with tempfile.TemporaryDirectory() as directory:
+            occupations_file = os.path.join(directory, 'cbo.csv')
+            with open(occupations_file, 'w', encoding='utf-8') as handle:
+                handle.write('cbo_code,title,average_salary\n2251-25,Médico clínico,18000\n')
+            call_command('import_occupations', occupations_file, stdout=io.StringIO())
+
+        service = ExternalAPIService()
+        self.assertEqual(service.get_job_salary_data('medico clinico geral')['average_salary'], 18000)
+        self.assertEqual(service.get_job_salary_data('professor'), {'average_salary': 2500})
+        self.assertFalse(APICache.objects.exists())
+
+
+class ConcurrentEnrichmentTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        local_cache.clear()
+
+    def test_latency_tracks_slowest_lookup(self):
+        def slow_job_lookup(job_title):
+            time.sleep(0.4)
+            return {'average_salary': 5000 if 'pai' in job_title else 3000}
+
+        routes = {'/localidades/municipios': (200, IBGE_MUNICIPALITIES)}
+        with StubServer(routes, delay=0.4) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url)), \
+                mock.patch.object(ExternalAPIService, 'get_job_salary_data', side_effect=slow_job_lookup):
+            started = time.monotonic()
+            enriched = ICSCalculationAPIView()._enrich_data_from_apis({
+                'fetch_birth_data': True, 'birth_place': 'São Paulo',
+                'fetch_father_job': True, 'father_job': 'pai',
+                'fetch_mother_job': True, 'mother_job': 'mae',
+            })
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.0)  # a soma das três consultas seria >= 1.2s
+        self.assertEqual(enriched['birth_pib_per_capita'], 25000)
+        self.assertEqual(enriched['father_salary'], 5000)
+        self.assertEqual(enriched['mother_salary'], 3000)
+
+    def test_lookups_past_deadline_are_ignored(self):
+        def slow_job_lookup(job_title):
+            time.sleep(0.5)
+            return {'average_salary': 5000}
+
+        with override_settings(ICS_CONFIG=ics_config(ENRICHMENT_TIMEOUT=0.1)), \
+                mock.patch.object(ExternalAPIService, 'get_job_salary_data', side_effect=slow_job_lookup):
+            enriched = ICSCalculationAPIView()._enrich_data_from_apis({
+                'fetch_father_job': True, 'father_job': 'pai',
+                'fetch_mother_job': True, 'mother_job': 'mae',
+            })
+
+        self.assertNotIn('father_salary', enriched)
+        self.assertNotIn('mother_salary', enriched)
+
+    def test_single_lookup_respects_deadline(self):
+        def slow_job_lookup(job_title):
+            time.sleep(1.0)
+            return {'average_salary': 5000}
+
+        with override_settings(ICS_CONFIG=ics_config(ENRICHMENT_TIMEOUT=0.1)), \
+                mock.patch.object(ExternalAPIService, 'get_job_salary_data', side_effect=slow_job_lookup):
+            started = time.monotonic()
+            enriched = ICSCalculationAPIView()._enrich_data_from_apis({
+                'fetch_father_job': True, 'father_job': 'pai',
+            })
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.5)
+        self.assertNotIn('father_salary', enriched)
+
+
+class PooledHTTPClientTests(TestCase):
+
+    def tearDown(self):
+        http_client.reset_session()
+
+    def test_connections_are_reused(self):
+        routes = {'/ping': (200, {'ok': True})}
+        with StubServer(routes) as stub:
+            for _ in range(3):
+                self.assertEqual(http_client.get(f'{stub.url}/ping').json(), {'ok': True})
+
+        client_ports = {address[1] for _, address in stub.requests}
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(len(client_ports), 1)
+
+    def test_transient_errors_are_retried(self):
+        responses = iter([(503, {}), (502, {}), (200, {'ok': True})])
+        routes = {'/flaky': (200, lambda: next(responses))}
+        http_config = {**settings.ICS_CONFIG['HTTP'], 'BACKOFF_FACTOR': 0.01, 'BACKOFF_JITTER': 0.01}
+
+        with StubServer(routes) as stub, override_settings(ICS_CONFIG=ics_config(HTTP=http_config)):
+            http_client.reset_session()
+            response = http_client.get(f'{stub.url}/flaky')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_timeout_is_configured_per_host(self):
+        http_config = {**settings.ICS_CONFIG['HTTP'], 'TIMEOUTS': {'127.0.0.1': (1, 2)}}
+
+        with override_settings(ICS_CONFIG=ics_config(HTTP=http_config)):
+            self.assertEqual(http_client.timeout_for('http://127.0.0.1:8000/x'), (1, 2))
+            self.assertEqual(
+                http_client.timeout_for('http://example.org/x'),
+                http_config['DEFAULT_TIMEOUT']
+            )
+
+
+class SingleFlightTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        local_cache.clear()
+
+    def test_concurrent_misses_share_one_fetch(self):
+        routes = {'/localidades/municipios': (200, IBGE_MUNICIPALITIES)}
+        results = []
+
+        with StubServer(routes, delay=0.3) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url)):
+            def lookup():
+                results.append(ExternalAPIService().get_municipality_data('São Paulo', 'SP'))
+                connections.close_all()
+
+            threads = [threading.Thread(target=lookup) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual([result['municipality_id'] for result in results], [3550308] * 8)
+        self.assertFalse(CacheLock.objects.exists())
+
+    def test_lock_owner_changes_after_fork(self):
+        parent = singleflight.owner()
+        self.assertEqual(singleflight.owner(), parent)
+        child_pid = os.getpid() + 1
+
+        with mock.patch('core.singleflight.os.getpid', return_value=child_pid):
+            child = singleflight.owner()
+            self.assertNotEqual(child, parent)
+            self.assertTrue(child.startswith(f'{child_pid}-'))
+
+            # A trava do pai não é liberada pelo filho
+            self.assertTrue(singleflight.acquire_lock('chave', 30))
+            CacheLock.objects.filter(cache_key='chave').update(owner=parent)
+            singleflight.release_lock('chave')
+            self.assertTrue(CacheLock.objects.filter(cache_key='chave').exists())
+
+    def test_waits_for_lock_held_by_another_worker(self):
+        cache_key = 'ibge_municipality_São Paulo_SP'
+        CacheLock.objects.create(
+            cache_key=cache_key, owner='outro-worker',
+            expires_at=timezone.now() + timedelta(seconds=30)
+        )
+        cached = {'municipality_id': 3550308, 'name': 'São Paulo', 'state': 'SP', 'pib_per_capita': 1}
+
+        def other_worker_finishes():
+            time.sleep(0.3)
+            ExternalAPIService()._cache_data(cache_key, cached)
+            local_cache.clear()
+            CacheLock.objects.filter(cache_key=cache_key).delete()
+            connections.close_all()
+
+        with StubServer({}) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url)):
+            threading.Thread(target=other_worker_finishes).start()
+            result = ExternalAPIService().get_municipality_data('São Paulo', 'SP')
+
+        self.assertEqual(result, cached)
+        self.assertEqual(stub.requests, [])
+
+
+class StaleWhileRevalidateTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        local_cache.clear()
+
+    def test_not_found_is_cached(self):
+        routes = {'/localidades/municipios': (200, IBGE_MUNICIPALITIES)}
+
+        with StubServer(routes) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url)):
+            for _ in range(2):
+                self.assertIsNone(ExternalAPIService().get_municipality_data('Cidadeinexistente'))
+                local_cache.clear()
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertTrue(APICache.objects.get(cache_key='ibge_municipality_Cidadeinexistente_None').is_negative)
+
+    def test_network_errors_are_not_cached(self):
+        with StubServer({'/localidades/municipios': (503, {})}) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url, HTTP={
+                    **settings.ICS_CONFIG['HTTP'], 'MAX_RETRIES': 0
+                })):
+            http_client.reset_session()
+            self.assertIsNone(ExternalAPIService().get_municipality_data('São Paulo'))
+        http_client.reset_session()
+
+        self.assertFalse(APICache.objects.exists())
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        cache_key = 'ibge_municipality_São Paulo_SP'
+        now = timezone.now()
+        APICache.objects.create(
+            cache_key=cache_key, data={'municipality_id': 3550308, 'pib_per_capita': 1},
+            stale_at=now - timedelta(seconds=1), expires_at=now + timedelta(hours=1)
+        )
+        routes = {'/localidades/municipios': (200, IBGE_MUNICIPALITIES)}
+
+        with StubServer(routes, delay=0.3) as stub, \
+                override_settings(ICS_CONFIG=ics_config(IBGE_API_BASE=stub.url)):
+            started = time.monotonic()
+            result = ExternalAPIService().get_municipality_data('São Paulo', 'SP')
+            self.assertLess(time.monotonic() - started, 0.25)
+            self.assertEqual(result['pib_per_capita'], 1)
+
+            deadline = time.monotonic() + 5
+            while APICache.objects.get(cache_key=cache_key).data['pib_per_capita'] == 1:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.05)
+
+        refreshed = APICache.objects.get(cache_key=cache_key)
+        self.assertEqual(refreshed.data['pib_per_capita'], 25000)
+        self.assertGreater(refreshed.stale_at, now)
+
+
+class ImportProfilesCommandTests(TestCase):
+
+    def test_import_resumes_after_failure_without_duplicates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cohort.ndjson')
+            with open(path, 'w', encoding='utf-8') as handle:
+                for i in range(10):
+                    handle.write(json.dumps({'tax_paid': 1000 * i, 'inheritance_status': 'sem'}) + '\n')
+                handle.write(json.dumps({'tax_paid': 'invalido'}) + '\n')
+
+            original_save_many = ICSCalculationService.save_many
+            calls = []
+
+            def failing_save_many(service, rows, results, chunk_size=None):
+                calls.append(len(rows))
+                if len(calls) == 2:
+                    raise RuntimeError('queda simulada')
+                return original_save_many(service, rows, results, chunk_size)
+
+            with mock.patch.object(ICSCalculationService, 'save_many', failing_save_many):
+                with self.assertRaises(RuntimeError):
+                    call_command('import_profiles', path, chunk_size=4, stdout=io.StringIO())
+
+            self.assertEqual(ICSProfile.objects.count(), 4)
+
+            call_command('import_profiles', path, chunk_size=4, stdout=io.StringIO())
+
+        self.assertEqual(ICSProfile.objects.count(), 10)
+        self.assertEqual(CalculationLog.objects.count(), 10)
+        self.assertEqual(snapshot.get_snapshot().total_profiles, 10)
+        self.assertEqual(
+            sorted(ICSProfile.objects.values_list('tax_paid', flat=True)),
+            [1000.0 * i for i in range(10)]
+        )
+
+
+class ProfileExportTests(TestCase):
+
+    def setUp(self):
+        service = ICSCalculationService()
+        rows = [{'tax_paid': 1000 * i, 'inheritance_status': 'sem'} for i in range(5)]
+        rows.append({'tax_paid': 200000, 'family_property_value': 2000000, 'inheritance_status': 'recebida'})
+        service.save_many(rows, service.calculate_many(rows))
+
+    def test_ndjson_export_streams_filtered_rows(self):
+        response = self.client.get(reverse('core:profile_export'), {'band': 'baixo'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        expected = ICSProfile.objects.filter(ics_score__lt=snapshot.MEDIUM_THRESHOLD).count()
+        self.assertEqual(len(lines), expected)
+        self.assertTrue(all(json.loads(line)['ics_score'] < snapshot.MEDIUM_THRESHOLD for line in lines))
+
+    def test_csv_export_and_invalid_filters(self):
+        response = self.client.get(reverse('core:profile_export'), {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), ICSProfile.objects.count() + 1)
+        self.assertTrue(content.startswith('id,created_at'))
+
+        self.assertEqual(self.client.get(reverse('core:profile_export'), {'band': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('core:profile_export'), {'created_from': 'ontem'}).status_code, 400)
+
+    def test_export_columns_match_api_fields(self):
+        profile = ICSProfile.objects.order_by('id').first()
+        api_fields = list(ICSProfileSerializer(profile).data)
+
+        response = self.client.get(reverse('core:profile_export'), {'format': 'csv'})
+        header = b''.join(response.streaming_content).decode().splitlines()[0]
+        self.assertEqual(header.split(','), api_fields)
+
+        response = self.client.get(reverse('core:profile_export'))
+        line = b''.join(response.streaming_content).decode().splitlines()[0]
+        self.assertEqual(list(json.loads(line)), api_fields)
+
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'perfis.ndjson')
+            call_command('export_profiles', output=path, chunk_size=2, stderr=io.StringIO())
+            with open(path, encoding='utf-8') as handle:
+                self.assertEqual(len(handle.readlines()), ICSProfile.objects.count())
+
+
+class ProfileListPaginationTests(TestCase):
+
+    def setUp(self):
+        service = ICSCalculationService()
+        rows = [{'tax_paid': 1000 * i, 'inheritance_status': 'sem'} for i in range(7)]
+        service.save_many(rows, service.calculate_many(rows))
+        # Metade dos perfis com o mesmo created_at: o id desempata o cursor
+        same_moment = timezone.now()
+        ICSProfile.objects.filter(id__in=list(ICSProfile.objects.values_list('id', flat=True)[:4])).update(
+            created_at=same_moment
+        )
+
+    def test_cursor_walks_every_profile_once_in_order(self):
+        seen = []
+        url = reverse('core:profile_list') + '?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen.extend(profile['id'] for profile in data['results'])
+            url = data['next']
+
+        expected = list(ICSProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_sparse_fields_skip_unrequested_columns(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('core:profile_list'), {'fields': 'id,ics_score'})
+
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'ics_score'})
+        self.assertNotIn('raw_data', queries.captured_queries[-1]['sql'])
+
+        self.assertEqual(self.client.get(reverse('core:profile_list'), {'fields': 'senha'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('core:profile_list'), {'cursor': 'xyz'}).status_code, 400)
+
+
+class FastReadPathTests(TestCase):
+
+    def setUp(self):
+        self.profile = ICSProfile.objects.create(
+            birth_place='São José do Rio Preto', father_job='técnico em enfermagem',
+            tax_paid=1234.5, ics_score=0.4321, ics_explanation='Posição média\u2028(“ok”)',
+            ics_confidence=0.8, raw_data={'birth_place': 'São José', 'notas': ['ç', 1e-7, None]}
+        )
+
+    def test_detail_and_list_match_serializer_output_byte_for_byte(self):
+        expected = JSONRenderer().render(ICSProfileSerializer(self.profile).data)
+
+        response = self.client.get(reverse('core:profile_detail', args=[self.profile.id]))
+        self.assertEqual(response.content, expected)
+
+        response = self.client.get(reverse('core:profile_list'))
+        self.assertIn(expected, response.content)
+
+    def test_renderer_matches_drf_json_renderer(self):
+        payloads = [
+            {'texto': 'ação\u2028\u2029', 'quando': timezone.now(), 'valor': Decimal('1.50')},
+            {'lista': [1, 2.5, None, True, 0.1 + 0.2]},
+            {'pequeno': 7.5e-05, 'enorme': 1e16},
+            {'grande': 12345678901234567890123},
+        ]
+        for data in payloads:
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_checks_float_values_not_text(self):
+        # Texto parecido com expoente não desvia para o JSONRenderer
+        text_only = {'cnae': '1e-5', 'codigo': 'cafe-1', 'valor': '0.00001', 'x': [5940.00003]}
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError) as fallback:
+            FastJSONRenderer().render(text_only)
+        fallback.assert_not_called()
+
+        nested = {'raw_data': {'notas': [1, {'taxa': 3e-6}]}}
+        with mock.patch.object(JSONRenderer, 'render', return_value=b'{}') as fallback:
+            FastJSONRenderer().render(nested)
+        fallback.assert_called_once()
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.profile = ICSProfile.objects.create(ics_score=0.55, ics_explanation='Posição média')
+
+    def test_profile_detail_revalidates_until_profile_changes(self):
+        url = reverse('core:profile_detail', args=[self.profile.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.profile.ics_explanation = 'Revisado'
+        self.profile.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_dashboard_stats_revalidate_against_snapshot_version(self):
+        url = reverse('core:dashboard_stats')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Outros quantis são outra representação
+        self.assertEqual(self.client.get(url + '?quantiles=0.95', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        ICSProfile.objects.create(ics_score=0.9)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sketch_only_writes_invalidate_dashboard_etag(self):
+        url = reverse('core:dashboard_stats')
+
+        # Quantis mudam sem mexer nas contagens do snapshot
+        for write in (lambda: rollups.record_sketch_scores([0.95]), rollups.rebuild_sketch):
+            etag = self.client.get(url)['ETag']
+            write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class CalculationLogWriterTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        self.profile = ICSProfile.objects.create(ics_score=0.5)
+
+    def entry(self, result=0.5):
+        return CalculationLog(profile=self.profile, calculation_data={}, weights_used={}, result=result)
+
+    def test_flushes_in_batches_and_on_shutdown(self):
+        writer = CalculationLogWriter(batch_size=3, flush_interval=60)
+        for i in range(7):
+            writer.submit(self.entry(i))
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(CalculationLog.objects.count(), 7)
+        self.assertEqual(writer.stats()['batches'], 3)
+
+        writer.submit(self.entry())
+        writer.shutdown(timeout=5)
+        self.assertEqual(CalculationLog.objects.count(), 8)
+
+    def test_full_queue_falls_back_to_synchronous_writes(self):
+        writer = CalculationLogWriter(max_size=2, batch_size=1, flush_interval=60, put_timeout=0.01)
+        release = threading.Event()
+        original_write = writer._write
+
+        def slow_write(batch):
+            release.wait(5)
+            return original_write(batch)
+
+        with mock.patch.object(writer, '_write', slow_write):
+            for i in range(6):
+                writer.submit(self.entry(i))
+            self.assertGreater(writer.stats()['sync_writes'], 0)
+            release.set()
+            self.assertTrue(writer.flush(timeout=5))
+
+        writer.shutdown(timeout=5)
+        self.assertEqual(CalculationLog.objects.count(), 6)
+
+    def test_api_queues_log_when_write_behind_enabled(self):
+        config = ics_config(CALCULATION_LOG={**settings.ICS_CONFIG['CALCULATION_LOG'], 'WRITE_BEHIND': True})
+
+        with override_settings(ICS_CONFIG=config):
+            response = self.client.post(reverse('core:calculate_ics'), SAMPLE_PROFILES[0], content_type='application/json')
+            self.assertTrue(logwriter.calculation_log_writer.flush(timeout=5))
+
+        self.assertTrue(CalculationLog.objects.filter(profile_id=response.json()['profile_id']).exists())
+
+    def test_batched_sketch_scores_invalidate_dashboard_etag(self):
+        url = reverse('core:dashboard_stats')
+        etag = self.client.get(url)['ETag']
+        total = sketch.load_sketch().n
+
+        logwriter._persist([self.entry(0.8), self.entry(0.3)])
+
+        self.assertEqual(sketch.load_sketch().n, total + 2)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ScoringQueryBudgetTests(TransactionTestCase):
+    serialized_rollback = True
+    payload = {
+        'fetch_birth_data': True, 'birth_place': 'Salvador', 'birth_state': 'BA',
+        'fetch_father_job': True, 'father_job': 'médico',
+        'tax_paid': 12000, 'inheritance_status': 'sem',
+    }
+
+    def setUp(self):
+        local_cache.clear()
+        matching.reset_matcher()
+        Municipality.objects.create(ibge_code=2927408, name='Salvador', state='BA', pib_per_capita=24000)
+        ICSProfile.objects.create(ics_score=0.2)
+        ICSProfile.objects.create(ics_score=0.9)
+
+    def post(self):
+        return self.client.post(reverse('core:calculate_ics'), self.payload, content_type='application/json')
+
+    def statements(self):
+        """
+        Comandos executados pelo pedido, sem BEGIN/COMMIT/SAVEPOINT, em todas
+        as threads: as consultas do enriquecimento rodam nas conexões do pool,
+        que CaptureQueriesContext (só a conexão da thread atual) não enxerga
+        """
+        statements = []
+        lock = threading.Lock()
+        execute = CursorWrapper._execute_with_wrappers
+
+        def capture(cursor, sql, *args, **kwargs):
+            with lock:
+                statements.append(sql)
+            return execute(cursor, sql, *args, **kwargs)
+
+        with mock.patch.object(CursorWrapper, '_execute_with_wrappers', capture):
+            response = self.post()
+
+        control = ('BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE')
+        return response, [sql for sql in statements if not sql.startswith(control)]
+
+    def test_cache_hot_request_stays_within_budget(self):
+        config = ics_config(CALCULATION_LOG={**settings.ICS_CONFIG['CALCULATION_LOG'], 'WRITE_BEHIND': True})
+
+        with override_settings(ICS_CONFIG=config):
+            self.post()  # aquece o catálogo de municípios e o matcher de ocupações
+
+            version = snapshot.get_snapshot().version
+
+            # INSERT do perfil e UPDATE ... RETURNING do índice (com a versão do snapshot)
+            response, statements = self.statements()
+            self.assertLessEqual(len(statements), 2, statements)
+            self.assertTrue(logwriter.calculation_log_writer.flush(timeout=5))
+
+        result = response.json()
+        self.assertAlmostEqual(result['avg_score'], score_index.average_score())
+        self.assertAlmostEqual(result['percentile'], score_index.percentile(result['ics_score']))
+        self.assertEqual(snapshot.get_snapshot().total_profiles, 4)
+        # Um avanço no UPDATE do pedido e outro quando o lote entra no sketch
+        self.assertEqual(snapshot.get_snapshot().version, version + 2)
+        self.assertEqual(sketch.load_sketch().n, 4)
+        self.assertTrue(CalculationLog.objects.filter(profile_id=result['profile_id']).exists())
+
+    def test_synchronous_logging_adds_sketch_and_log_statements(self):
+        self.post()
+
+        # Sem write-behind, sketch (SELECT + UPDATE) e log entram na mesma transação
+        response, statements = self.statements()
+        self.assertLessEqual(len(statements), 5, statements)
+
+        self.assertTrue(CalculationLog.objects.filter(profile_id=response.json()['profile_id']).exists())
+        self.assertEqual(sketch.load_sketch().n, 4)
+
+
+class ProfileIndexTests(TestCase):
+
+    def test_analytics_queries_use_partial_indexes(self):
+        scored = ICSProfile.objects.filter(ics_score__isnull=False)
+
+        self.assertIn('core_profile_scored_recent', scored.order_by('-created_at', '-id')[:5].explain())
+        self.assertIn(
+            'COVERING INDEX core_profile_scored_score',
+            scored.filter(ics_score__gte=snapshot.HIGH_THRESHOLD).order_by().values('id').explain()
+        )
+
+
+class SQLiteConcurrencyProfileTests(TestCase):
+
+    def test_new_connections_get_wal_and_pragmas(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as directory:
+            database = dict(connections['default'].settings_dict, NAME=os.path.join(directory, 'ics.sqlite3'))
+            wrapper = DatabaseWrapper(database, alias='profile_check')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000, 'temp_store': 2})
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+
+class ReadReplicaRoutingTests(TestCase):
+
+    def test_only_marked_requests_read_from_replica(self):
+        router = ReadReplicaRouter()
+
+        self.assertIsNone(router.db_for_read(ICSProfile))
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}):
+            with request_routing() as state:
+                self.assertIsNone(router.db_for_read(ICSProfile))
+                state.replica = True
+                self.assertEqual(router.db_for_read(ICSProfile), 'replica')
+                # Depois de escrever, o pedido lê do principal
+                self.assertIsNone(router.db_for_write(ICSProfile))
+                self.assertIsNone(router.db_for_read(ICSProfile))
+
+            with request_routing(pinned=True) as state:
+                state.replica = True
+                self.assertIsNone(router.db_for_read(ICSProfile))
+
+        with request_routing() as state:
+            state.replica = True
+            self.assertIsNone(router.db_for_read(ICSProfile))
+
+    def test_writing_request_pins_client_to_primary(self):
+        response = self.client.post(
+            reverse('core:calculate_ics'), {'tax_paid': 5000}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(READ_PRIMARY_COOKIE, response.cookies)
+        self.assertFalse(response.wsgi_request.routing_state.replica)
+
+        self.client.cookies.clear()
+        response = self.client.get(reverse('core:dashboard_stats'))
+        self.assertTrue(response.wsgi_request.routing_state.replica)
+        self.assertNotIn(READ_PRIMARY_COOKIE, response.cookies)
+
+
+class WeightSetRescoreTests(TestCase):
+    new_weights = {**settings.ICS_CONFIG['DEFAULT_WEIGHTS'], 'fiscal': 0.35}
+
+    def setUp(self):
+        service = ICSCalculationService()
+        rows = SAMPLE_PROFILES * 3
+        self.profiles = service.save_many(rows, service.calculate_many(rows))
+
+    def test_weight_versions_follow_the_weights(self):
+        version = weight_sets.current_version()
+        reordered = dict(reversed(list(settings.ICS_CONFIG['DEFAULT_WEIGHTS'].items())))
+
+        self.assertEqual(weight_sets.current_version(reordered), version)
+        self.assertEqual(weight_sets.current_version(self.new_weights), version + 1)
+        self.assertEqual({profile.weights_version for profile in ICSProfile.objects.all()}, {version})
+
+    def test_rescore_applies_new_weights_and_resumes(self):
+        with override_settings(ICS_CONFIG=ics_config(DEFAULT_WEIGHTS=self.new_weights)):
+            # Falha no segundo bloco: o progresso do primeiro é mantido
+            replace_scores = rollups.replace_scores
+            chunks = []
+
+            def fail_on_second_chunk(old_scores, new_scores):
+                chunks.append(new_scores)
+                if len(chunks) == 2:
+                    raise RuntimeError('falha simulada')
+                replace_scores(old_scores, new_scores)
+
+            with mock.patch.object(rollups, 'replace_scores', side_effect=fail_on_second_chunk):
+                with self.assertRaises(RuntimeError):
+                    call_command('rescore_profiles', workers=0, chunk_size=2, stdout=io.StringIO())
+            checkpoint = RescoreCheckpoint.objects.get()
+            self.assertEqual((checkpoint.rows_rescored, checkpoint.completed), (2, False))
+
+            versions = []
+            rebuild = sketch.rebuild
+
+            def rebuild_and_record():
+                versions.append(snapshot.get_snapshot().version)
+                return rebuild()
+
+            with mock.patch.object(sketch, 'rebuild', side_effect=rebuild_and_record):
+                call_command('rescore_profiles', workers=0, chunk_size=2, stdout=io.StringIO())
+            version = weight_sets.current_version()
+
+        # A versão do snapshot avança depois da reconstrução do sketch (ETag do dashboard)
+        self.assertEqual(len(versions), 1)
+        self.assertGreater(snapshot.get_snapshot().version, versions[0])
+
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.rows_rescored, checkpoint.completed), (len(self.profiles), True))
+
+        expected = ICSCalculationService(self.new_weights)
+        scores = []
+        for profile in ICSProfile.objects.order_by('id'):
+            self.assertEqual(profile.weights_version, version)
+            self.assertAlmostEqual(profile.ics_score, expected.calculate_ics(profile.raw_data)['ics_score'])
+            scores.append(profile.ics_score)
+
+        stats = score_index.summary()
+        self.assertEqual(stats['total'], len(scores))
+        self.assertAlmostEqual(stats['score_sum'], sum(scores))
+        self.assertEqual(snapshot.get_snapshot().total_profiles, len(scores))
+        self.assertAlmostEqual(snapshot.get_snapshot().score_sum, sum(scores))
+        self.assertEqual(sketch.load_sketch().n, len(scores))
+
+    def test_components_are_stored_and_rescored_in_sql(self):
+        response = self.client.post(
+            reverse('core:calculate_ics'), SAMPLE_PROFILES[0], content_type='application/json'
+        )
+        profile = ICSProfile.objects.get(id=response.json()['profile_id'])
+        self.assertEqual(
+            {name: getattr(profile, f'component_{name}') for name in weight_sets.COMPONENTS},
+            response.json()['components']
+        )
+        recent = self.client.get(reverse('core:dashboard_stats')).json()['recent_calculations'][0]
+        self.assertEqual(recent['components'], response.json()['components'])
+
+        # Perfil antigo, sem componentes: recalculado em bloco no mesmo comando
+        legacy = self.profiles[0]
+        ICSProfile.objects.filter(id=legacy.id).update(component_fiscal=None)
+
+        with override_settings(ICS_CONFIG=ics_config(DEFAULT_WEIGHTS=self.new_weights)):
+            output = io.StringIO()
+            with mock.patch.object(sketch, 'rebuild', wraps=sketch.rebuild) as rebuild_sketch:
+                call_command('rescore_profiles', workers=0, single_statement=True, stdout=output)
+            version = weight_sets.current_version()
+        self.assertIn(f'{ICSProfile.objects.count() - 1} perfis recalculados com um UPDATE', output.getvalue())
+        # Uma única varredura da tabela para o sketch
+        rebuild_sketch.assert_called_once()
+
+        expected = ICSCalculationService(self.new_weights)
+        scores = []
+        for profile in ICSProfile.objects.all():
+            result = expected.calculate_ics(profile.raw_data)
+            self.assertEqual(profile.weights_version, version)
+            self.assertAlmostEqual(profile.ics_score, result['ics_score'])
+            self.assertEqual(profile.ics_explanation, result['explanation'])
+            self.assertIsNotNone(profile.component_fiscal)
+            scores.append(profile.ics_score)
+
+        self.assertAlmostEqual(score_index.summary()['score_sum'], sum(scores))
+        self.assertAlmostEqual(snapshot.get_snapshot().score_sum, sum(scores))
+
+
+class WeightSimulationTests(TestCase):
+
+    def setUp(self):
+        sensitivity.reset_matrices()
+        service = ICSCalculationService()
+        rows = SAMPLE_PROFILES * 3
+        self.profiles = service.save_many(rows, service.calculate_many(rows))
+
+    def simulate(self, payload):
+        return self.client.post(reverse('core:weight_simulation'), payload, content_type='application/json')
+
+    def test_candidates_are_scored_against_current_weights(self):
+        candidate = {'fiscal': 0.5, 'patrimony': 0.0}
+        ids = [profile.id for profile in self.profiles]
+        response = self.simulate({'candidates': [candidate, {}], 'profile_ids': ids + [0], 'top': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        stats = snapshot.get_snapshot()
+        self.assertEqual(data['profiles'], len(ids))
+        self.assertEqual(data['missing_profile_ids'], [0])
+        self.assertEqual(
+            list(data['baseline']['distribution']['bands'].values()),
+            [stats.low_count, stats.medium_count, stats.high_count]
+        )
+
+        weights = {**settings.ICS_CONFIG['DEFAULT_WEIGHTS'], **candidate}
+        simulated, unchanged = data['candidates']
+        self.assertEqual(simulated['weights'], weights)
+        expected = ICSCalculationService(weights)
+        for entry in simulated['profiles']:
+            profile = ICSProfile.objects.get(id=entry['profile_id'])
+            self.assertAlmostEqual(entry['baseline_score'], profile.ics_score, places=4)
+            self.assertAlmostEqual(entry['score'], expected.calculate_ics(profile.raw_data)['ics_score'], places=4)
+            self.assertEqual(entry['rank_shift'], entry['baseline_rank'] - entry['rank'])
+        self.assertLessEqual(len(simulated['top_movers']), 3)
+
+        # Os pesos atuais não mudam nenhuma posição
+        self.assertEqual(unchanged['rank_shift']['changed'], 0)
+        self.assertEqual(unchanged['top_movers'], [])
+        self.assertEqual(unchanged['distribution'], data['baseline']['distribution'])
+
+    def test_ranks_share_position_on_ties(self):
+        ranks, ordered = sensitivity.ranks(np.array([0.2, 0.9, 0.2, 0.5]))
+        self.assertEqual(ranks.tolist(), [3, 1, 3, 2])
+        self.assertEqual(ordered.tolist(), [0.9, 0.5, 0.2, 0.2])
+
+    def test_invalid_candidates_are_rejected(self):
+        self.assertEqual(self.simulate({'candidates': [{'salary': 0.3}]}).status_code, 400)
+        self.assertEqual(self.simulate({'candidates': []}).status_code, 400)
+        with override_settings(ICS_CONFIG=ics_config(WHAT_IF={**settings.ICS_CONFIG['WHAT_IF'], 'MAX_CANDIDATES': 1})):
+            self.assertEqual(self.simulate({'candidates': [{}, {}]}).status_code, 400)
+
+    def test_matrix_is_reloaded_after_writes(self):
+        self.assertEqual(self.simulate({'candidates': [{}]}).json()['profiles'], len(self.profiles))
+        service = ICSCalculationService()
+        service.save_many(SAMPLE_PROFILES, service.calculate_many(SAMPLE_PROFILES))
+
+        with override_settings(ICS_CONFIG=ics_config(WHAT_IF={**settings.ICS_CONFIG['WHAT_IF'], 'MAX_STALENESS': 0})):
+            with self.assertNumQueries(2):
+                data = self.simulate({'candidates': [{}]}).json()
+            self.assertEqual(data['profiles'], len(self.profiles) + len(SAMPLE_PROFILES))
+            # Sem escritas, só a versão do snapshot é conferida
+            with self.assertNumQueries(1):
+                self.simulate({'candidates': [{}]})
+
+
+class BenchmarkResultsTests(TestCase):
+
+    def test_summary_is_per_operation_and_comparable(self):
+        result = summarize([0.02, 0.01, 0.03, 0.01], ops=10)
+        self.assertEqual(
+            (result['samples'], result['min_ms'], result['median_ms'], result['max_ms'], result['ops_per_s']),
+            (4, 1.0, 1.5, 3.0, 666.7)
+        )
+        json.dumps(result)
+
+        previous = {'benchmarks': {'a': {'median_ms': 1.0}, 'b': {'median_ms': 2.0}, 'gone': {'median_ms': 1.0}}}
+        current = {'benchmarks': {'a': {'median_ms': 1.1}, 'b': {'median_ms': 3.0}, 'new': {'median_ms': 1.0}}}
+        rows = compare_results(previous, current, tolerance=0.2)
+        self.assertEqual([(name, regression) for name, *_, regression in rows], [('a', False), ('b', True)])
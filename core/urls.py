@@ -11,7 +11,10 @@ urlpatterns = [
     # API endpoints
     path('api/health/', views.health_check, name='health_check'),
     path('api/calculate/', views.ICSCalculationAPIView.as_view(), name='calculate_ics'),
+    path('api/calculate/batch/', views.ICSBatchCalculationAPIView.as_view(), name='calculate_ics_batch'),
     path('api/dashboard/stats/', views.dashboard_stats_api, name='dashboard_stats'),
+    path('api/weights/simulate/', views.weight_simulation_api, name='weight_simulation'),
     path('api/profiles/', views.profile_list_api, name='profile_list'),
+    path('api/profiles/export/', views.profile_export_api, name='profile_export'),
     path('api/profiles/<int:profile_id>/', views.profile_detail_api, name='profile_detail'),
 ] 
\ No newline at end of file
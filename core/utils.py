@@ -0,0 +1,14 @@
+import re
+import unicodedata
+
+
+def normalize_text(value):
+    """
+    Normaliza texto livre para comparação: sem acentos, minúsculo e com
+    espaços simples (ex.: '  São  Paulo ' -> 'sao paulo')
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    without_accents = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r'\s+', ' ', without_accents.casefold()).strip()
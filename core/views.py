@@ -1,19 +1,26 @@
 from django.shortcuts import render
-from django.db.models import Avg, Count
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_GET
 from django.views.generic import TemplateView
 
 from .models import ICSProfile, CalculationLog, DataSource
 from .serializers import (
     ICSFormDataSerializer, ICSResultSerializer, 
-    ICSProfileSerializer, DashboardStatsSerializer
+    ICSProfileSerializer, DashboardStatsSerializer, WeightSimulationSerializer
 )
-from .services import ICSCalculationService, ExternalAPIService
+from .services import ICSCalculationService, ExternalAPIService, component_fields, run_concurrently
+from .encoders import RowEncoder
+from .pagination import KeysetPagination
+from .routers import replica_reads
+from . import conditional, export, logwriter, rollups, score_index, sensitivity, sketch, snapshot, weight_sets
 from django.conf import settings
 
 
@@ -29,6 +36,7 @@ class HomeView(TemplateView):
         return context
 
 
+@method_decorator(replica_reads, name='dispatch')
 class DashboardView(TemplateView):
     """
     Dashboard com estatísticas do ICS
@@ -38,20 +46,21 @@ class DashboardView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Estatísticas básicas
-        profiles = ICSProfile.objects.filter(ics_score__isnull=False)
-        context['total_profiles'] = profiles.count()
-        context['avg_score'] = profiles.aggregate(avg=Avg('ics_score'))['avg'] or 0
+        # Estatísticas básicas (snapshot mantido incrementalmente)
+        stats = snapshot.get_snapshot()
+        context['total_profiles'] = stats.total_profiles
+        context['avg_score'] = stats.avg_score
         
         # Distribuição de scores
         score_ranges = {
-            'baixo': profiles.filter(ics_score__lt=0.4).count(),
-            'medio': profiles.filter(ics_score__gte=0.4, ics_score__lt=0.7).count(),
-            'alto': profiles.filter(ics_score__gte=0.7).count(),
+            'baixo': stats.low_count,
+            'medio': stats.medium_count,
+            'alto': stats.high_count,
         }
         context['score_distribution'] = score_ranges
         
         # Últimos cálculos
+        profiles = ICSProfile.objects.filter(ics_score__isnull=False)
         context['recent_profiles'] = profiles.order_by('-created_at')[:10]
         
         return context
@@ -65,7 +74,9 @@ def health_check(request):
     return Response({
         'status': 'ok',
         'timestamp': timezone.now(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'cache': ExternalAPIService.cache_stats(),
+        'calculation_log': logwriter.calculation_log_writer.stats()
     })
 
 
@@ -96,16 +107,23 @@ class ICSCalculationAPIView(APIView):
             calc_service = ICSCalculationService()
             result = calc_service.calculate_ics(enriched_data)
             
-            # Salvar perfil
-            profile = self._save_profile(enriched_data, result)
+            # Perfil, estatísticas e log em uma única transação. Com o cache
+            # quente e o write-behind ativo são 2 comandos: INSERT do perfil e
+            # UPDATE ... RETURNING do índice de scores, que já devolve média e
+            # percentil e avança a versão do snapshot; log e sketch vão em
+            # lote. Sem write-behind (padrão) entram ainda SELECT e UPDATE do
+            # sketch e INSERT do log.
+            with transaction.atomic(savepoint=False):
+                profile = self._save_profile(enriched_data, result)
+                stats = rollups.record_score(
+                    result['ics_score'], include_sketch=not logwriter.write_behind()
+                )
+                self._log_calculation(profile, enriched_data, result)
             
             # Adicionar dados estatísticos
             result['profile_id'] = profile.id
-            result['avg_score'] = self._get_average_score()
-            result['percentile'] = self._calculate_percentile(result['ics_score'])
-            
-            # Log do cálculo
-            self._log_calculation(profile, enriched_data, result)
+            result['avg_score'] = self._get_average_score(stats)
+            result['percentile'] = self._calculate_percentile(result['ics_score'], stats)
             
             return Response(result, status=status.HTTP_200_OK)
             
@@ -116,39 +134,54 @@ class ICSCalculationAPIView(APIView):
     
     def _enrich_data_from_apis(self, data):
         """
-        Enriquece dados usando APIs externas baseado nos checkboxes
+        Enriquece dados usando APIs externas baseado nos checkboxes.
+        As consultas independentes rodam em paralelo, com prazo total
+        ICS_CONFIG['ENRICHMENT_TIMEOUT']; consultas que estouram o prazo são ignoradas.
         """
         enriched_data = data.copy()
         api_service = ExternalAPIService()
+        lookups = {}
         
         # Buscar dados de nascimento se solicitado
         if data.get('fetch_birth_data') and data.get('birth_place'):
-            birth_data = api_service.get_municipality_data(
-                data['birth_place'], 
+            lookups['birth'] = (
+                api_service.get_municipality_data,
+                data['birth_place'],
                 data.get('birth_state')
             )
-            if birth_data:
-                enriched_data['birth_pib_per_capita'] = birth_data.get('pib_per_capita', 0)
         
         # Buscar dados salariais do pai se solicitado
         if data.get('fetch_father_job') and data.get('father_job'):
-            job_data = api_service.get_job_salary_data(data['father_job'])
-            if job_data and not data.get('father_salary'):
-                enriched_data['father_salary'] = job_data.get('average_salary', 0)
+            lookups['father_job'] = (api_service.get_job_salary_data, data['father_job'])
         
         # Buscar dados salariais da mãe se solicitado
         if data.get('fetch_mother_job') and data.get('mother_job'):
-            job_data = api_service.get_job_salary_data(data['mother_job'])
-            if job_data and not data.get('mother_salary'):
-                enriched_data['mother_salary'] = job_data.get('average_salary', 0)
+            lookups['mother_job'] = (api_service.get_job_salary_data, data['mother_job'])
+        
+        results = run_concurrently(lookups, timeout=settings.ICS_CONFIG['ENRICHMENT_TIMEOUT'])
+        
+        # Mesclagem em ordem fixa, independente da ordem de conclusão
+        birth_data = results.get('birth')
+        if birth_data:
+            enriched_data['birth_pib_per_capita'] = birth_data.get('pib_per_capita', 0)
+        
+        job_data = results.get('father_job')
+        if job_data and not data.get('father_salary'):
+            enriched_data['father_salary'] = job_data.get('average_salary', 0)
+        
+        job_data = results.get('mother_job')
+        if job_data and not data.get('mother_salary'):
+            enriched_data['mother_salary'] = job_data.get('average_salary', 0)
         
         return enriched_data
     
     def _save_profile(self, data, result):
         """
-        Salva perfil no banco de dados
+        Salva perfil no banco de dados com um único INSERT. Como em
+        save_many, bulk_create não dispara o sinal post_save: as estatísticas
+        são registradas por quem chama, na mesma transação.
         """
-        profile = ICSProfile.objects.create(
+        profile, = ICSProfile.objects.bulk_create([ICSProfile(
             birth_place=data.get('birth_place'),
             birth_pib_per_capita=data.get('birth_pib_per_capita'),
             father_job=data.get('father_job'),
@@ -163,95 +196,173 @@ class ICSCalculationAPIView(APIView):
             ics_score=result.get('ics_score'),
             ics_explanation=result.get('explanation'),
             ics_confidence=result.get('confidence'),
-            raw_data=data
-        )
+            weights_version=weight_sets.current_version(),
+            raw_data=data,
+            **component_fields(result.get('components'))
+        )])
         return profile
     
-    def _get_average_score(self):
+    def _get_average_score(self, stats=None):
         """
-        Calcula score médio dos perfis existentes
+        Score médio dos perfis existentes (do summary do índice de scores,
+        lido de novo se não for informado)
         """
-        avg = ICSProfile.objects.filter(
-            ics_score__isnull=False
-        ).aggregate(avg=Avg('ics_score'))['avg']
-        return avg or 0
+        return score_index.average_score(stats)
     
-    def _calculate_percentile(self, score):
+    def _calculate_percentile(self, score, stats=None):
         """
-        Calcula percentil do score
+        Percentil do score (índice de scores, resolução de 0.001)
         """
-        lower_scores = ICSProfile.objects.filter(
-            ics_score__lt=score,
-            ics_score__isnull=False
-        ).count()
-        
-        total_scores = ICSProfile.objects.filter(
-            ics_score__isnull=False
-        ).count()
-        
-        if total_scores == 0:
-            return 50  # Percentil neutro se não há dados
-        
-        return (lower_scores / total_scores) * 100
+        return score_index.percentile(score, stats)
     
     def _log_calculation(self, profile, input_data, result):
         """
-        Registra log do cálculo
+        Registra log do cálculo (em segundo plano com
+        ICS_CONFIG['CALCULATION_LOG']['WRITE_BEHIND'])
         """
-        CalculationLog.objects.create(
+        logwriter.record(CalculationLog(
             profile=profile,
             calculation_data=input_data,
             weights_used=settings.ICS_CONFIG['DEFAULT_WEIGHTS'],
             result=result.get('ics_score', 0)
-        )
+        ))
+
+
+class ICSBatchCalculationAPIView(ICSCalculationAPIView):
+    """
+    API para cálculo do ICS em lote (coortes inteiras)
+    """
+    
+    def post(self, request):
+        """
+        Calcula o ICS de uma lista de perfis de forma vetorizada
+        """
+        rows = request.data.get('profiles') if isinstance(request.data, dict) else request.data
+        
+        if not isinstance(rows, list) or not rows:
+            return Response({
+                'error': 'Envie uma lista de perfis (ou {"profiles": [...]})'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_profiles = settings.ICS_CONFIG['BATCH_MAX_PROFILES']
+        if len(rows) > max_profiles:
+            return Response({
+                'error': f'Máximo de {max_profiles} perfis por pedido'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = ICSFormDataSerializer(data=rows, many=True)
+        
+        if not serializer.is_valid():
+            return Response({
+                'error': 'Dados inválidos',
+                'details': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            enriched_rows = [
+                self._enrich_data_from_apis(data)
+                for data in serializer.validated_data
+            ]
+            
+            calc_service = ICSCalculationService()
+            results = calc_service.calculate_many(enriched_rows)
+            # Tudo ou nada: um erro em um bloco desfaz os anteriores, e o
+            # cliente pode reenviar o lote sem duplicar perfis
+            with transaction.atomic():
+                profiles = calc_service.save_many(enriched_rows, results)
+            
+            for profile, result in zip(profiles, results):
+                result['profile_id'] = profile.id
+            
+            return Response({
+                'count': len(results),
+                'results': results
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            return Response({
+                'error': f'Erro interno no cálculo em lote: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@replica_reads
+@cache_control(no_cache=True)
+@condition(etag_func=conditional.dashboard_etag, last_modified_func=conditional.dashboard_last_modified)
 @api_view(['GET'])
 def dashboard_stats_api(request):
     """
-    API para estatísticas do dashboard
+    API para estatísticas do dashboard (304 enquanto a versão do snapshot
+    não mudar)
     """
     try:
         profiles = ICSProfile.objects.filter(ics_score__isnull=False)
         
-        # Estatísticas básicas
-        total_profiles = profiles.count()
-        avg_score = profiles.aggregate(avg=Avg('ics_score'))['avg'] or 0
+        # Estatísticas básicas (snapshot mantido incrementalmente, já lido
+        # pelo validador do GET condicional)
+        stats = getattr(request, 'dashboard_snapshot', None) or snapshot.get_snapshot()
+        total_profiles = stats.total_profiles
+        avg_score = stats.avg_score
+        
+        # Mediana e percentis a partir do sketch de quantis (sem ler a coluna de scores)
+        score_sketch = sketch.load_sketch()
+        quantiles = dict(zip(
+            sketch.DASHBOARD_QUANTILES,
+            score_sketch.quantiles(sketch.DASHBOARD_QUANTILES.values())
+        ))
         
-        # Calcular mediana (aproximação simples)
-        scores_ordered = profiles.order_by('ics_score').values_list('ics_score', flat=True)
-        median_score = 0
-        if scores_ordered:
-            middle = len(scores_ordered) // 2
-            if len(scores_ordered) % 2 == 0:
-                median_score = (scores_ordered[middle-1] + scores_ordered[middle]) / 2
-            else:
-                median_score = scores_ordered[middle]
+        # Quantis adicionais sob demanda: ?quantiles=0.05,0.95
+        requested = request.query_params.get('quantiles')
+        if requested:
+            try:
+                fractions = [float(value) for value in requested.split(',') if value.strip()]
+            except ValueError:
+                return Response({
+                    'error': 'Parâmetro quantiles inválido (use frações entre 0 e 1)'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            quantiles.update(zip(
+                (f'q{fraction:g}' for fraction in fractions),
+                score_sketch.quantiles(fractions)
+            ))
+        
+        quantiles = {
+            name: round(value, 3) if value is not None else 0
+            for name, value in quantiles.items()
+        }
+        median_score = quantiles['p50']
         
         # Distribuição de scores
         score_distribution = {
-            'baixo (0-0.4)': profiles.filter(ics_score__lt=0.4).count(),
-            'médio (0.4-0.7)': profiles.filter(ics_score__gte=0.4, ics_score__lt=0.7).count(),
-            'alto (0.7-1.0)': profiles.filter(ics_score__gte=0.7).count(),
+            'baixo (0-0.4)': stats.low_count,
+            'médio (0.4-0.7)': stats.medium_count,
+            'alto (0.7-1.0)': stats.high_count,
         }
         
-        # Cálculos recentes
-        recent_profiles = profiles.order_by('-created_at')[:5]
+        # Cálculos recentes (componentes gravados junto com o score; perfis
+        # anteriores a eles ficam com {} até o rescore_profiles)
+        recent_profiles = profiles.order_by('-created_at').values_list(
+            'ics_score', 'ics_explanation', 'ics_confidence', 'id',
+            *(f'component_{name}' for name in weight_sets.COMPONENTS)
+        )[:5]
         recent_calculations = []
         
-        for profile in recent_profiles:
+        for score, explanation, confidence, profile_id, *components in recent_profiles:
             recent_calculations.append({
-                'ics_score': profile.ics_score,
-                'explanation': profile.ics_explanation,
-                'confidence': profile.ics_confidence,
-                'components': {},  # Seria necessário recalcular ou armazenar
-                'profile_id': profile.id
+                'ics_score': score,
+                'explanation': explanation,
+                'confidence': confidence,
+                'components': {
+                    name: value
+                    for name, value in zip(weight_sets.COMPONENTS, components)
+                    if value is not None
+                },
+                'profile_id': profile_id
             })
         
         data = {
             'total_profiles': total_profiles,
             'avg_ics_score': round(avg_score, 3),
-            'median_ics_score': round(median_score, 3),
+            'median_ics_score': median_score,
+            'quantiles': quantiles,
             'score_distribution': score_distribution,
             'recent_calculations': recent_calculations
         }
@@ -264,26 +375,113 @@ def dashboard_stats_api(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@replica_reads
+@api_view(['POST'])
+def weight_simulation_api(request):
+    """
+    Simula pesos candidatos sobre os componentes gravados de todos os perfis,
+    sem alterar nada: distribuição, faixas e mudanças de posição no ranking
+    em relação aos pesos atuais
+    """
+    serializer = WeightSimulationSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Dados inválidos',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        data = serializer.validated_data
+        return Response(sensitivity.simulate(
+            data['candidates'], profile_ids=data['profile_ids'], top=data['top']
+        ))
+        
+    except Exception as e:
+        return Response({
+            'error': f'Erro na simulação: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@replica_reads
 @api_view(['GET'])
 def profile_list_api(request):
     """
-    Lista de perfis ICS
+    Lista de perfis ICS paginada por cursor (?cursor=, ?page_size=), com
+    campos esparsos opcionais (?fields=id,ics_score,...)
     """
-    profiles = ICSProfile.objects.filter(ics_score__isnull=False).order_by('-created_at')
-    serializer = ICSProfileSerializer(profiles, many=True)
-    return Response(serializer.data)
+    fields = ICSProfileSerializer.Meta.fields
+    if request.GET.get('fields'):
+        requested = [name.strip() for name in request.GET['fields'].split(',') if name.strip()]
+        unknown = set(requested) - set(fields)
+        if unknown:
+            return Response({
+                'error': f'Campos inválidos: {", ".join(sorted(unknown))}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        fields = [name for name in fields if name in requested]
+    
+    # Colunas não pedidas (ex.: raw_data) nem saem do banco; created_at e id
+    # são sempre lidos porque compõem o cursor
+    encoder = RowEncoder(ICSProfile, fields, extra=('created_at', 'id'))
+    created_at, pk = encoder.index('created_at'), encoder.index('id')
+    
+    try:
+        paginator = KeysetPagination(request)
+        rows = paginator.paginate(
+            ICSProfile.objects.filter(ics_score__isnull=False).values_list(*encoder.columns),
+            position=lambda row: (row[created_at], row[pk])
+        )
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(paginator.get_response_data(encoder.encode_many(rows)))
 
 
+@replica_reads
+@require_GET
+def profile_export_api(request):
+    """
+    Exportação de perfis em streaming (?format=ndjson|csv), com filtros
+    created_from, created_to, band, min_score e max_score
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.CONTENT_TYPES:
+        return JsonResponse({
+            'error': 'Formato inválido (use ndjson ou csv)'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        profiles = export.filter_profiles(request.GET)
+    except ValueError as e:
+        return JsonResponse({
+            'error': f'Filtro inválido: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # As linhas são lidas depois que a view retorna: fixa agora o banco
+    # escolhido pelo roteador
+    profiles = profiles.using(profiles.db)
+    
+    response = StreamingHttpResponse(
+        export.iter_export(profiles, export_format),
+        content_type=export.CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="perfis_ics.{export_format}"'
+    return response
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=conditional.profile_etag, last_modified_func=conditional.profile_last_modified)
 @api_view(['GET'])
 def profile_detail_api(request, profile_id):
     """
-    Detalhes de um perfil específico
+    Detalhes de um perfil específico (304 enquanto updated_at não mudar)
     """
-    try:
-        profile = ICSProfile.objects.get(id=profile_id)
-        serializer = ICSProfileSerializer(profile)
-        return Response(serializer.data)
-    except ICSProfile.DoesNotExist:
+    encoder = RowEncoder(ICSProfile, ICSProfileSerializer.Meta.fields)
+    row = ICSProfile.objects.filter(id=profile_id).values_list(*encoder.columns).first()
+    if row is None:
         return Response({
             'error': 'Perfil não encontrado'
         }, status=status.HTTP_404_NOT_FOUND)
+    return Response(encoder.encode(row))
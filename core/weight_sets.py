@@ -0,0 +1,106 @@
+"""
+Versões dos pesos do ICS
+
+Cada conjunto de pesos usado no cálculo é gravado uma vez em WeightSet, com
+um número de versão sequencial, e cada perfil guarda a versão que calculou
+o seu score (ICSProfile.weights_version). Mudar ICS_CONFIG['DEFAULT_WEIGHTS']
+cria uma versão nova no primeiro cálculo; os perfis antigos ficam com a
+versão anterior até o rescore_profiles.
+
+Como os componentes normalizados ficam em colunas (ICSProfile.component_*),
+novos pesos podem ser aplicados no próprio banco com um único UPDATE.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Func, Max, TextField, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import ICSProfile, WeightSet
+
+# Componentes do score, na ordem da soma ponderada de calculate_ics
+COMPONENTS = ['fiscal', 'job', 'patrimony', 'transfers', 'benefits']
+
+# checksum -> versão, só com versões já confirmadas no banco
+_versions = {}
+
+
+def checksum(weights):
+    """Identifica os pesos independentemente da ordem das chaves"""
+    canonical = json.dumps({name: float(value) for name, value in weights.items()}, sort_keys=True)
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def get_weight_set(weights=None):
+    """WeightSet dos pesos informados (padrão: DEFAULT_WEIGHTS), criado se for novo"""
+    weights = weights or settings.ICS_CONFIG['DEFAULT_WEIGHTS']
+    key = checksum(weights)
+
+    weight_set = WeightSet.objects.filter(checksum=key).first()
+    while weight_set is None:
+        try:
+            with transaction.atomic():
+                latest = WeightSet.objects.aggregate(latest=Max('version'))['latest'] or 0
+                weight_set = WeightSet.objects.create(
+                    version=latest + 1, checksum=key, weights=dict(weights)
+                )
+        except IntegrityError:
+            # Outro processo criou estes pesos ou o mesmo número de versão
+            weight_set = WeightSet.objects.filter(checksum=key).first()
+    return weight_set
+
+
+def current_version(weights=None):
+    """
+    Versão dos pesos informados (padrão: DEFAULT_WEIGHTS); só consulta o banco
+    na primeira vez em cada processo
+    """
+    weights = weights or settings.ICS_CONFIG['DEFAULT_WEIGHTS']
+    key = checksum(weights)
+    if key in _versions:
+        return _versions[key]
+
+    version = get_weight_set(weights).version
+    # Uma versão criada numa transação desfeita não pode ficar no cache
+    transaction.on_commit(lambda: _versions.setdefault(key, version))
+    return version
+
+
+def score_expression(weights):
+    """
+    ics_score em SQL a partir das colunas component_*, com a mesma ordem de
+    soma e os mesmos limites (0..1) de calculate_ics
+    """
+    total = None
+    for name in COMPONENTS:
+        term = Value(float(weights[name])) * F(f'component_{name}')
+        total = term if total is None else total + term
+    return Greatest(Value(0.0), Least(Value(1.0), total))
+
+
+def rescore_with_sql(weight_set):
+    """
+    Aplica os pesos em um único UPDATE a todos os perfis calculados com outra
+    versão e com os componentes gravados. A explicação vem da função SQL
+    ics_explanation, registrada só no SQLite (signals). Retorna o número de
+    perfis atualizados; as estatísticas ficam a cargo de quem chama.
+    """
+    score = score_expression(weight_set.weights)
+    explanation = Func(
+        *(F(f'component_{name}') for name in COMPONENTS), score,
+        function='ics_explanation', output_field=TextField()
+    )
+    return ICSProfile.objects.filter(
+        ics_score__isnull=False,
+        **{f'component_{name}__isnull': False for name in COMPONENTS}
+    ).exclude(
+        weights_version=weight_set.version
+    ).update(
+        ics_score=score,
+        ics_explanation=explanation,
+        weights_version=weight_set.version,
+        updated_at=timezone.now()
+    )
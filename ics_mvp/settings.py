@@ -50,6 +50,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.ReadYourWritesMiddleware",
 ]
 
 ROOT_URLCONF = "ics_mvp.urls"
@@ -79,9 +80,44 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Perfil para vários workers do gunicorn: conexões persistentes
+        # (verificadas antes de reutilizar) e os PRAGMAs abaixo aplicados a
+        # cada conexão nova
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Espera (segundos) pela trava de escrita antes de "database is locked"
+            "timeout": 20,
+            # Transações pegam a trava de escrita no BEGIN: sem isso, duas
+            # transações que leram antes de escrever não conseguem promover a
+            # trava e uma falha na hora, sem respeitar o timeout
+            "transaction_mode": "IMMEDIATE",
+            "init_command": ";".join([
+                # Leitores não bloqueiam o escritor e vice-versa
+                "PRAGMA journal_mode=WAL",
+                # Em WAL, fsync só no checkpoint; um commit pode se perder numa
+                # queda de energia, mas o banco nunca corrompe
+                "PRAGMA synchronous=NORMAL",
+                "PRAGMA cache_size=-20000",  # 20 MB de páginas por conexão
+                "PRAGMA mmap_size=268435456",  # leituras por mmap até 256 MB
+                "PRAGMA temp_store=MEMORY",
+            ]),
+        },
     }
 }
 
+# Réplica de leitura opcional para dashboard, lista e exportação de perfis
+# (core.routers). Para testar localmente com dois arquivos SQLite:
+# ICS_REPLICA_DB=replica.sqlite3 e python manage.py sync_replica --interval 5
+if os.environ.get("ICS_REPLICA_DB"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ["ICS_REPLICA_DB"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["core.routers.ReadReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,7 +167,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        # orjson quando instalado; mesma saída do JSONRenderer padrão
+        'core.renderers.FastJSONRenderer',
     ],
 }
 
@@ -139,7 +176,49 @@ REST_FRAMEWORK = {
 ICS_CONFIG = {
     'IBGE_API_BASE': 'https://servicodados.ibge.gov.br/api/v1',
     'RAIS_API_BASE': 'https://api.gov.br/rais',
-    'CACHE_TIMEOUT': 3600,  # 1 hora
+    'CACHE_TIMEOUT': 3600,  # 1 hora (soft TTL: depois disso a entrada é atualizada em segundo plano)
+    'CACHE_STALE_TIMEOUT': 86400,  # tempo extra em que a entrada obsoleta ainda é servida (hard TTL)
+    'NEGATIVE_CACHE_TIMEOUT': 300,  # resultados "não encontrado"
+    'LOCAL_CACHE_SIZE': 1024,  # entradas no cache em memória de cada worker
+    'LOCAL_CACHE_TIMEOUT': 300,  # 5 minutos (também recompila o matcher de ocupações)
+    'LOCK_TIMEOUT': 30,  # validade (segundos) da trava de busca entre workers
+    'LOCK_POLL_INTERVAL': 0.1,  # intervalo de verificação de quem aguarda a trava
+    'ENRICHMENT_WORKERS': 8,  # threads para consultas externas concorrentes
+    'ENRICHMENT_TIMEOUT': 10,  # prazo total (segundos) do enriquecimento de um pedido
+    'BATCH_CHUNK_SIZE': 1000,  # perfis por bulk insert no cálculo em lote
+    'BATCH_MAX_PROFILES': 10000,  # perfis por pedido em /api/calculate/batch/ (uma transação)
+    'EXPORT_CHUNK_SIZE': 2000,  # perfis lidos por vez na exportação em streaming
+    'PAGE_SIZE': 50,  # perfis por página em /api/profiles/
+    'MAX_PAGE_SIZE': 500,
+    'READ_REPLICA': {
+        'ALIAS': 'replica',  # alias em DATABASES (sem ele, tudo vai para o principal)
+        'STICKY_SECONDS': 10,  # leituras no principal depois de uma escrita do cliente
+    },
+    'CALCULATION_LOG': {
+        'WRITE_BEHIND': False,  # True: logs de cálculo gravados em lote por uma thread
+        'QUEUE_SIZE': 10000,  # registros na fila de cada worker
+        'BATCH_SIZE': 500,  # registros por bulk_create
+        'FLUSH_INTERVAL': 1.0,  # segundos máximos que um registro espera na fila
+        'PUT_TIMEOUT': 0.5,  # espera com a fila cheia antes de gravar no próprio pedido
+        'SHUTDOWN_TIMEOUT': 10,  # prazo para esvaziar a fila ao encerrar o worker
+    },
+    'WHAT_IF': {
+        'MAX_CANDIDATES': 8,  # conjuntos de pesos por simulação
+        'MAX_PROFILE_IDS': 1000,  # perfis acompanhados individualmente por simulação
+        'MAX_STALENESS': 30,  # segundos em que a matriz de componentes é reaproveitada sem consultar o snapshot
+    },
+    'HTTP': {
+        'POOL_CONNECTIONS': 4,  # hosts distintos com pool próprio
+        'POOL_MAXSIZE': 16,  # conexões keep-alive por host
+        'MAX_RETRIES': 3,
+        'BACKOFF_FACTOR': 0.5,  # 0.5s, 1s, 2s...
+        'BACKOFF_JITTER': 0.25,  # segundos aleatórios somados a cada espera
+        'DEFAULT_TIMEOUT': (3.05, 10),  # (conexão, leitura) em segundos
+        'TIMEOUTS': {
+            'servicodados.ibge.gov.br': (3.05, 10),
+            'api.gov.br': (3.05, 5),
+        },
+    },
     'DEFAULT_WEIGHTS': {
         'fiscal': 0.30,
         'job': 0.25,
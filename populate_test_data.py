@@ -10,6 +10,7 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ics_mvp.settings')
 django.setup()
 
+from django.core.management import call_command
 from core.models import ICSProfile, DataSource
 from core.services import ICSCalculationService
 import random
@@ -171,6 +172,10 @@ def main():
     print(f"Total de perfis: {len(profiles)}")
     print()
     
+    # Manter estatísticas incrementais coerentes com os perfis gravados
+    call_command('rebuild_statistics')
+    print()
+    
     # Estatísticas
     print("📈 Estatísticas:")
     avg_score = sum(p.ics_score for p in profiles) / len(profiles)
@@ -185,7 +190,7 @@ def main():
     print("✅ Dados de teste criados com sucesso!")
     print("🌐 Acesse http://localhost:8000/ para testar o sistema")
     print("📊 Dashboard: http://localhost:8000/dashboard/")
-    print("⚙️  Admin: http://localhost:8000/admin/ (admin/123)")
+    print("⚙️  Admin: http://localhost:8000/admin/ (superusuário do createsuperuser)")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file